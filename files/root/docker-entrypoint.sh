@@ -47,7 +47,16 @@ if [[ $(id -u) = 0 ]]; then
   usermod -o -u "$PUID" factorio
   groupmod -o -g "$PGID" factorio
   # Take ownership of factorio data if running as root
-  chown -R factorio:factorio "$FACTORIO_VOL"
+  /scripts/fix_ownership.py "$(id -u factorio)" "$(id -g factorio)" "$FACTORIO_VOL"
+fi
+
+if [[ ${VERIFY_SAVES:-true} == "true" ]]; then
+  # Skip saves that were truncated (e.g. by a crash) when loading the latest one
+  if [[ $LOAD_LATEST_SAVE == true ]]; then
+    /scripts/savecheck.py --quarantine "$SAVES"
+  else
+    /scripts/savecheck.py "$SAVES"
+  fi
 fi
 
 sed -i '/write-data=/c\write-data=\/factorio/' /opt/factorio/config/config.ini
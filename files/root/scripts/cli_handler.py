@@ -1,34 +1,275 @@
 #!/usr/bin/env python3
 
 from sys import stderr, stdout, stdin, argv
-from os import setresgid, setresuid, getuid, getenv, execv
+from os import setresgid, setresuid, getuid, getenv, read, writev
 from pwd import getpwnam
 from subprocess import Popen, PIPE
-from threading import Thread
-from queue import Queue
-from time import sleep
-from re import search
+from selectors import DefaultSelector, EVENT_READ
+from threading import Thread, Condition, Lock
+from collections import deque
+from time import monotonic, perf_counter
 from signal import signal, SIGHUP, SIGTERM, SIGINT
 from traceback import print_exc
-from handlers.base import ConsoleLineHandler, ChatHandler, ChatPlayer
+from typing import Callable
+from handlers.base import ConsoleLineHandler, ChatHandler, ChatPlayer, LogEventHandler
+from handlers.events import LogEventBus, ChatEvent
+from handlers.players import PlayerRegistry
+from handlers.server_state import ServerState
+from handlers.ups import UPSMonitor
+from handlers.backup import BACKUP_DIR, SaveBackupHandler
+from metrics import MetricsRegistry, MetricsServer
+from outbox import ConsoleOutbox
+from logsink import LOG_SINK_DIR, LogSink
+from profiling import HandlerProfiler
+from rcon import rcon_from_args
+from savearchive import ARCHIVE_DIR, SaveArchive
+from savegames import SaveGameIndex
+from savecheck import SaveVerifier
 from handlers.chat_commands import ChatCommandHandler
 from handlers.commands.saves import LoadSaveCommand, ListSavesCommand
 from handlers.commands.restart import RestartCommand, StopCommand
+from handlers.commands.players import PlayersCommand, JoinsCommand
+from handlers.commands.ups import UPSCommand
+from handlers.commands.stats import StatsCommand
+from handlers.commands.archive import ArchiveSaveCommand, ListArchiveCommand, ArchiveStatsCommand
 
 
-class AsynchronousFileReader(Thread):
+READ_SIZE = 65536
+FLUSH_SIZE = 65536
+FLUSH_INTERVAL = 0.05
+IOV_MAX = 1024
+
+LOG_QUEUE_POLICIES = ("block", "drop-oldest", "drop-debug")
+LOG_QUEUE_POLICY = getenv("LOG_QUEUE_POLICY", "block")
+LOG_QUEUE_MAX_BYTES = int(getenv("LOG_QUEUE_MAX_BYTES", str(64 * 1024 * 1024)))
+LOG_QUEUE_MAX_LINES = int(getenv("LOG_QUEUE_MAX_LINES", "0"))
+DEBUG_LEVELS = (b"Verbose", b"Debug")
+
+RESTART_OUTBOX_FLUSH_TIMEOUT = 2
+RESTART_SECONDS_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+DISPATCH_SECONDS_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005,
+                            0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+
+class PipeReader:
     def __init__(self, fd):
-        assert callable(fd.readline)
-        Thread.__init__(self, daemon=True)
-        self._fd = fd
-        self.queue = Queue()
+        self._fd = fd.fileno()
+        self._partial = b""
+        self.eof = False
+
+    def fileno(self):
+        return self._fd
+
+    # Returns all complete lines read so far as a single block.
+    # Blocks always start at offset 0 of their underlying bytes object.
+    def read_block(self) -> memoryview:
+        data = read(self._fd, READ_SIZE)
+        if not data:
+            self.eof = True
+            data = self._partial
+            self._partial = b""
+            return memoryview(data)
+
+        if self._partial:
+            data = self._partial + data
+
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        return memoryview(data)[:end]
+
+
+def is_debug_line(line: bytes) -> bool:
+    fields = line.lstrip().split(b" ", 2)
+    return len(fields) > 1 and fields[1] in DEBUG_LEVELS
+
+
+class OutputBuffer:
+    def __init__(self, stream, name: str, metrics: MetricsRegistry,
+                 max_bytes: int = LOG_QUEUE_MAX_BYTES, max_lines: int = LOG_QUEUE_MAX_LINES,
+                 policy: str = LOG_QUEUE_POLICY):
+        if policy not in LOG_QUEUE_POLICIES:
+            raise ValueError(f"Unknown log queue policy: {policy}")
+
+        self._stream = stream
+        self._fd = stream.fileno()
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.policy = policy
+
+        # Batch being collected by the log pump, and supervisor messages
+        self._chunks_lock = Lock()
+        self._chunks = []
+        self._chunks_lines = 0
+        self.size = 0
+        self.deadline = None
+
+        # Batches handed to the writer thread, as [block, lines, debug_stripped]
+        self._queue = deque()
+        self.queued_bytes = 0
+        self.queued_lines = 0
+        self._writing = False
+        self._dropped = 0
+        self._cond = Condition()
+
+        self._lines_total = metrics.counter(
+            "factorio_log_lines_total", "Log lines read from the server", ("stream",)).labels(name)
+        self._bytes_total = metrics.counter(
+            "factorio_log_bytes_total", "Log bytes read from the server", ("stream",)).labels(name)
+        self._dropped_total = metrics.counter(
+            "factorio_log_dropped_lines_total", "Log lines dropped because the output queue was full", ("stream",)).labels(name)
+        metrics.gauge("factorio_output_buffer_bytes", "Log bytes waiting to be written", ("stream",)).labels(
+            name, callback=lambda: self.size + self.queued_bytes)
+        metrics.gauge("factorio_output_buffer_lines", "Log lines waiting to be written", ("stream",)).labels(
+            name, callback=lambda: self._chunks_lines + self.queued_lines)
+
+        self._writer = Thread(name=f"Output writer ({name})",
+                              target=self._run_writer, daemon=True)
+        self._writer.start()
+
+    def write(self, block: memoryview):
+        if not block:
+            return
 
-    def run(self):
-        for line in iter(self._fd.readline, ""):
-            self.queue.put(line)
+        lines = block.obj.count(b"\n", 0, len(block))
+        self._lines_total.inc(lines)
+        self._bytes_total.inc(len(block))
+
+        with self._chunks_lock:
+            if self.deadline is None:
+                self.deadline = monotonic() + FLUSH_INTERVAL
+
+            self._chunks.append([block, lines, False])
+            self._chunks_lines += lines
+            self.size += len(block)
+            if self.size >= FLUSH_SIZE:
+                self._flush()
+
+    # Messages of the supervisor itself, from any thread. They are queued
+    # behind the log lines read so far and never stripped as debug lines.
+    def write_message(self, text: str):
+        block = memoryview(text.encode("utf-8"))
+        with self._chunks_lock:
+            lines = text.count("\n")
+            self._chunks.append([block, lines, True])
+            self._chunks_lines += lines
+            self.size += len(block)
+            self._flush()
+
+    def flush(self):
+        with self._chunks_lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._chunks:
+            return
 
-    def eof(self):
-        return not self.is_alive() and self.queue.empty()
+        with self._cond:
+            if self.policy == "block":
+                self._wait_for_room()
+            self._queue.extend(self._chunks)
+            self.queued_bytes += self.size
+            self.queued_lines += self._chunks_lines
+            self._make_room()
+            self._cond.notify_all()
+
+        self._chunks = []
+        self._chunks_lines = 0
+        self.size = 0
+        self.deadline = None
+
+    def drain(self):
+        self.flush()
+        with self._cond:
+            while self._queue or self._writing:
+                self._cond.wait()
+
+    def _is_full(self, extra_bytes: int = 0, extra_lines: int = 0) -> bool:
+        return (self.max_bytes > 0 and self.queued_bytes + extra_bytes > self.max_bytes) or \
+            (self.max_lines > 0 and self.queued_lines + extra_lines > self.max_lines)
+
+    # Waits while earlier batches leave no room for the one being flushed. A
+    # batch larger than the limits by itself only waits for the writer to
+    # finish, as nothing else could ever make room for it.
+    def _wait_for_room(self):
+        while (self._queue or self._writing) and self._is_full(self.size, self._chunks_lines):
+            self._cond.wait()
+
+    def _drop(self, item: list, block: memoryview, lines: int):
+        self.queued_bytes -= len(item[0]) - len(block)
+        dropped = item[1] - lines
+        self.queued_lines -= dropped
+        self._dropped += dropped
+        self._dropped_total.inc(dropped)
+        item[0] = block
+        item[1] = lines
+
+    def _make_room(self):
+        if self.policy == "block":
+            return
+
+        if self.policy == "drop-debug":
+            for item in self._queue:
+                if not self._is_full():
+                    return
+                if item[2]:
+                    continue
+                kept = [line for line in bytes(item[0]).splitlines(keepends=True)
+                        if not is_debug_line(line)]
+                self._drop(item, memoryview(b"".join(kept)), len(kept))
+                item[2] = True
+
+        while self._is_full() and self._queue:
+            self._drop(self._queue.popleft(), memoryview(b""), 0)
+
+    def _run_writer(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+
+                chunks = [item[0] for item in self._queue if item[0]]
+                self._queue.clear()
+                self.queued_bytes = 0
+                self.queued_lines = 0
+                dropped = self._dropped
+                self._dropped = 0
+                self._writing = True
+                self._cond.notify_all()
+
+            if dropped > 0:
+                chunks.insert(0, memoryview(
+                    f"[cli_handler] Output queue full, dropped {dropped} log lines\n".encode("utf-8")))
+
+            # Anything written through the Python stream must go out first
+            self._stream.flush()
+
+            while chunks:
+                written = writev(self._fd, chunks[:IOV_MAX])
+                while chunks and written >= len(chunks[0]):
+                    written -= len(chunks[0])
+                    chunks.pop(0)
+                if written > 0:
+                    chunks[0] = chunks[0][written:]
+
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def iter_lines(block: memoryview, markers):
+    data = block.obj
+    end = len(block)
+    pos = 0
+    while pos < end:
+        line_end = data.find(b"\n", pos, end) + 1
+        if line_end == 0:
+            line_end = end
+
+        if markers is None or any(data.find(marker, pos, line_end) >= 0 for marker in markers):
+            yield str(block[pos:line_end], "utf-8", "replace")
+
+        pos = line_end
 
 
 def write_stderr(text):
@@ -57,20 +298,59 @@ class FactorioGame:
     console_line_handlers: list[ConsoleLineHandler]
     chat_handlers: list[ChatHandler]
 
-    def __init__(self, args, restart_handler=None, cmdin=None):
+    def __init__(self, args, cmdin=None):
         self.args = args
         self.cmdin = cmdin
         self.process = None
         self.console_line_handlers = []
         self.chat_handlers = []
-        self.restart_handler = restart_handler
+        self.event_handlers = []
+        self.rcon = rcon_from_args(args)
+        self._shutdown = False
+        self._restart_requested = False
+        self._restarting = False
+        self._restarted_at = None
+        self._restart_hook = None
+
+        self.metrics = MetricsRegistry()
+        self._dispatch_seconds = self.metrics.histogram(
+            "factorio_handler_dispatch_seconds", "Time spent dispatching a log line to handlers", DISPATCH_SECONDS_BUCKETS)
+        self._restarts_total = self.metrics.counter(
+            "factorio_server_restarts_total", "Server process restarts")
+        self._restart_seconds = self.metrics.histogram(
+            "factorio_restart_first_line_seconds", "Time from starting the restarted server to its first log line", RESTART_SECONDS_BUCKETS)
+        self.outputs = [OutputBuffer(stdout, "stdout", self.metrics),
+                        OutputBuffer(stderr, "stderr", self.metrics)]
+        self._console_lock = Lock()
+        self.outbox = ConsoleOutbox(self.send_console, self.metrics)
+        self.outbox.start()
+        self.log_sink = None
+
+        self.profiler = HandlerProfiler()
+        self.events = LogEventBus(self.profiler)
+        self.events.subscribe(ChatEvent, self.handle_chat_event)
+        self.players = PlayerRegistry(self)
+        self.register_event_handler(self.players)
+        self.server_state = ServerState(self)
+        self.register_event_handler(self.server_state)
+        self.metrics.gauge("factorio_players_online", "Players currently online",
+                           callback=lambda: len(self.players.online))
+
+    def register_event_handler(self, handler: LogEventHandler):
+        self.event_handlers.append(handler)
+        for event_type, callback in handler.event_handlers().items():
+            self.events.subscribe(event_type, callback)
 
     def send_console(self, line):
-        self.process.stdin.write(f"{line.strip()}\n")
-        self.process.stdin.flush()
+        process = self.process
+        if process is None:
+            return
+        with self._console_lock:
+            process.stdin.write(f"{line.strip()}\n".encode("utf-8"))
+            process.stdin.flush()
 
     def write_stderr(self, text):
-        write_stderr(text)
+        self.outputs[1].write_message(text)
 
     def stop(self):
         if self.process is not None:
@@ -80,90 +360,192 @@ class FactorioGame:
         if self.process is not None:
             self.process.wait()
 
-    def restart(self):
+    def shutdown(self):
+        self._shutdown = True
         self.stop()
-        self.wait()
-        self.restart_handler(self)
 
-    def run(self):
-        self.process = Popen(self.args, stdin=PIPE,
-                             stdout=PIPE, stderr=PIPE, encoding="utf-8")
+    # Stops the server and starts it again with the same handlers and state.
+    # before_start runs once the old server has exited.
+    def restart(self, before_start: Callable | None = None):
+        # Let replies like "Stopping server..." reach the old server first
+        self.outbox.flush(RESTART_OUTBOX_FLUSH_TIMEOUT)
 
-        stdout_reader = AsynchronousFileReader(self.process.stdout)
-        stdout_reader.start()
-        stderr_reader = AsynchronousFileReader(self.process.stderr)
-        stderr_reader.start()
+        process = self.process
+        self._restart_hook = before_start
+        self._restart_requested = True
+        self._restarts_total.inc()
 
-        cmdin_reader = None
-        if self.cmdin is not None:
-            cmdin_reader = AsynchronousFileReader(self.cmdin)
-            cmdin_reader.start()
-
-        while not stdout_reader.eof() or not stderr_reader.eof():
-            while not stdout_reader.queue.empty():
-                line = stdout_reader.queue.get()
-                self.handle_line(line, stdout)
+        if process is not None:
+            process.send_signal(SIGINT)
+            process.wait()
 
-            while not stderr_reader.queue.empty():
-                line = stderr_reader.queue.get()
-                self.handle_line(line, stderr)
+    def line_markers(self):
+        if self.console_line_handlers:
+            return None
+        return self.events.markers
 
-            while cmdin_reader is not None and not cmdin_reader.queue.empty():
-                self.send_console(cmdin_reader.queue.get())
+    def run(self):
+        while not self._shutdown:
+            self._restart_requested = False
+            self.run_once()
+
+            if not self._restart_requested or self._shutdown:
+                break
+
+            if self._restart_hook is not None:
+                try:
+                    self._restart_hook()
+                except Exception:
+                    print_exc()
+                self._restart_hook = None
+
+            self.write_stderr("Restarting server...\n")
+            self._restarting = True
+
+    def run_once(self):
+        for handler in self.event_handlers:
+            handler.reset()
+
+        self.process = Popen(self.args, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        # Only the pipes of this process are read below, so output the old
+        # server wrote while shutting down is never counted
+        if self._restarting:
+            self._restarting = False
+            self._restarted_at = monotonic()
+
+        outputs = self.outputs
+        selector = DefaultSelector()
+        selector.register(PipeReader(self.process.stdout),
+                          EVENT_READ, outputs[0])
+        selector.register(PipeReader(self.process.stderr),
+                          EVENT_READ, outputs[1])
+        open_outputs = 2
 
-            sleep(.1)
+        if self.cmdin is not None:
+            cmdin_reader = PipeReader(self.cmdin)
+            try:
+                selector.register(cmdin_reader, EVENT_READ, None)
+            except PermissionError:
+                # Regular files and /dev/null can not be polled, read them right away
+                while not cmdin_reader.eof:
+                    self.handle_cmdin_block(cmdin_reader.read_block())
+
+        while open_outputs > 0:
+            timeout = None
+            deadlines = [output.deadline for output in outputs
+                         if output.deadline is not None]
+            if deadlines:
+                timeout = max(min(deadlines) - monotonic(), 0)
+
+            for key, _ in selector.select(timeout):
+                reader = key.fileobj
+                output = key.data
+                block = reader.read_block()
+
+                if output is None:
+                    self.handle_cmdin_block(block)
+                else:
+                    if self._restarted_at is not None and block:
+                        self.handle_restarted()
+                    output.write(block)
+                    if self.log_sink is not None:
+                        self.log_sink.write(block, output.name)
+                    self.handle_block(block)
+
+                if reader.eof:
+                    selector.unregister(reader)
+                    if output is not None:
+                        open_outputs -= 1
+
+            now = monotonic()
+            for output in outputs:
+                if output.deadline is not None and output.deadline <= now:
+                    output.flush()
+
+        for output in outputs:
+            output.drain()
+
+        selector.close()
 
         self.process.stdout.close()
         self.process.stderr.close()
         self.process.stdin.close()
 
-        stdout_reader.join()
-        stderr_reader.join()
-
         self.process.wait()
         self.process = None
 
-    def handle_chat_line(self, line):
-        m = search("\\[CHAT\\] ([^:]+): (.*)$", line)
-        if not m:
+    def handle_restarted(self):
+        latency = monotonic() - self._restarted_at
+        self._restarted_at = None
+        self._restart_seconds.observe(latency)
+        self.write_stderr(
+            f"Server restarted, first log line after {latency:.2f}s\n")
+
+    def handle_cmdin_block(self, block: memoryview):
+        for line in str(block, "utf-8", "replace").splitlines():
+            self.send_console(line)
+
+    def handle_block(self, block: memoryview):
+        markers = self.line_markers()
+        if markers is not None and not any(marker in block.obj for marker in markers):
             return
 
-        player_name = m[1]
-        message = m[2].strip()
+        for line in iter_lines(block, markers):
+            start = perf_counter()
+            self.handle_line(line)
+            self._dispatch_seconds.observe(perf_counter() - start)
 
+    def handle_chat_event(self, event: ChatEvent):
         for handler in self.chat_handlers:
             handler.handle_chat(ChatPlayer.get_by_name(
-                self, player_name), message)
+                self, event.player), event.message)
 
-    def handle_line(self, line, stream):
-        stream.write(line)
-        stream.flush()
+    def handle_line(self, line):
+        self.events.handle_line(line)
 
+        profiler = self.profiler
         try:
-            if "[CHAT]" in line:
-                self.handle_chat_line(line)
-                return
-
             for handler in self.console_line_handlers:
-                handler.handle_line(line)
+                if profiler.enabled:
+                    profiler.call(type(handler).__qualname__, handler.handle_line, line)
+                else:
+                    handler.handle_line(line)
         except Exception:
             print_exc()
 
 
-def cli_restart_handler(game):
-    execv(argv[0], argv)
-
-
 def main():
     suexec()
-    game = FactorioGame(
-        args=argv[1:], restart_handler=cli_restart_handler, cmdin=stdin)
+    game = FactorioGame(args=argv[1:], cmdin=stdin)
+
+    ups_monitor = UPSMonitor(game)
+    game.register_event_handler(ups_monitor)
+
+    save_index = SaveGameIndex()
+    save_index.start()
+
+    save_archive = None
+    if ARCHIVE_DIR:
+        save_archive = SaveArchive()
+
+    # Finished saves are backed up and archived from the same snapshot
+    if BACKUP_DIR or save_archive is not None:
+        game.register_event_handler(SaveBackupHandler(game, save_index, BACKUP_DIR, save_archive))
 
     command_handler = ChatCommandHandler(game)
-    command_handler.register_command(LoadSaveCommand())
-    command_handler.register_command(ListSavesCommand())
+    command_handler.register_command(LoadSaveCommand(save_index, save_archive, SaveVerifier(save_index.save_dir)))
+    command_handler.register_command(ListSavesCommand(save_index))
     command_handler.register_command(RestartCommand())
     command_handler.register_command(StopCommand())
+    command_handler.register_command(PlayersCommand())
+    command_handler.register_command(JoinsCommand())
+    command_handler.register_command(UPSCommand(ups_monitor))
+    command_handler.register_command(StatsCommand(game.profiler))
+    if save_archive is not None:
+        command_handler.register_command(
+            ArchiveSaveCommand(save_archive, save_index))
+        command_handler.register_command(ListArchiveCommand(save_archive))
+        command_handler.register_command(ArchiveStatsCommand(save_archive))
     game.chat_handlers.append(command_handler)
 
     should_run = True
@@ -171,15 +553,27 @@ def main():
     def sighandler_exit(signum, frame):
         nonlocal should_run
         should_run = False
-        game.stop()
+        game.shutdown()
 
     signal(SIGINT, sighandler_exit)
     signal(SIGHUP, sighandler_exit)
     signal(SIGTERM, sighandler_exit)
 
+    if LOG_SINK_DIR:
+        game.log_sink = LogSink(LOG_SINK_DIR, game.metrics)
+        game.log_sink.start()
+
+    metrics_port = getenv("METRICS_PORT")
+    if metrics_port:
+        MetricsServer(game.metrics, int(metrics_port),
+                      getenv("METRICS_BIND", "127.0.0.1")).start()
+
     if should_run:
         game.run()
 
+    if game.log_sink is not None:
+        game.log_sink.close()
+
 
 if __name__ == "__main__":
     main()
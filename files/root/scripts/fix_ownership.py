@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from json import load as json_load, dump as json_dump
+from os import lchown, lstat, replace, scandir
+from os.path import join
+from subprocess import run
+from sys import argv, exit, stderr, stdout
+from time import monotonic
+
+STATE_NAME = ".ownership-state.json"
+WORKERS = 16
+
+
+class OwnershipResult:
+    __slots__ = ("entries", "changed", "dirs", "skipped_dirs", "errors")
+
+    def __init__(self):
+        self.entries = 0
+        self.changed = 0
+        self.dirs = 0
+        self.skipped_dirs = 0
+        self.errors = 0
+
+
+# Changes the owner of every inode under root that is not uid:gid, without
+# following symlinks. Directories whose mtime and ctime match the state of the
+# last run have not gained or lost entries, so only their subdirectories are
+# visited. An existing file that was chowned away in place is not picked up.
+# Without a state for the same uid:gid everything may have to change, which
+# chown -R does faster, so the walk then only lists directories to record them.
+class OwnershipFixer:
+    _dirs: dict[str, list]
+
+    def __init__(self, root: str, uid: int, gid: int, workers: int = WORKERS):
+        self.root = root
+        self.uid = uid
+        self.gid = gid
+        self.workers = workers
+        self.state_path = join(root, STATE_NAME)
+        self._previous = {}
+        self._dirs = {}
+        self.full = False
+
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_path, "r") as f:
+                state = json_load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("uid") != self.uid or state.get("gid") != self.gid:
+            return False
+        self._previous = state.get("dirs", {})
+        return True
+
+    def _chown_all(self, result: OwnershipResult):
+        proc = run(["chown", "-R", "-h", f"{self.uid}:{self.gid}", self.root])
+        if proc.returncode != 0:
+            result.errors += 1
+            stderr.write(f"chown -R exited with code {proc.returncode}\n")
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json_dump({"uid": self.uid, "gid": self.gid, "dirs": self._dirs}, f)
+            lchown(tmp_path, self.uid, self.gid)
+            replace(tmp_path, self.state_path)
+        except OSError as e:
+            stderr.write(f"Could not write ownership state: {e}\n")
+
+    def _fix(self, path: str, st, result: OwnershipResult):
+        result.entries += 1
+        if st.st_uid == self.uid and st.st_gid == self.gid:
+            return False
+        try:
+            lchown(path, self.uid, self.gid)
+            result.changed += 1
+        except OSError as e:
+            result.errors += 1
+            stderr.write(f"Could not change owner of {path}: {e}\n")
+        return True
+
+    def _visit(self, rel: str) -> tuple[str, list, OwnershipResult]:
+        result = OwnershipResult()
+        result.dirs = 1
+        path = join(self.root, rel) if rel else self.root
+
+        st = lstat(path)
+        if self._fix(path, st, result):
+            st = lstat(path)
+
+        previous = self._previous.get(rel)
+        if previous is not None and previous[0] == st.st_mtime_ns and previous[1] == st.st_ctime_ns:
+            result.skipped_dirs = 1
+            return rel, previous, result
+
+        subdirs = []
+        with scandir(path) as dirlist:
+            for dirent in dirlist:
+                if dirent.name == STATE_NAME and not rel:
+                    continue
+                try:
+                    if dirent.is_dir(follow_symlinks=False):
+                        subdirs.append(dirent.name)
+                        continue
+                    if self.full:
+                        result.entries += 1
+                        continue
+                    self._fix(dirent.path, dirent.stat(follow_symlinks=False), result)
+                except FileNotFoundError:
+                    pass
+
+        return rel, [st.st_mtime_ns, st.st_ctime_ns, subdirs], result
+
+    def run(self) -> OwnershipResult:
+        total = OwnershipResult()
+        if not self._load_state():
+            self.full = True
+            self._chown_all(total)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {executor.submit(self._visit, "")}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        rel, entry, result = future.result()
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        total.errors += 1
+                        stderr.write(f"Could not fix ownership: {e}\n")
+                        continue
+
+                    self._dirs[rel] = entry
+                    for slot in OwnershipResult.__slots__:
+                        setattr(total, slot, getattr(total, slot) + getattr(result, slot))
+                    for name in entry[2]:
+                        pending.add(executor.submit(self._visit, join(rel, name) if rel else name))
+
+        self._save_state()
+        return total
+
+
+def main():
+    if len(argv) != 4:
+        stderr.write(f"Usage: {argv[0]} <uid> <gid> <path>\n")
+        exit(1)
+
+    start = monotonic()
+    fixer = OwnershipFixer(argv[3], int(argv[1]), int(argv[2]))
+    result = fixer.run()
+    if fixer.full:
+        stdout.write(
+            f"Changed ownership of all {result.entries} entries in {result.dirs} directories "
+            f"({result.errors} errors) in {monotonic() - start:.1f}s\n")
+    else:
+        stdout.write(
+            f"Fixed ownership of {result.changed} of {result.entries} entries in {result.dirs} directories "
+            f"({result.skipped_dirs} unchanged, {result.errors} errors) in {monotonic() - start:.1f}s\n")
+
+
+if __name__ == "__main__":
+    main()
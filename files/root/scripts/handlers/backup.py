@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from lzma import open as lzma_open
+from multiprocessing import get_context
+from os import getenv, makedirs, nice, rename, scandir, stat, unlink
+from os.path import exists, join
+from shutil import copyfileobj
+from threading import Lock
+from time import monotonic
+from traceback import print_exc
+from typing import Callable
+from .base import LogEventHandler
+from .events import SaveStartedEvent, SaveFinishedEvent
+from .commands.saves import format_file_size
+from savearchive import SaveArchive
+from savegames import SaveGameIndex, savegame_info_from_stat
+from staging import stage_file
+
+BACKUP_DIR = getenv("BACKUP_DIR")
+BACKUP_KEEP_HOURLY = int(getenv("BACKUP_KEEP_HOURLY", "24"))
+BACKUP_KEEP_DAILY = int(getenv("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(getenv("BACKUP_KEEP_WEEKLY", "4"))
+BACKUP_XZ_PRESET = int(getenv("BACKUP_XZ_PRESET", "6"))
+
+BACKUP_SUFFIX = ".zip.xz"
+BACKUP_TIME_FORMAT = "%Y%m%d-%H%M%S"
+# Saves are never modified in place, so a hardlink is a stable snapshot
+SNAPSHOT_STRATEGIES = ["reflink", "hardlink", "copy_file_range", "copy"]
+
+
+def _lower_priority():
+    # Without an explicit I/O priority, the kernel derives it from the nice level
+    nice(19)
+
+
+def compress_backup(src: str, dst: str, preset: int) -> int:
+    tmp_dst = f"{dst}.tmp"
+    try:
+        with open(src, "rb") as fsrc, lzma_open(tmp_dst, "wb", preset=preset) as fdst:
+            copyfileobj(fsrc, fdst, 1024 * 1024)
+        rename(tmp_dst, dst)
+    finally:
+        unlink(src)
+        if exists(tmp_dst):
+            unlink(tmp_dst)
+    return stat(dst).st_size
+
+
+def retained_backups(backups: list[tuple[datetime, str]]) -> set[str]:
+    # Newest backup of each of the last N hours, days and weeks
+    tiers = [
+        (BACKUP_KEEP_HOURLY, lambda t: (t.year, t.month, t.day, t.hour)),
+        (BACKUP_KEEP_DAILY, lambda t: (t.year, t.month, t.day)),
+        (BACKUP_KEEP_WEEKLY, lambda t: t.isocalendar()[:2]),
+    ]
+    keep = set()
+    seen = [set() for _ in tiers]
+    for time, name in sorted(backups, reverse=True):
+        if not keep:
+            keep.add(name)
+        for (limit, bucket_of), buckets in zip(tiers, seen):
+            bucket = bucket_of(time)
+            if bucket in buckets or len(buckets) >= limit:
+                continue
+            buckets.add(bucket)
+            keep.add(name)
+    return keep
+
+
+# Snapshots every save the server finishes, then compresses the snapshot
+# into backup_dir and/or stores it in the save archive
+class SaveBackupHandler(LogEventHandler):
+    def __init__(self, game, index: SaveGameIndex, backup_dir: str | None = BACKUP_DIR,
+                 archive: SaveArchive | None = None):
+        super().__init__(game)
+        self.index = index
+        self.backup_dir = backup_dir
+        self.archive = archive
+        self._save_name = None
+        self._pending = set()
+        # Saves that finished again while their backup was running
+        self._dirty = set()
+        self._lock = Lock()
+
+        self._snapshots = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="Save backup")
+        self._compressors = ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("forkserver"), initializer=_lower_priority)
+
+        self._backups_total = game.metrics.counter(
+            "factorio_backups_total", "Save backups written")
+        self._backup_seconds = game.metrics.histogram(
+            "factorio_backup_duration_seconds", "Time to snapshot and compress a save backup",
+            (1, 5, 10, 30, 60, 120, 300, 600))
+
+        self._archived_total = game.metrics.counter(
+            "factorio_archived_saves_total", "Finished saves stored in the save archive")
+
+        if backup_dir:
+            makedirs(backup_dir, exist_ok=True)
+
+    def event_handlers(self) -> dict[type, Callable]:
+        return {
+            SaveStartedEvent: self.handle_save_started,
+            SaveFinishedEvent: self.handle_save_finished,
+        }
+
+    def reset(self):
+        self._save_name = None
+
+    def handle_save_started(self, event: SaveStartedEvent):
+        self._save_name = event.name
+
+    def handle_save_finished(self, event: SaveFinishedEvent):
+        name = self._save_name
+        self._save_name = None
+
+        with self._lock:
+            if name in self._pending:
+                self._dirty.add(name)
+                return
+            self._pending.add(name)
+
+        self._snapshots.submit(self._backup, name)
+
+    def _resolve(self, name: str | None) -> str | None:
+        if name is not None:
+            path = join(self.index.save_dir, f"{name.removesuffix('.zip')}.zip")
+            if exists(path):
+                return path
+
+        savegame = self.index.newest()
+        if savegame is None:
+            return None
+        return savegame.path
+
+    def _backup(self, name: str | None):
+        try:
+            start = monotonic()
+            path = self._resolve(name)
+            if path is None:
+                return
+
+            stem = path.rsplit("/", 1)[-1].removesuffix(".zip")
+            snapshot = join(self.index.save_dir, f".backup-{stem}.zip")
+            if exists(snapshot):
+                unlink(snapshot)
+            # A reflink or copy gets a new mtime, archive under the save's own
+            save_stat = stat(path)
+            stage_file(path, snapshot, strategies=SNAPSHOT_STRATEGIES)
+            size = stat(snapshot).st_size
+
+            try:
+                if self.archive is not None:
+                    self._archive_snapshot(stem, snapshot, save_stat)
+                if self.backup_dir:
+                    self._compress_snapshot(stem, snapshot, size, start)
+            finally:
+                if exists(snapshot):
+                    unlink(snapshot)
+        except Exception:
+            print_exc()
+        finally:
+            with self._lock:
+                again = name in self._dirty
+                self._dirty.discard(name)
+                if not again:
+                    self._pending.discard(name)
+            if again:
+                self._snapshots.submit(self._backup, name)
+
+    def _archive_snapshot(self, stem: str, snapshot: str, save_stat):
+        start = monotonic()
+        savegame = savegame_info_from_stat(self.index.save_dir, f"{stem}.zip", save_stat)
+        savegame.path = snapshot
+        archive_id, chunks, new_bytes = self.archive.store(savegame)
+        self._archived_total.inc()
+        self.game.write_stderr(
+            f"Archived {stem} as {archive_id} ({chunks} chunks, {format_file_size(new_bytes)} new) "
+            f"in {monotonic() - start:.1f}s\n")
+
+    def _compress_snapshot(self, stem: str, snapshot: str, size: int, start: float):
+        now = datetime.now(tz=timezone.utc)
+        target_dir = join(self.backup_dir, stem)
+        target = join(target_dir, f"{stem}-{now.strftime(BACKUP_TIME_FORMAT)}{BACKUP_SUFFIX}")
+        makedirs(target_dir, exist_ok=True)
+
+        compressed_size = self._compressors.submit(
+            compress_backup, snapshot, target, BACKUP_XZ_PRESET).result()
+
+        self._apply_retention(target_dir, stem)
+        duration = monotonic() - start
+        self._backups_total.inc()
+        self._backup_seconds.observe(duration)
+        self.game.write_stderr(
+            f"Backed up {stem} to {target} ({format_file_size(size)} => "
+            f"{format_file_size(compressed_size)}) in {duration:.1f}s\n")
+
+    def _apply_retention(self, target_dir: str, stem: str):
+        backups = []
+        prefix = f"{stem}-"
+        with scandir(target_dir) as dirlist:
+            for dirent in dirlist:
+                if not dirent.name.startswith(prefix) or not dirent.name.endswith(BACKUP_SUFFIX):
+                    continue
+                timestamp = dirent.name[len(prefix):-len(BACKUP_SUFFIX)]
+                try:
+                    time = datetime.strptime(timestamp, BACKUP_TIME_FORMAT)
+                except ValueError:
+                    continue
+                backups.append((time, dirent.name))
+
+        keep = retained_backups(backups)
+        for _, backup_name in backups:
+            if backup_name not in keep:
+                unlink(join(target_dir, backup_name))
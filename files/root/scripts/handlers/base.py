@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Callable
 
 
 class ConsoleLineHandler(ABC):
@@ -10,17 +11,35 @@ class ConsoleLineHandler(ABC):
         pass
 
 
+class LogEventHandler(ABC):
+    def __init__(self, game):
+        self.game = game
+
+    @abstractmethod
+    def event_handlers(self) -> dict[type, Callable]:
+        pass
+
+    # Called before every start of the server process
+    def reset(self):
+        pass
+
+
 class ChatPlayer():
     def __init__(self, game, name: str):
         self.name = name
         self.game = game
 
-    def send_message(self, message: str):
-        self.game.send_console(message)
+    # Private messages are whispered, unless the player is not in the game
+    # (e.g. <server>) which falls back to a broadcast
+    def send_message(self, message: str, private: bool = False):
+        if private and self.game.players.is_online(self.name):
+            self.game.outbox.send(message, self.name)
+        else:
+            self.game.outbox.send(message)
 
     @staticmethod
     def get_by_name(game, name: str):
-        return ChatPlayer(game, name)
+        return game.players.get_player(name)
 
 
 class ChatHandler(ABC):
@@ -1,34 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import monotonic
 from traceback import print_exc
 from .base import ChatHandler, ChatPlayer
 from .commands.base import ChatCommand
 
+COMMAND_WORKERS = 4
+MAX_QUEUED_COMMANDS = 32
+RATE_LIMIT_BURST = 3
+RATE_LIMIT_PER_SECOND = 0.5
+MAX_RATE_LIMIT_BUCKETS = 1024
+SLOW_QUEUE_NOTICE = 1.0
+QUEUE_SECONDS_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "burst", "rate")
+
+    def __init__(self, now: float, burst: float = RATE_LIMIT_BURST, rate: float = RATE_LIMIT_PER_SECOND):
+        self.tokens = burst
+        self.updated = now
+        self.burst = burst
+        self.rate = rate
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
 
 class ChatCommandHandler(ChatHandler):
-    commands: list[ChatCommand]
+    commands: dict[str, ChatCommand]
 
-    def __init__(self, game):
+    def __init__(self, game, workers: int = COMMAND_WORKERS):
         super().__init__(game)
         self.commands = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="Chat command")
+
+        self._lock = Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._pending: set[tuple] = set()
+        self._in_flight: dict[str, int] = {}
+        self._queued = 0
+
+        self._queue_seconds = game.metrics.histogram(
+            "factorio_command_queue_seconds", "Time chat commands waited for a worker", QUEUE_SECONDS_BUCKETS)
+        rejections = game.metrics.counter(
+            "factorio_command_rejections_total", "Chat commands rejected before running", ("reason",))
+        self._rejections = {reason: rejections.labels(reason) for reason in (
+            "rate_limit", "duplicate", "concurrency", "queue_full")}
+        game.metrics.gauge("factorio_command_queue_depth", "Chat commands waiting for or holding a worker",
+                           callback=lambda: self._queued)
 
     def register_command(self, command: ChatCommand):
         for name in command.names():
             self.commands[name.lower()] = command
 
+    def _allow(self, player: ChatPlayer, now: float) -> bool:
+        bucket = self._buckets.get(player.name)
+        if bucket is None:
+            if len(self._buckets) >= MAX_RATE_LIMIT_BUCKETS:
+                for name, other in list(self._buckets.items()):
+                    other.refill(now)
+                    if other.tokens >= RATE_LIMIT_BURST:
+                        del self._buckets[name]
+            bucket = TokenBucket(now)
+            self._buckets[player.name] = bucket
+        return bucket.take(now)
+
+    def _reject(self, player: ChatPlayer, reason: str, message: str):
+        self._rejections[reason].inc()
+        player.send_message(message)
+
     def handle_chat(self, player: ChatPlayer, message: str):
-        if message[0] != "!":
+        if not message or message[0] != "!":
             return
 
         args = message[1:].split(" ")
         cmd_name = args[0].lower()
+        args = args[1:]
+
+        with self._lock:
+            if not self._allow(player, monotonic()):
+                self._reject(player, "rate_limit",
+                             f"Too many commands, {player.name}. Slow down!")
+                return
+
         if cmd_name not in self.commands:
             player.send_message(f"Unknown command: {cmd_name}")
             return
 
         cmd = self.commands[cmd_name]
-        args = args[1:]
+        group = cmd.concurrency_group
+        key = (id(cmd), tuple(args))
+
+        with self._lock:
+            if key in self._pending:
+                self._reject(player, "duplicate",
+                             f"Command {cmd_name} is already queued")
+                return
+            if group is not None and self._in_flight.get(group, 0) >= cmd.max_concurrency:
+                self._reject(player, "concurrency",
+                             f"Command {cmd_name} can not run right now, another {group} command is in progress")
+                return
+            if self._queued >= MAX_QUEUED_COMMANDS:
+                self._reject(player, "queue_full",
+                             "Too many commands queued, try again later")
+                return
+
+            self._pending.add(key)
+            if group is not None:
+                self._in_flight[group] = self._in_flight.get(group, 0) + 1
+            self._queued += 1
+
+        self.executor.submit(self._run_command, player, cmd_name,
+                             cmd, args, group, key, monotonic())
+
+    def _run_command(self, player: ChatPlayer, cmd_name: str, cmd: ChatCommand, args: list[str],
+                     group: str | None, key: tuple, queued_at: float):
+        waited = monotonic() - queued_at
+        with self._lock:
+            self._pending.discard(key)
+            self._queue_seconds.observe(waited)
+
+        if waited >= SLOW_QUEUE_NOTICE:
+            player.send_message(
+                f"Running {cmd_name} (queued for {waited:.1f}s)")
 
+        profiler = self.game.profiler
         try:
-            cmd.run(player, args)
+            if profiler.enabled:
+                profiler.call(f"!{cmd.names()[0]}", cmd.run, player, args)
+            else:
+                cmd.run(player, args)
         except Exception as e:
             player.send_message(f"Error during command: {e}")
             print_exc()
+        finally:
+            with self._lock:
+                if group is not None:
+                    self._in_flight[group] -= 1
+                self._queued -= 1
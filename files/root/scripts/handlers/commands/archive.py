@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+from time import monotonic
+from .base import ChatCommand
+from .saves import format_file_size, format_relative_date, SAVES_PER_PAGE
+from handlers.base import ChatPlayer
+from savearchive import SaveArchive
+from savegames import SaveGameIndex
+
+
+class ArchiveSaveCommand(ChatCommand):
+    concurrency_group = "archive"
+
+    def __init__(self, archive: SaveArchive, index: SaveGameIndex):
+        self.archive = archive
+        self.index = index
+
+    def run(self, player: ChatPlayer, args: list[str]):
+        if args and args[0]:
+            savegame = self.index.get(" ".join(args))
+        else:
+            savegame = self.index.newest()
+        if savegame is None:
+            player.send_message("Unknown savegame")
+            return
+
+        start = monotonic()
+        archive_id, chunks, new_bytes = self.archive.store(savegame)
+        player.send_message(
+            f"Archived {savegame.name} as {archive_id} in {monotonic() - start:.1f}s "
+            f"({chunks} chunks, {format_file_size(new_bytes)} new of {format_file_size(savegame.size)})")
+
+    def names(self) -> list[str]:
+        return ["archive"]
+
+
+class ListArchiveCommand(ChatCommand):
+    def __init__(self, archive: SaveArchive):
+        self.archive = archive
+
+    def run(self, player: ChatPlayer, args: list[str]):
+        page = 1
+        name_filter = []
+        for arg in args:
+            if arg.isdigit():
+                page = max(int(arg), 1)
+            elif arg:
+                name_filter.append(arg)
+
+        archives = self.archive.list(" ".join(name_filter))
+        if not archives:
+            player.send_message("No archived savegames found", private=True)
+            return
+
+        pages = (len(archives) + SAVES_PER_PAGE - 1) // SAVES_PER_PAGE
+        page = min(page, pages)
+        first = (page - 1) * SAVES_PER_PAGE
+        page_archives = archives[first:first + SAVES_PER_PAGE]
+
+        player.send_message(
+            f"Archived savegames {first + 1}-{first + len(page_archives)} of {len(archives)} (page {page}/{pages})", private=True)
+
+        now_time = datetime.now(tz=timezone.utc)
+        for archive_id, mtime, size in page_archives:
+            mtime = datetime.fromtimestamp(mtime, tz=timezone.utc)
+            player.send_message(
+                f"{archive_id} @ {format_relative_date(mtime, now_time)} ({format_file_size(size)})", private=True)
+
+    def names(self) -> list[str]:
+        return ["archivelist"]
+
+
+class ArchiveStatsCommand(ChatCommand):
+    def __init__(self, archive: SaveArchive):
+        self.archive = archive
+
+    def run(self, player: ChatPlayer, args: list[str]):
+        count, logical, physical = self.archive.stats()
+        ratio = logical / physical if physical > 0 else 0
+        player.send_message(
+            f"{count} archived savegames, {format_file_size(logical)} stored in {format_file_size(physical)} (dedup ratio {ratio:.1f}x)")
+
+    def names(self) -> list[str]:
+        return ["archivestats"]
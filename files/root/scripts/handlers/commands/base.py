@@ -4,6 +4,10 @@ from handlers.base import ChatPlayer
 
 
 class ChatCommand(ABC):
+    # Commands in the same group share max_concurrency in-flight runs
+    concurrency_group: str | None = None
+    max_concurrency: int = 1
+
     @abstractmethod
     def run(self, player: ChatPlayer, args: list[str]):
         pass
@@ -0,0 +1,72 @@
+from .base import ChatCommand
+from handlers.base import ChatPlayer
+from handlers.players import PeerSession
+from rcon import RconError
+
+JOIN_HISTORY_LINES = 5
+ONLINE_SUFFIX = " (online)"
+
+
+def format_join_times(session: PeerSession) -> str:
+    res = (f"wait {session.map_wait:.1f}s, download {session.map_download:.1f}s, "
+           f"load {session.map_loading:.1f}s, catch up {session.catch_up:.1f}s")
+    if session.map_size is not None:
+        res += f", map {session.map_size // (1024 * 1024)}MiB"
+    return res
+
+
+# Asks the server itself, as join and leave lines may have been dropped from
+# a full output queue. Returns None without RCON.
+def query_online_players(game) -> list[str] | None:
+    if game.rcon is None:
+        return None
+    try:
+        reply = game.rcon.command("/players online")
+    except RconError:
+        return None
+
+    # "Online players (2):" followed by "  name (online)" lines
+    return [line.strip().removesuffix(ONLINE_SUFFIX) for line in reply.splitlines()[1:] if line.strip()]
+
+
+class PlayersCommand(ChatCommand):
+    def run(self, player: ChatPlayer, args: list[str]):
+        sessions = player.game.players.online
+        names = query_online_players(player.game)
+        if names is None:
+            names = list(sessions)
+        if not names:
+            player.send_message("No players online", private=True)
+            return
+
+        player.send_message(f"{len(names)} player(s) online:", private=True)
+        for name in names:
+            session = sessions.get(name)
+            if session is None:
+                player.send_message(f"{name} (join not seen)", private=True)
+                continue
+            player.send_message(
+                f"{name} joined in {session.join_time():.1f}s ({format_join_times(session)})", private=True)
+
+    def names(self) -> list[str]:
+        return ["players", "online"]
+
+
+class JoinsCommand(ChatCommand):
+    def run(self, player: ChatPlayer, args: list[str]):
+        registry = player.game.players
+        sessions = list(registry.online.values()) + list(registry.history)
+        sessions = [session for session in sessions if session.join_time() > 0]
+        sessions.sort(key=lambda session: session.join_time(), reverse=True)
+        if not sessions:
+            player.send_message("No joins recorded", private=True)
+            return
+
+        player.send_message("Slowest recent joins:", private=True)
+        for session in sessions[:JOIN_HISTORY_LINES]:
+            name = session.name or f"peer({session.peer_id})"
+            player.send_message(
+                f"{name}: {session.join_time():.1f}s ({format_join_times(session)})", private=True)
+
+    def names(self) -> list[str]:
+        return ["joins"]
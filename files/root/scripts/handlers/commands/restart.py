@@ -1,21 +1,22 @@
 from .base import ChatCommand
 from handlers.base import ChatPlayer
-from threading import Thread
 
 
 class RestartCommand(ChatCommand):
+    concurrency_group = "server"
+
     def run(self, player: ChatPlayer, args: list[str]):
-        thread = Thread(name="Server restart", target=player.game.restart)
-        thread.start()
+        player.game.restart()
 
     def names(self) -> list[str]:
         return ["restart"]
 
 
 class StopCommand(ChatCommand):
+    concurrency_group = "server"
+
     def run(self, player: ChatPlayer, args: list[str]):
-        thread = Thread(name="Server stop", target=player.game.stop)
-        thread.start()
+        player.game.stop()
 
     def names(self) -> list[str]:
         return ["stop", "quit"]
@@ -1,13 +1,19 @@
-from dataclasses import dataclass
 from .base import ChatCommand
 from handlers.base import ChatPlayer
-from os import getenv, lstat, scandir, stat_result, utime, rename
+from os import utime, rename
 from datetime import datetime, timezone
 from os.path import join
-from shutil import copyfile
-from threading import Thread
-
-SAVE_DIR = getenv("SAVES")
+from time import monotonic
+from staging import stage_file
+from savegames import SaveGameIndex
+from savecheck import SaveVerifier
+
+SAVES_PER_PAGE = 10
+PROGRESS_MIN_SIZE = 64 * 1024 * 1024
+PROGRESS_STEPS = 4
+# The staged copy is touched to become the latest save, a hardlink would
+# touch the original save with it
+LOAD_STRATEGIES = ["reflink", "copy_file_range", "copy"]
 
 # https://stackoverflow.com/a/1094933
 
@@ -46,86 +52,120 @@ def format_relative_date(time: datetime, compare: datetime):
     return "".join(res[::-1]) + suffix
 
 
-@dataclass
-class SaveGameInfo():
-    name: str
-    mtime: datetime
-    size: int
-    path: str
-    stat: stat_result
-
-
-def savegame_info_from_file(name: str) -> SaveGameInfo:
-    path_name = join(SAVE_DIR, name)
-    stat = lstat(path_name)
-    return SaveGameInfo(
-        name=name,
-        mtime=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
-        size=stat.st_size,
-        stat=stat,
-        path=path_name,
-    )
-
-
 class ListSavesCommand(ChatCommand):
-    def run(self, player: ChatPlayer, args: list[str]):
-        savegames: list[SaveGameInfo] = []
+    def __init__(self, index: SaveGameIndex):
+        self.index = index
 
-        dirlist = scandir(SAVE_DIR)
-        for dirent in dirlist:
-            if dirent.name[0] == ".":
-                continue
-
-            if not dirent.is_file():
-                continue
-
-            savegames.append(savegame_info_from_file(dirent.name))
-
-        savegames.sort(key=lambda sg: sg.mtime, reverse=True)
+    def run(self, player: ChatPlayer, args: list[str]):
+        page = 1
+        name_filter = []
+        for arg in args:
+            if arg.isdigit():
+                page = max(int(arg), 1)
+            elif arg:
+                name_filter.append(arg)
+
+        savegames = self.index.list(" ".join(name_filter))
+        if not savegames:
+            player.send_message("No savegames found", private=True)
+            return
+
+        pages = (len(savegames) + SAVES_PER_PAGE - 1) // SAVES_PER_PAGE
+        page = min(page, pages)
+        first = (page - 1) * SAVES_PER_PAGE
+        page_savegames = savegames[first:first + SAVES_PER_PAGE]
+
+        player.send_message(
+            f"Savegames {first + 1}-{first + len(page_savegames)} of {len(savegames)} (page {page}/{pages})", private=True)
 
         now_time = datetime.now(tz=timezone.utc)
 
-        for sg in savegames:
+        for sg in page_savegames:
             player.send_message(
-                f"{sg.name} @ {format_relative_date(sg.mtime, now_time)} ({format_file_size(sg.size)})")
+                f"{sg.name} @ {format_relative_date(sg.mtime, now_time)} ({format_file_size(sg.size)})", private=True)
 
     def names(self) -> list[str]:
         return ["savelist"]
 
 
-class LoadSaveThread(Thread):
-    def __init__(self, player: ChatPlayer, savegame: SaveGameInfo) -> None:
-        super().__init__()
-        self.name = "Savegame Loader Thread"
-        self.player = player
-        self.savegame = savegame
-
-    def run(self):
-        tmp_filename = join(
-            SAVE_DIR, f"saveload_{int(datetime.now().timestamp())}.tmp")
-        zip_filename = f"{tmp_filename}.zip"
+class LoadSaveCommand(ChatCommand):
+    concurrency_group = "server"
 
-        self.player.send_message(f"Copying save to {zip_filename}...")
-        copyfile(self.savegame.path, tmp_filename)
-        self.player.send_message(
-            "Save copied! Stopping server and reloading...")
+    def __init__(self, index: SaveGameIndex, archive=None, verifier: SaveVerifier | None = None):
+        self.index = index
+        self.archive = archive
+        self.verifier = verifier
 
-        self.player.game.stop()
-        self.player.game.wait()
+    def run(self, player: ChatPlayer, args: list[str]):
+        if not args or not args[0]:
+            player.send_message("Usage: !saveload <name>")
+            return
 
-        rename(tmp_filename, zip_filename)
-        utime(zip_filename)
+        sg_name = " ".join(args)
+        savegame = self.index.get(sg_name)
+        from_archive = savegame is None and self.archive is not None and self.archive.has(sg_name)
+        if savegame is None and not from_archive:
+            player.send_message(f"Unknown savegame: {sg_name}")
+            return
 
-        self.player.game.restart()
+        tmp_filename = join(
+            self.index.save_dir, f"saveload_{int(datetime.now().timestamp())}.tmp")
+        zip_filename = f"{tmp_filename}.zip"
 
+        if from_archive:
+            player.send_message(f"Restoring archived save {sg_name} to {zip_filename}...")
+            start = monotonic()
+            size = self.archive.restore(sg_name, tmp_filename)
+            duration = max(monotonic() - start, 0.001)
+            player.send_message(
+                f"Save restored ({format_file_size(size / duration)}/s)! Stopping server and reloading...")
+            self._activate(player, tmp_filename, zip_filename)
+            return
+
+        if self.verifier is not None:
+            error = self.verifier.verify_one(savegame.name)
+            if error is not None:
+                player.send_message(f"Savegame {savegame.name} is corrupt: {error}")
+                newest_valid = self._newest_valid()
+                if newest_valid is not None:
+                    player.send_message(f"Newest valid savegame: {newest_valid}")
+                return
+
+        player.send_message(f"Copying save to {zip_filename}...")
+
+        reported_step = 0
+
+        def report_progress(copied: int, total: int):
+            nonlocal reported_step
+            if total < PROGRESS_MIN_SIZE:
+                return
+            step = copied * PROGRESS_STEPS // total
+            if step > reported_step and step < PROGRESS_STEPS:
+                reported_step = step
+                player.send_message(
+                    f"Copying save: {format_file_size(copied)} of {format_file_size(total)}")
+
+        start = monotonic()
+        strategy = stage_file(savegame.path, tmp_filename, report_progress, LOAD_STRATEGIES)
+        player.send_message(
+            f"Save copied ({strategy}, {monotonic() - start:.1f}s)! Stopping server and reloading...")
+
+        self._activate(player, tmp_filename, zip_filename)
+
+    def _newest_valid(self) -> str | None:
+        for savegame in self.index.list():
+            if not savegame.name.endswith(".zip"):
+                continue
+            if self.verifier.verify_one(savegame.name) is None:
+                return savegame.name
+        return None
 
-class LoadSaveCommand(ChatCommand):
-    def run(self, player: ChatPlayer, args: list[str]):
-        sg_name = args[0]
-        savegame = savegame_info_from_file(sg_name)
+    def _activate(self, player: ChatPlayer, tmp_filename: str, zip_filename: str):
+        def activate_save():
+            rename(tmp_filename, zip_filename)
+            utime(zip_filename)
 
-        thread = LoadSaveThread(player, savegame)
-        thread.start()
+        player.game.restart(activate_save)
 
     def names(self) -> list[str]:
         return ["saveload"]
@@ -0,0 +1,72 @@
+from .base import ChatCommand
+from handlers.base import ChatPlayer
+from profiling import HandlerProfiler
+
+STATS_LINES = 5
+PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 60
+
+
+class StatsCommand(ChatCommand):
+    concurrency_group = "profile"
+
+    def __init__(self, profiler: HandlerProfiler):
+        self.profiler = profiler
+
+    def run(self, player: ChatPlayer, args: list[str]):
+        action = args[0].lower() if args and args[0] else ""
+        if action == "on":
+            self.profiler.enabled = True
+            player.send_message("Handler profiling enabled")
+        elif action == "off":
+            self.profiler.enabled = False
+            player.send_message("Handler profiling disabled")
+        elif action == "reset":
+            self.profiler.reset()
+            player.send_message("Handler stats reset")
+        elif action == "profile":
+            self._profile(player, args[1:])
+        elif action == "":
+            self._stats(player)
+        else:
+            player.send_message("Usage: !stats [on|off|reset|profile <seconds>]")
+
+    def _stats(self, player: ChatPlayer):
+        top = self.profiler.top(STATS_LINES)
+        if not top:
+            state = "on" if self.profiler.enabled else "off, enable with !stats on"
+            player.send_message(f"No handler stats recorded (profiling is {state})", private=True)
+            return
+
+        player.send_message("Slowest handlers by total time:", private=True)
+        for name, stats in top:
+            player.send_message(
+                f"{name}: {stats.calls} calls, {stats.total * 1000:.1f}ms total, "
+                f"{stats.total / stats.calls * 1000000:.0f}us avg, {stats.max * 1000:.1f}ms max, {stats.errors} errors",
+                private=True)
+
+    def _profile(self, player: ChatPlayer, args: list[str]):
+        seconds = PROFILE_SECONDS
+        if args and args[0].isdigit():
+            seconds = min(max(int(args[0]), 1), MAX_PROFILE_SECONDS)
+
+        player.send_message(f"Sampling all threads for {seconds}s...")
+        sampler = self.profiler.sample(seconds)
+        busy = sampler.samples - sampler.idle_samples
+        if busy <= 0:
+            player.send_message("All threads were idle", private=True)
+            return
+
+        player.send_message(
+            f"{busy} of {sampler.samples} samples busy over {sampler.duration:.1f}s. Hottest lines:", private=True)
+        for name, count in sampler.leaf.most_common(STATS_LINES):
+            player.send_message(f"{name}: {count * 100 / busy:.0f}%", private=True)
+
+        player.send_message("Hottest functions (including callees):", private=True)
+        functions = [(name, count) for name, count in sampler.inclusive.most_common()
+                     if not name.startswith("threading.py ")]
+        for name, count in functions[:STATS_LINES]:
+            player.send_message(f"{name}: {count * 100 / busy:.0f}%", private=True)
+
+    def names(self) -> list[str]:
+        return ["stats"]
@@ -0,0 +1,20 @@
+from .base import ChatCommand
+from handlers.base import ChatPlayer
+from handlers.ups import UPSMonitor
+
+
+class UPSCommand(ChatCommand):
+    def __init__(self, monitor: UPSMonitor):
+        self.monitor = monitor
+
+    def run(self, player: ChatPlayer, args: list[str]):
+        current = self.monitor.current()
+        if current is None:
+            player.send_message("No UPS readings yet")
+            return
+
+        player.send_message(
+            f"UPS: current {current:.1f}, min {self.monitor.minimum():.1f}, p50 {self.monitor.median():.1f} ({self.monitor.readings.count} readings)")
+
+    def names(self) -> list[str]:
+        return ["ups"]
@@ -0,0 +1,218 @@
+from re import compile as re_compile
+from traceback import print_exc
+from typing import Callable
+from profiling import HandlerProfiler, callable_name
+
+
+class LogEvent:
+    __slots__ = ("uptime",)
+
+    def __init__(self, uptime: float | None):
+        self.uptime = uptime
+
+
+class ChatEvent(LogEvent):
+    __slots__ = ("player", "message")
+
+    def __init__(self, uptime, player: str, message: str):
+        super().__init__(uptime)
+        self.player = player
+        self.message = message.strip()
+
+
+class PlayerJoinEvent(LogEvent):
+    __slots__ = ("player",)
+
+    def __init__(self, uptime, player: str):
+        super().__init__(uptime)
+        self.player = player
+
+
+class PlayerLeaveEvent(LogEvent):
+    __slots__ = ("player",)
+
+    def __init__(self, uptime, player: str):
+        super().__init__(uptime)
+        self.player = player
+
+
+class GameStateChangeEvent(LogEvent):
+    __slots__ = ("tick", "old_state", "new_state")
+
+    def __init__(self, uptime, tick: str, old_state: str, new_state: str):
+        super().__init__(uptime)
+        self.tick = int(tick)
+        self.old_state = old_state
+        self.new_state = new_state
+
+
+class PeerStateChangeEvent(LogEvent):
+    __slots__ = ("tick", "peer_id", "old_state", "new_state")
+
+    def __init__(self, uptime, tick: str, peer_id: str, old_state: str, new_state: str):
+        super().__init__(uptime)
+        self.tick = int(tick)
+        self.peer_id = int(peer_id)
+        self.old_state = old_state
+        self.new_state = new_state
+
+
+class MapServedEvent(LogEvent):
+    __slots__ = ("tick", "peer_id", "size")
+
+    def __init__(self, uptime, tick: str, peer_id: str, size: str):
+        super().__init__(uptime)
+        self.tick = int(tick)
+        self.peer_id = int(peer_id)
+        self.size = int(size)
+
+
+class PeerAddedEvent(LogEvent):
+    __slots__ = ("peer_id",)
+
+    def __init__(self, uptime, peer_id: str):
+        super().__init__(uptime)
+        self.peer_id = int(peer_id)
+
+
+class PeerRemovedEvent(LogEvent):
+    __slots__ = ("peer_id",)
+
+    def __init__(self, uptime, peer_id: str):
+        super().__init__(uptime)
+        self.peer_id = int(peer_id)
+
+
+class SaveStartedEvent(LogEvent):
+    __slots__ = ("name",)
+
+    def __init__(self, uptime, name: str):
+        super().__init__(uptime)
+        self.name = name
+
+
+class SaveFinishedEvent(LogEvent):
+    __slots__ = ()
+
+
+# Source tag (the "File.cpp" or "[TAG]" field of a log line) => rules
+# Each rule is (literal that must be in the message, pattern, event type)
+# so that every line is matched against at most one regular expression
+LOG_EVENT_RULES = {
+    "ServerMultiplayerManager.cpp": [
+        ("changing state",
+         r"updateTick\((\d+)\) changing state from\((\w+)\) to\((\w+)\)",
+         GameStateChangeEvent),
+        ("received stateChanged",
+         r"updateTick\((\d+)\) received stateChanged peerID\((\d+)\) oldState\((\w+)\) newState\((\w+)\)",
+         PeerStateChangeEvent),
+        ("Serving map",
+         r"[uU]pdateTick\((\d+)\) Serving map\(.*\) for peer\((\d+)\) size\((\d+)\)",
+         MapServedEvent),
+    ],
+    "ServerSynchronizer.cpp": [
+        ("adding peer", r"adding peer\((\d+)\)", PeerAddedEvent),
+        ("removing peer", r"removing peer\((\d+)\)", PeerRemovedEvent),
+    ],
+    "AppManagerStates.cpp": [
+        ("Saving to", r"Saving to (.+) \((?:non-)?blocking\)\.", SaveStartedEvent),
+        ("Saving finished", r"Saving finished", SaveFinishedEvent),
+    ],
+    "[CHAT]": [
+        (": ", r"([^:]+): (.*)", ChatEvent),
+    ],
+    "[JOIN]": [
+        (" joined the game", r"(.+) joined the game", PlayerJoinEvent),
+    ],
+    "[LEAVE]": [
+        (" left the game", r"(.+) left the game", PlayerLeaveEvent),
+    ],
+}
+
+
+class LogEventClassifier:
+    def __init__(self, event_types: set[type] | None = None):
+        self._rules = {}
+        for tag, rules in LOG_EVENT_RULES.items():
+            compiled = [(literal, re_compile(pattern), event_type)
+                        for literal, pattern, event_type in rules
+                        if event_types is None or event_type in event_types]
+            if compiled:
+                self._rules[tag] = compiled
+
+        self.markers = tuple(tag.encode("utf-8") for tag in self._rules)
+
+    def classify(self, line: str) -> LogEvent | None:
+        # " 118.214 Info ServerSynchronizer.cpp:604: message"
+        # "2024-01-01 00:00:00 [CHAT] message"
+        fields = line.lstrip().split(" ", 3)
+        if len(fields) < 4:
+            return None
+
+        source = fields[2]
+        is_source_file = source[-1:] == ":"
+        if is_source_file:
+            source = source[:source.find(":")]
+
+        rules = self._rules.get(source)
+        if rules is None:
+            return None
+
+        message = fields[3]
+        for literal, pattern, event_type in rules:
+            if literal not in message:
+                continue
+
+            m = pattern.search(message)
+            if not m:
+                return None
+
+            uptime = None
+            if is_source_file:
+                try:
+                    uptime = float(fields[0])
+                except ValueError:
+                    pass
+
+            return event_type(uptime, *m.groups())
+
+        return None
+
+
+class LogEventBus:
+    _subscribers: dict[type, list[Callable]]
+
+    def __init__(self, profiler: HandlerProfiler | None = None):
+        self._subscribers = {}
+        self._classifier = LogEventClassifier(set())
+        self.profiler = profiler
+
+    @property
+    def markers(self) -> tuple[bytes]:
+        return self._classifier.markers
+
+    def subscribe(self, event_type: type, callback: Callable):
+        self._subscribers.setdefault(event_type, []).append(callback)
+        self._classifier = LogEventClassifier(set(self._subscribers))
+
+    def publish(self, event: LogEvent):
+        callbacks = self._subscribers.get(type(event), ())
+        profiler = self.profiler
+        if profiler is not None and profiler.enabled:
+            for callback in callbacks:
+                try:
+                    profiler.call(callable_name(callback), callback, event)
+                except Exception:
+                    print_exc()
+            return
+
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                print_exc()
+
+    def handle_line(self, line: str):
+        event = self._classifier.classify(line)
+        if event is not None:
+            self.publish(event)
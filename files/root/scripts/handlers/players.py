@@ -0,0 +1,158 @@
+from collections import deque
+from typing import Callable
+from .base import LogEventHandler, ChatPlayer
+from .events import (PeerAddedEvent, PeerRemovedEvent, PeerStateChangeEvent,
+                     MapServedEvent, PlayerJoinEvent, PlayerLeaveEvent)
+
+HISTORY_SIZE = 256
+MAX_PEERS = 1024
+
+JOIN_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+# Peer state => PeerSession slot accumulating the time spent in it
+JOIN_PHASES = {
+    "ConnectedWaitingForMap": "map_wait",
+    "ConnectedDownloadingMap": "map_download",
+    "ConnectedLoadingMap": "map_loading",
+    "TryingToCatchUp": "catch_up",
+    "WaitingForCommandToStartSendingTickClosures": "catch_up",
+}
+
+
+class PeerSession:
+    __slots__ = ("peer_id", "name", "player", "state", "state_since", "added_at",
+                 "joined_at", "left_at", "map_size",
+                 "map_wait", "map_download", "map_loading", "catch_up")
+
+    def __init__(self, peer_id: int | None, added_at: float | None):
+        self.peer_id = peer_id
+        self.name = None
+        self.player = None
+        self.state = None
+        self.state_since = added_at
+        self.added_at = added_at
+        self.joined_at = None
+        self.left_at = None
+        self.map_size = None
+        self.map_wait = 0.0
+        self.map_download = 0.0
+        self.map_loading = 0.0
+        self.catch_up = 0.0
+
+    def join_time(self) -> float:
+        return self.map_wait + self.map_download + self.map_loading + self.catch_up
+
+    def change_state(self, state: str, uptime: float | None):
+        phase = JOIN_PHASES.get(self.state)
+        if phase is not None and uptime is not None and self.state_since is not None:
+            setattr(self, phase, getattr(self, phase) + uptime - self.state_since)
+        self.state = state
+        self.state_since = uptime
+
+
+class PlayerRegistry(LogEventHandler):
+    peers: dict[int, PeerSession]
+    online: dict[str, PeerSession]
+    history: deque[PeerSession]
+
+    def __init__(self, game, history_size: int = HISTORY_SIZE):
+        super().__init__(game)
+        self.peers = {}
+        self.online = {}
+        self.history = deque(maxlen=history_size)
+        self._awaiting_name = deque(maxlen=MAX_PEERS)
+
+        join_seconds = game.metrics.histogram(
+            "factorio_join_phase_seconds", "Time peers spent in each join phase", JOIN_SECONDS_BUCKETS, ("phase",))
+        self._join_seconds = {phase: join_seconds.labels(phase)
+                              for phase in dict.fromkeys(JOIN_PHASES.values())}
+
+    def event_handlers(self) -> dict[type, Callable]:
+        return {
+            PeerAddedEvent: self.handle_peer_added,
+            PeerRemovedEvent: self.handle_peer_removed,
+            PeerStateChangeEvent: self.handle_peer_state,
+            MapServedEvent: self.handle_map_served,
+            PlayerJoinEvent: self.handle_join,
+            PlayerLeaveEvent: self.handle_leave,
+        }
+
+    def reset(self):
+        self.peers.clear()
+        self.online.clear()
+        self._awaiting_name.clear()
+
+    def get_player(self, name: str) -> ChatPlayer:
+        session = self.online.get(name)
+        if session is not None:
+            return session.player
+        return ChatPlayer(self.game, name)
+
+    def is_online(self, name: str) -> bool:
+        return name in self.online
+
+    def _get_peer(self, peer_id: int, uptime: float | None) -> PeerSession:
+        session = self.peers.get(peer_id)
+        if session is None:
+            if len(self.peers) >= MAX_PEERS:
+                del self.peers[next(iter(self.peers))]
+            session = PeerSession(peer_id, uptime)
+            self.peers[peer_id] = session
+        return session
+
+    def _finish(self, session: PeerSession, uptime: float | None):
+        session.change_state(None, uptime)
+        session.left_at = uptime
+        if session.name is not None and self.online.get(session.name) is session:
+            del self.online[session.name]
+        if session.peer_id is not None and self.peers.get(session.peer_id) is session:
+            del self.peers[session.peer_id]
+        self.history.append(session)
+
+    def handle_peer_added(self, event: PeerAddedEvent):
+        old_session = self.peers.pop(event.peer_id, None)
+        if old_session is not None:
+            self._finish(old_session, event.uptime)
+        self._get_peer(event.peer_id, event.uptime)
+
+    def handle_peer_removed(self, event: PeerRemovedEvent):
+        session = self.peers.get(event.peer_id)
+        if session is not None:
+            self._finish(session, event.uptime)
+
+    def handle_peer_state(self, event: PeerStateChangeEvent):
+        session = self._get_peer(event.peer_id, event.uptime)
+        session.change_state(event.new_state, event.uptime)
+        if event.new_state == "InGame" and session.name is None:
+            session.joined_at = event.uptime
+            self._awaiting_name.append(session)
+            for phase, histogram in self._join_seconds.items():
+                histogram.observe(getattr(session, phase))
+
+    def handle_map_served(self, event: MapServedEvent):
+        self._get_peer(event.peer_id, event.uptime).map_size = event.size
+
+    def handle_join(self, event: PlayerJoinEvent):
+        # [JOIN] lines carry no peer ID, they follow the peer reaching InGame
+        session = None
+        while self._awaiting_name and session is None:
+            session = self._awaiting_name.popleft()
+            if self.peers.get(session.peer_id) is not session:
+                session = None
+
+        if session is None:
+            session = PeerSession(None, event.uptime)
+            session.state = "InGame"
+
+        session.name = event.player
+        session.player = ChatPlayer(self.game, event.player)
+        self.online[event.player] = session
+
+    def handle_leave(self, event: PlayerLeaveEvent):
+        session = self.online.pop(event.player, None)
+        if session is None:
+            return
+
+        # Keep the session until its peer is removed, which carries the uptime
+        if session.peer_id is None or self.peers.get(session.peer_id) is not session:
+            self._finish(session, event.uptime)
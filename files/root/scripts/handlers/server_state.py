@@ -0,0 +1,48 @@
+from typing import Callable
+from .base import LogEventHandler
+from .events import GameStateChangeEvent, SaveStartedEvent
+
+SAVE_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 40, 60, 120, 300)
+
+
+class ServerState(LogEventHandler):
+    state: str | None
+    saving_since: float | None
+    save_name: str | None
+    last_save_duration: float | None
+
+    def __init__(self, game):
+        super().__init__(game)
+        self._save_seconds = game.metrics.histogram(
+            "factorio_save_duration_seconds", "Time the server spent in InGameSavingMap", SAVE_SECONDS_BUCKETS)
+        self.last_save_duration = None
+        self.reset()
+
+    def event_handlers(self) -> dict[type, Callable]:
+        return {
+            GameStateChangeEvent: self.handle_state_change,
+            SaveStartedEvent: self.handle_save_started,
+        }
+
+    def reset(self):
+        self.state = None
+        self.saving_since = None
+        self.save_name = None
+
+    def is_saving(self) -> bool:
+        return self.state == "InGameSavingMap"
+
+    def handle_save_started(self, event: SaveStartedEvent):
+        self.save_name = event.name
+
+    def handle_state_change(self, event: GameStateChangeEvent):
+        self.state = event.new_state
+
+        if event.new_state == "InGameSavingMap":
+            self.saving_since = event.uptime
+            return
+
+        if event.old_state == "InGameSavingMap" and self.saving_since is not None and event.uptime is not None:
+            self.last_save_duration = event.uptime - self.saving_since
+            self._save_seconds.observe(self.last_save_duration)
+            self.saving_since = None
@@ -0,0 +1,138 @@
+from typing import Callable
+from .base import LogEventHandler
+from .events import GameStateChangeEvent, PeerStateChangeEvent, MapServedEvent
+
+TARGET_UPS = 60.0
+LOW_UPS_THRESHOLD = 59.0
+MIN_SAMPLE_INTERVAL = 1.0
+SAVE_STALL_THRESHOLD = 5.0
+RING_SIZE = 64
+
+
+class RingBuffer:
+    def __init__(self, size: int):
+        self._values = [0.0] * size
+        self._next = 0
+        self.count = 0
+
+    def append(self, value: float):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        if self.count < len(self._values):
+            self.count += 1
+
+    def clear(self):
+        self._next = 0
+        self.count = 0
+
+    def last(self) -> float | None:
+        if self.count == 0:
+            return None
+        return self._values[self._next - 1]
+
+    def values(self) -> list[float]:
+        if self.count < len(self._values):
+            return self._values[:self.count]
+        return list(self._values)
+
+
+class UPSMonitor(LogEventHandler):
+    def __init__(self, game, threshold: float = LOW_UPS_THRESHOLD):
+        super().__init__(game)
+        self.threshold = threshold
+        self.readings = RingBuffer(RING_SIZE)
+        self.is_low = False
+        self._anchor = None
+        self._saving = False
+        self._saving_since = None
+
+        self._stalls_total = game.metrics.counter(
+            "factorio_save_stalls_total", f"Saves that stalled the server for more than {SAVE_STALL_THRESHOLD}s")
+        game.metrics.gauge("factorio_ups_current", "Most recent UPS reading",
+                           callback=lambda: self.current() or 0)
+        game.metrics.gauge("factorio_ups_min", "Minimum UPS in the rolling window",
+                           callback=lambda: self.minimum() or 0)
+        game.metrics.gauge("factorio_ups_p50", "Median UPS in the rolling window",
+                           callback=lambda: self.median() or 0)
+
+    def event_handlers(self) -> dict[type, Callable]:
+        return {
+            GameStateChangeEvent: self.handle_state_change,
+            PeerStateChangeEvent: self.handle_tick,
+            MapServedEvent: self.handle_tick,
+        }
+
+    def reset(self):
+        self.readings.clear()
+        self.is_low = False
+        self._anchor = None
+        self._saving = False
+        self._saving_since = None
+
+    def current(self) -> float | None:
+        return self.readings.last()
+
+    def minimum(self) -> float | None:
+        values = self.readings.values()
+        if not values:
+            return None
+        return min(values)
+
+    def median(self) -> float | None:
+        values = sorted(self.readings.values())
+        if not values:
+            return None
+        return values[len(values) // 2]
+
+    def handle_tick(self, event):
+        # Players joining log peer and map lines while the map is saved,
+        # the next reading is anchored once the save has finished
+        if event.uptime is None or self._saving:
+            return
+
+        if self._anchor is None:
+            self._anchor = (event.uptime, event.tick)
+            return
+
+        anchor_uptime, anchor_tick = self._anchor
+        interval = event.uptime - anchor_uptime
+        if event.tick < anchor_tick or interval < 0:
+            # The server was restarted or loaded another save
+            self._anchor = (event.uptime, event.tick)
+            return
+
+        if interval < MIN_SAMPLE_INTERVAL:
+            return
+
+        ups = (event.tick - anchor_tick) / interval
+        self._anchor = (event.uptime, event.tick)
+        self.readings.append(ups)
+
+        if ups < self.threshold and not self.is_low:
+            self.is_low = True
+            self.game.write_stderr(
+                f"UPS dropped to {ups:.1f} (below {self.threshold:.0f})\n")
+        elif ups >= self.threshold and self.is_low:
+            self.is_low = False
+            self.game.write_stderr(f"UPS recovered to {ups:.1f}\n")
+
+    def handle_state_change(self, event: GameStateChangeEvent):
+        if event.new_state == "InGameSavingMap":
+            # Ticks do not advance while saving, report that as a stall instead
+            self.handle_tick(event)
+            self._anchor = None
+            self._saving = True
+            self._saving_since = event.uptime
+            return
+
+        if event.old_state == "InGameSavingMap":
+            self._saving = False
+            saving_since = self._saving_since
+            self._saving_since = None
+            stall = None if saving_since is None or event.uptime is None else event.uptime - saving_since
+            if stall is not None and stall > SAVE_STALL_THRESHOLD:
+                self._stalls_total.inc()
+                self.game.write_stderr(
+                    f"Server stalled for {stall:.1f}s while saving the map\n")
+
+        self.handle_tick(event)
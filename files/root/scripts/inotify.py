@@ -0,0 +1,77 @@
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from os import read, close, strerror, fsencode, fsdecode
+from struct import calcsize, unpack_from
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = "iIII"
+EVENT_HEADER_SIZE = calcsize(EVENT_HEADER)
+READ_SIZE = 65536
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = CDLL(find_library("c"), use_errno=True)
+    return _libc
+
+
+class InotifyEvent:
+    __slots__ = ("wd", "mask", "cookie", "name")
+
+    def __init__(self, wd: int, mask: int, cookie: int, name: str):
+        self.wd = wd
+        self.mask = mask
+        self.cookie = cookie
+        self.name = name
+
+
+class Inotify:
+    def __init__(self):
+        self._libc = _get_libc()
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = get_errno()
+            raise OSError(errno, strerror(errno))
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, fsencode(path), mask)
+        if wd < 0:
+            errno = get_errno()
+            raise OSError(errno, strerror(errno), path)
+        return wd
+
+    def read_events(self) -> list[InotifyEvent]:
+        data = read(self.fd, READ_SIZE)
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, name_len = unpack_from(EVENT_HEADER, data, pos)
+            pos += EVENT_HEADER_SIZE
+            name = fsdecode(data[pos:pos + name_len].rstrip(b"\x00"))
+            pos += name_len
+            events.append(InotifyEvent(wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            close(self.fd)
+            self.fd = -1
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser, Namespace
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from json import loads
+from mmap import mmap, ACCESS_READ
+from os import cpu_count
+from os.path import exists, join
+from sys import stdout
+from zlib import decompressobj, MAX_WBITS
+from handlers import events
+from handlers.events import LogEventClassifier
+from logsink import (LOG_SINK_DIR, SEGMENT_PREFIX, SEGMENT_SUFFIX, COMPRESSED_SUFFIX, INDEX_SUFFIX,
+                     SEGMENT_TIME_FORMAT, NO_TICK, TICK_MARKER, TICK_PATTERN, list_segments, read_index)
+
+DECOMPRESS_READ_SIZE = 256 * 1024
+
+
+def event_type_by_name(name: str) -> type:
+    wanted = name.lower().removesuffix("event")
+    for attr in dir(events):
+        value = getattr(events, attr)
+        if isinstance(value, type) and issubclass(value, events.LogEvent) and \
+                attr.lower().removesuffix("event") == wanted:
+            return value
+    raise ValueError(f"Unknown event type: {name}")
+
+
+def parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+
+def line_source(line: str) -> str | None:
+    # Same fields as LogEventClassifier.classify
+    fields = line.lstrip().split(" ", 3)
+    if len(fields) < 4:
+        return None
+    source = fields[2]
+    if source[-1:] == ":":
+        source = source[:source.find(":")]
+    return source
+
+
+def segment_start(name: str) -> float:
+    stamp = name[len(SEGMENT_PREFIX):len(SEGMENT_PREFIX) + 15]
+    return datetime.strptime(stamp, SEGMENT_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+
+# Picks the (start, end) offsets of a segment that can hold matching lines,
+# with the tick last logged before each range. end None means end of file.
+def select_ranges(index: list[tuple[float, int, int]], query: Namespace) -> list[tuple[int, int | None, int]]:
+    if not index:
+        return [(0, None, NO_TICK)]
+
+    first = 0
+    if query.since is not None:
+        first = max(bisect_right([entry[0] for entry in index], query.since) - 1, 0)
+
+    ranges = []
+    for i in range(first, len(index)):
+        when, tick, offset = index[i]
+        if query.until is not None and when > query.until:
+            break
+
+        end = index[i + 1][2] if i + 1 < len(index) else None
+        if query.tick_from is not None or query.tick_to is not None:
+            next_tick = index[i + 1][1] if i + 1 < len(index) else None
+            # Ticks restart with the server, only skip ranges known to be outside
+            if tick != NO_TICK and (next_tick is None or next_tick >= tick):
+                if query.tick_to is not None and tick > query.tick_to:
+                    continue
+                if query.tick_from is not None and next_tick is not None and next_tick < query.tick_from:
+                    continue
+
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], end, ranges[-1][2])
+        else:
+            ranges.append((offset, end, tick))
+    return ranges
+
+
+def iter_plain(data: mmap, start: int, end: int | None):
+    if end is None:
+        end = len(data)
+    while start < end:
+        chunk_end = data.rfind(b"\n", start, min(start + DECOMPRESS_READ_SIZE, end)) + 1
+        if chunk_end <= start:
+            chunk_end = min(start + DECOMPRESS_READ_SIZE, end)
+        yield data[start:chunk_end]
+        start = chunk_end
+
+
+def iter_compressed(data: mmap, start: int, end: int | None):
+    # Ranges start on gzip member boundaries, decompress them a piece at a time
+    if end is None:
+        end = len(data)
+    partial = b""
+    pos = start
+    decompressor = decompressobj(MAX_WBITS | 16)
+    while pos < end or decompressor.unused_data:
+        if decompressor.eof:
+            pending = decompressor.unused_data
+            decompressor = decompressobj(MAX_WBITS | 16)
+        else:
+            pending = data[pos:min(pos + DECOMPRESS_READ_SIZE, end)]
+            pos += len(pending)
+        chunk = partial + decompressor.decompress(pending)
+        chunk_end = chunk.rfind(b"\n") + 1
+        partial = chunk[chunk_end:]
+        yield chunk[:chunk_end]
+    if partial:
+        yield partial
+
+
+def iter_lines(chunk: bytes, needles: list[bytes]):
+    if not needles:
+        yield from chunk.splitlines()
+        return
+
+    # Jump between hits of the first needle instead of looking at every line
+    first = needles[0]
+    pos = 0
+    while True:
+        hit = chunk.find(first, pos)
+        if hit < 0:
+            return
+        line_start = chunk.rfind(b"\n", 0, hit) + 1
+        line_end = chunk.find(b"\n", hit)
+        if line_end < 0:
+            line_end = len(chunk)
+        line = chunk[line_start:line_end]
+        if all(needle in line for needle in needles):
+            yield line
+        pos = line_end + 1
+
+
+def query_segment(log_dir: str, name: str, query: Namespace) -> list[str]:
+    compressed = join(log_dir, f"{name}{COMPRESSED_SUFFIX}")
+    if exists(compressed):
+        path, iter_range = compressed, iter_compressed
+    else:
+        path, iter_range = join(log_dir, f"{name}{SEGMENT_SUFFIX}"), iter_plain
+
+    classifier = None
+    if query.event is not None:
+        classifier = LogEventClassifier({query.event})
+    # Byte level prefilter on the raw records, for text that JSON keeps as is
+    needles = [needle.encode("utf-8") for needle in (query.source, query.grep, query.player)
+               if needle and '"' not in needle and "\\" not in needle]
+    if classifier is not None:
+        needles = list(classifier.markers) + needles
+    # Tick filters need to see every line that logs a tick
+    check_ticks = query.tick_from is not None or query.tick_to is not None
+    if check_ticks:
+        needles = []
+
+    res = []
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return res
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            for start, end, tick in select_ranges(read_index(f"{path}{INDEX_SUFFIX}"), query):
+                for chunk in iter_range(data, start, end):
+                    for raw in iter_lines(chunk, needles):
+                        if check_ticks and TICK_MARKER in raw:
+                            m = TICK_PATTERN.search(raw)
+                            if m:
+                                tick = int(m.group(1))
+                        if not raw:
+                            continue
+                        if query.tick_from is not None and (tick == NO_TICK or tick < query.tick_from):
+                            continue
+                        if query.tick_to is not None and (tick == NO_TICK or tick > query.tick_to):
+                            continue
+
+                        record = loads(raw)
+                        when = record["time"]
+                        if query.since is not None and when < query.since:
+                            continue
+                        if query.until is not None and when > query.until:
+                            return res
+
+                        line = record["line"]
+                        if query.grep is not None and query.grep not in line:
+                            continue
+                        if query.source is not None and line_source(line) != query.source:
+                            continue
+
+                        event = None
+                        if classifier is not None:
+                            event = classifier.classify(line)
+                            if event is None:
+                                continue
+                        if query.player is not None:
+                            player = getattr(event, "player", None)
+                            if player != query.player and (player is not None or query.player not in line):
+                                continue
+
+                        if query.json:
+                            res.append(raw.decode("utf-8"))
+                        else:
+                            stamp = datetime.fromtimestamp(when, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                            res.append(f"{stamp} {line}")
+    return res
+
+
+def select_segments(log_dir: str, query: Namespace) -> list[str]:
+    segments = list_segments(log_dir)
+    res = []
+    for i, name in enumerate(segments):
+        if query.until is not None and segment_start(name) > query.until:
+            break
+        if query.since is not None and i + 1 < len(segments) and segment_start(segments[i + 1]) < query.since:
+            continue
+        res.append(name)
+    return res
+
+
+def main():
+    parser = ArgumentParser(description="Query the log segments written by the log sink")
+    parser.add_argument("--dir", default=LOG_SINK_DIR, help="Log sink directory (default: $LOG_SINK_DIR)")
+    parser.add_argument("--since", type=parse_time, help="Unix time or ISO date (UTC unless given)")
+    parser.add_argument("--until", type=parse_time, help="Unix time or ISO date (UTC unless given)")
+    parser.add_argument("--tick-from", type=int)
+    parser.add_argument("--tick-to", type=int)
+    parser.add_argument("--event", type=event_type_by_name,
+                        help="Event type, e.g. chat, playerjoin, peerstatechange")
+    parser.add_argument("--player", help="Only lines of events by or mentioning this player")
+    parser.add_argument("--source", help="Source file or tag, e.g. ServerSynchronizer.cpp or [CHAT]")
+    parser.add_argument("--grep", help="Only lines containing this text")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON records")
+    parser.add_argument("-j", "--jobs", type=int, default=cpu_count() or 1)
+    query = parser.parse_args()
+
+    if not query.dir:
+        parser.error("--dir or $LOG_SINK_DIR is required")
+
+    segments = select_segments(query.dir, query)
+    if len(segments) <= 1 or query.jobs <= 1:
+        results = (query_segment(query.dir, name, query) for name in segments)
+        for lines in results:
+            stdout.write("".join(f"{line}\n" for line in lines))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(query.jobs, len(segments))) as executor:
+        for lines in executor.map(query_segment, [query.dir] * len(segments), segments, [query] * len(segments)):
+            stdout.write("".join(f"{line}\n" for line in lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from json import dumps
+from os import (getenv, makedirs, open as os_open, close, write, rename, scandir, unlink,
+                O_WRONLY, O_CREAT, O_APPEND)
+from os.path import exists, join
+from re import compile as re_compile
+from struct import Struct
+from threading import Thread, Condition
+from time import monotonic, time
+from traceback import print_exc
+from zlib import compressobj, MAX_WBITS
+from metrics import MetricsRegistry
+
+LOG_SINK_DIR = getenv("LOG_SINK_DIR")
+LOG_SINK_SEGMENT_BYTES = int(getenv("LOG_SINK_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+LOG_SINK_SEGMENT_SECONDS = float(getenv("LOG_SINK_SEGMENT_SECONDS", "3600"))
+LOG_SINK_KEEP = int(getenv("LOG_SINK_KEEP", "168"))
+LOG_SINK_MAX_QUEUE_BYTES = 64 * 1024 * 1024
+
+SEGMENT_PREFIX = "factorio-"
+SEGMENT_SUFFIX = ".jsonl"
+COMPRESSED_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx"
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+# Index entries are (wall clock time, last updateTick or -1, byte offset) and
+# are written at least every INDEX_INTERVAL bytes. Compressed segments start a
+# new gzip member at every entry, so their offsets can be seeked to as well.
+INDEX_ENTRY = Struct("<dqQ")
+INDEX_INTERVAL = 256 * 1024
+NO_TICK = -1
+
+LINE_SENTINEL = "\uffff"
+TICK_MARKER = b"pdateTick("
+TICK_PATTERN = re_compile(rb"[uU]pdateTick\((\d+)\)")
+
+
+def segment_name(when: float) -> str:
+    return SEGMENT_PREFIX + datetime.fromtimestamp(when, tz=timezone.utc).strftime(SEGMENT_TIME_FORMAT)
+
+
+def list_segments(log_dir: str) -> list[str]:
+    # Segment names without suffix, oldest first
+    res = set()
+    with scandir(log_dir) as dirlist:
+        for dirent in dirlist:
+            name = dirent.name
+            if not name.startswith(SEGMENT_PREFIX):
+                continue
+            for suffix in (COMPRESSED_SUFFIX, SEGMENT_SUFFIX):
+                if name.endswith(suffix):
+                    res.add(name[:-len(suffix)])
+    return sorted(res)
+
+
+def read_index(path: str) -> list[tuple[float, int, int]]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+
+def compress_segment(log_dir: str, name: str):
+    src = join(log_dir, f"{name}{SEGMENT_SUFFIX}")
+    dst = join(log_dir, f"{name}{COMPRESSED_SUFFIX}")
+    src_index = f"{src}{INDEX_SUFFIX}"
+    dst_index = f"{dst}{INDEX_SUFFIX}"
+
+    with open(src, "rb") as f:
+        data = f.read()
+
+    entries = read_index(src_index)
+    if not entries or entries[0][2] != 0:
+        entries.insert(0, (0.0, NO_TICK, 0))
+
+    with open(f"{dst}.tmp", "wb") as fdst, open(f"{dst_index}.tmp", "wb") as fidx:
+        offset = 0
+        for i, (when, tick, start) in enumerate(entries):
+            end = entries[i + 1][2] if i + 1 < len(entries) else len(data)
+            if end <= start:
+                continue
+            compressor = compressobj(6, wbits=MAX_WBITS | 16)
+            member = compressor.compress(data[start:end]) + compressor.flush()
+            fidx.write(INDEX_ENTRY.pack(when, tick, offset))
+            fdst.write(member)
+            offset += len(member)
+
+    rename(f"{dst}.tmp", dst)
+    rename(f"{dst_index}.tmp", dst_index)
+    unlink(src)
+    if exists(src_index):
+        unlink(src_index)
+
+
+# Everything the server logs, as one JSON object per line. The pump only
+# hands blocks over, encoding and writing happen on the sink's thread.
+class LogSink(Thread):
+    _queue: deque[tuple[float, str, memoryview]]
+
+    def __init__(self, log_dir: str, metrics: MetricsRegistry,
+                 segment_bytes: int = LOG_SINK_SEGMENT_BYTES, segment_seconds: float = LOG_SINK_SEGMENT_SECONDS,
+                 keep: int = LOG_SINK_KEEP):
+        super().__init__(name="Log sink", daemon=True)
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.keep = keep
+
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._dropped = 0
+        self._writing = False
+        self._cond = Condition()
+
+        self._fd = None
+        self._index_fd = None
+        self._segment = None
+        self._segment_base = None
+        self._segment_suffix = 0
+        self._segment_started = 0.0
+        self._offset = 0
+        self._indexed_offset = 0
+        self._tick = NO_TICK
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Log sink compressor")
+
+        self._bytes_total = metrics.counter(
+            "factorio_log_sink_bytes_total", "Bytes written to the log sink")
+        self._dropped_total = metrics.counter(
+            "factorio_log_sink_dropped_blocks_total", "Log blocks dropped because the sink fell behind")
+        self._segments_total = metrics.counter(
+            "factorio_log_sink_segments_total", "Log sink segments rotated")
+
+        makedirs(log_dir, exist_ok=True)
+
+    def start(self):
+        # Segments left uncompressed by a previous run
+        for name in list_segments(self.log_dir):
+            if exists(join(self.log_dir, f"{name}{SEGMENT_SUFFIX}")):
+                self._compressor.submit(self._compress, name)
+        super().start()
+
+    def write(self, block: memoryview, stream: str):
+        if not block:
+            return
+
+        with self._cond:
+            self._queue.append((time(), stream, block))
+            self._queued_bytes += len(block)
+            while self._queued_bytes > LOG_SINK_MAX_QUEUE_BYTES:
+                _, _, old_block = self._queue.popleft()
+                self._queued_bytes -= len(old_block)
+                self._dropped += 1
+                self._dropped_total.inc()
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            while self._queue or self._writing:
+                self._cond.wait()
+            self._close_segment()
+        self._compressor.shutdown(wait=True)
+
+    def _open_segment(self, now: float):
+        # Several segments can start within a second, and the previous one may
+        # be between files while it is compressed
+        name = segment_name(now)
+        suffix = self._segment_suffix + 1 if name == self._segment_base else 0
+        self._segment_base = name
+        while True:
+            self._segment = f"{name}-{suffix}" if suffix else name
+            if not exists(join(self.log_dir, f"{self._segment}{SEGMENT_SUFFIX}")) and \
+                    not exists(join(self.log_dir, f"{self._segment}{COMPRESSED_SUFFIX}")):
+                break
+            suffix += 1
+        self._segment_suffix = suffix
+        path = join(self.log_dir, f"{self._segment}{SEGMENT_SUFFIX}")
+        self._fd = os_open(path, O_WRONLY | O_CREAT | O_APPEND, 0o644)
+        self._index_fd = os_open(f"{path}{INDEX_SUFFIX}", O_WRONLY | O_CREAT | O_APPEND, 0o644)
+        self._segment_started = monotonic()
+        self._offset = 0
+        self._indexed_offset = -INDEX_INTERVAL
+
+    def _close_segment(self):
+        if self._fd is None:
+            return
+        close(self._fd)
+        close(self._index_fd)
+        self._fd = None
+        self._index_fd = None
+        self._segments_total.inc()
+        self._compressor.submit(self._compress, self._segment)
+
+    def _compress(self, name: str):
+        try:
+            compress_segment(self.log_dir, name)
+            segments = list_segments(self.log_dir)
+            if self.keep > 0:
+                for old in segments[:-self.keep]:
+                    for suffix in (COMPRESSED_SUFFIX, f"{COMPRESSED_SUFFIX}{INDEX_SUFFIX}"):
+                        path = join(self.log_dir, f"{old}{suffix}")
+                        if exists(path):
+                            unlink(path)
+        except Exception:
+            print_exc()
+
+    def _encode(self, batch: list[tuple[float, str, memoryview]]) -> tuple[bytes, bytes]:
+        records = []
+        index = []
+        offset = self._offset
+        for when, stream, block in batch:
+            # Index at block boundaries, with the last tick logged before them
+            if offset - self._indexed_offset >= INDEX_INTERVAL:
+                index.append(INDEX_ENTRY.pack(when, self._tick, offset))
+                self._indexed_offset = offset
+
+            data = block.obj
+            if data.find(TICK_MARKER, 0, len(block)) >= 0:
+                for m in TICK_PATTERN.finditer(data, 0, len(block)):
+                    self._tick = int(m.group(1))
+
+            # Encode the whole block with one dumps() call, with a noncharacter
+            # standing in for line breaks, and split the JSON string into records
+            text = str(block, "utf-8", "replace").replace(LINE_SENTINEL, "\ufffd")
+            if text[-1:] == "\n":
+                text = text[:-1]
+            lines = dumps(text.replace("\n", LINE_SENTINEL), ensure_ascii=False)[1:-1].split(LINE_SENTINEL)
+
+            prefix = '{"time":%.3f%s,"line":"' % (
+                when, "" if stream == "stdout" else f',"stream":"{stream}"')
+            record = (prefix + f'"}}\n{prefix}'.join(lines) + '"}\n').encode("utf-8")
+            records.append(record)
+            offset += len(record)
+
+        self._offset = offset
+        return b"".join(records), b"".join(index)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = list(self._queue)
+                self._queue.clear()
+                self._queued_bytes = 0
+                dropped = self._dropped
+                self._dropped = 0
+                self._writing = True
+
+            try:
+                if dropped > 0:
+                    message = f"[cli_handler] Log sink fell behind, dropped {dropped} blocks\n"
+                    batch.insert(0, (batch[0][0], "stderr", memoryview(message.encode("utf-8"))))
+
+                now = batch[0][0]
+                if self._fd is not None and (self._offset >= self.segment_bytes or
+                                             monotonic() - self._segment_started >= self.segment_seconds):
+                    self._close_segment()
+                if self._fd is None:
+                    self._open_segment(now)
+
+                records, index = self._encode(batch)
+                if index:
+                    _write_all(self._index_fd, index)
+                _write_all(self._fd, records)
+                self._bytes_total.inc(len(records))
+            except Exception:
+                print_exc()
+
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[write(fd, view):]
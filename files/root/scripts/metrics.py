@@ -0,0 +1,169 @@
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from typing import Callable
+
+# Metrics are updated without locks of their own. A series is written either
+# by a single thread (usually the log pump), or only while its owner holds
+# its own lock (e.g. the output queue's or the chat commands'), or by one
+# thread at a time. Scrapes only ever read the plain values.
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, name: str, labels: str):
+        yield name, labels, self.value
+
+
+class Gauge:
+    __slots__ = ("value", "callback")
+
+    def __init__(self, callback: Callable | None = None):
+        self.value = 0
+        self.callback = callback
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, name: str, labels: str):
+        if self.callback is not None:
+            yield name, labels, self.callback()
+        else:
+            yield name, labels, self.value
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str):
+        sep = "," if labels else ""
+        total = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            yield f"{name}_bucket", f"{labels}{sep}le=\"{bucket}\"", total
+        yield f"{name}_bucket", f"{labels}{sep}le=\"+Inf\"", total + self.counts[-1]
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class MetricFamily:
+    def __init__(self, name: str, help: str, kind: str, labelnames: tuple[str], factory: Callable):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self._factory = factory
+        self._children = {}
+        if not labelnames:
+            self._children[()] = factory()
+
+    # Gauges of a labelled family each read their own callback
+    def labels(self, *values: str, callback: Callable | None = None):
+        child = self._children.get(values)
+        if child is None:
+            child = self._factory()
+            # Copy on write, so scrapes never iterate a dict being modified
+            self._children = self._children | {values: child}
+        if callback is not None:
+            child.callback = callback
+        return child
+
+    def __getattr__(self, name: str):
+        # Label-less families act like their only series
+        return getattr(self._children[()], name)
+
+    def render(self) -> list[str]:
+        res = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            labels = ",".join(f"{name}=\"{value}\"" for name,
+                              value in zip(self.labelnames, values))
+            for name, sample_labels, value in child.samples(self.name, labels):
+                if sample_labels:
+                    res.append(f"{name}{{{sample_labels}}} {value}")
+                else:
+                    res.append(f"{name} {value}")
+        return res
+
+
+class MetricsRegistry:
+    families: dict[str, MetricFamily]
+
+    def __init__(self):
+        self.families = {}
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        existing = self.families.get(family.name)
+        if existing is not None:
+            return existing
+        self.families = self.families | {family.name: family}
+        return family
+
+    def counter(self, name: str, help: str, labelnames: tuple[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, help, "counter", labelnames, Counter))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str] = (), callback: Callable | None = None) -> MetricFamily:
+        if labelnames and callback is not None:
+            raise ValueError(f"Labelled gauge {name} takes its callbacks from labels()")
+        return self._register(MetricFamily(name, help, "gauge", labelnames, lambda: Gauge(callback)))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float], labelnames: tuple[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, help, "histogram", labelnames, lambda: Histogram(buckets)))
+
+    def render(self) -> str:
+        res = []
+        for family in self.families.values():
+            res += family.render()
+        res.append("")
+        return "\n".join(res)
+
+
+class MetricsServer(Thread):
+    def __init__(self, registry: MetricsRegistry, port: int, bind: str = "127.0.0.1"):
+        super().__init__(name="Metrics server", daemon=True)
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((bind, port), MetricsRequestHandler)
+        self.server.daemon_threads = True
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
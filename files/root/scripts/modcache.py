@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+from fcntl import flock, LOCK_EX, LOCK_NB
+from os import (getenv, getgid, getuid, makedirs, open as os_open, chmod, close, fchmod, fstat, rename, scandir,
+                stat, unlink, utime, O_RDWR, O_CREAT)
+from os.path import dirname, exists, isdir, join
+from staging import stage_file
+
+MOD_CACHE_DIR = getenv("MOD_CACHE_DIR")
+MOD_CACHE_MAX_BYTES = int(getenv("MOD_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+
+ENTRY_SUFFIX = ".zip"
+LOCK_SUFFIX = ".lock"
+EVICT_LOCK_NAME = ".evict.lock"
+# Mod zips are never written in place, so installed mods can share the inode
+INSTALL_STRATEGIES = ["reflink", "hardlink", "copy_file_range", "copy"]
+# Unless fix_ownership would chown the shared inode away from another server
+SEPARATE_INSTALL_STRATEGIES = ["reflink", "copy_file_range", "copy"]
+# Running as root, installed mods are chowned to PUID:PGID at startup
+if getuid() == 0:
+    INSTALL_OWNER = (int(getenv("PUID", "0")), int(getenv("PGID", "0")))
+else:
+    INSTALL_OWNER = (getuid(), getgid())
+
+
+# Servers sharing the cache may run as different users
+def makedirs_shared(path: str):
+    if isdir(path):
+        return
+    makedirs(path, exist_ok=True)
+    try:
+        chmod(path, 0o777)
+    except PermissionError:
+        pass
+
+
+def lock_path(path: str, blocking: bool = True) -> int | None:
+    # Eviction deletes lock files, so the one that was locked may no longer
+    # be the one at path. Try again until it is.
+    while True:
+        fd = os_open(path, O_RDWR | O_CREAT, 0o666)
+        try:
+            # The mode passed to open is masked by the umask
+            fchmod(fd, 0o666)
+        except PermissionError:
+            pass
+        try:
+            flock(fd, LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+        except BlockingIOError:
+            close(fd)
+            return None
+        except BaseException:
+            close(fd)
+            raise
+
+        try:
+            st = stat(path)
+            fst = fstat(fd)
+            if st.st_ino == fst.st_ino and st.st_dev == fst.st_dev:
+                return fd
+        except FileNotFoundError:
+            pass
+        close(fd)
+
+
+# Mod zips shared by all servers on a host, stored by the sha1 of their
+# release. Every entry has a lock file, which is held while the entry is
+# looked up, filled or evicted, so a release that several servers update
+# to at the same time is only downloaded once.
+class ModCache:
+    def __init__(self, cache_dir: str, max_bytes: int = MOD_CACHE_MAX_BYTES,
+                 owner: tuple[int, int] = INSTALL_OWNER):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.owner = owner
+        makedirs_shared(cache_dir)
+
+    def _entry_base(self, sha1: str) -> str:
+        return join(self.cache_dir, sha1[:2], sha1)
+
+    @contextmanager
+    def locked(self, sha1: str):
+        base = self._entry_base(sha1)
+        makedirs_shared(dirname(base))
+        fd = lock_path(f"{base}{LOCK_SUFFIX}")
+        try:
+            yield
+        finally:
+            close(fd)
+
+    # The methods below expect the entry to be locked
+
+    def install(self, sha1: str, dst: str) -> str | None:
+        path = f"{self._entry_base(sha1)}{ENTRY_SUFFIX}"
+        try:
+            st = stat(path)
+        except FileNotFoundError:
+            return None
+        if exists(dst):
+            unlink(dst)
+        if (st.st_uid, st.st_gid) == self.owner:
+            strategies = INSTALL_STRATEGIES
+        else:
+            strategies = SEPARATE_INSTALL_STRATEGIES
+        strategy = stage_file(path, dst, strategies=strategies)
+        # Entries are evicted by least recent use
+        try:
+            utime(path)
+        except PermissionError:
+            pass
+        return strategy
+
+    def add(self, sha1: str, src: str):
+        base = self._entry_base(sha1)
+        tmp_path = f"{base}.tmp"
+        if exists(tmp_path):
+            unlink(tmp_path)
+        try:
+            stage_file(src, tmp_path, strategies=INSTALL_STRATEGIES)
+            rename(tmp_path, f"{base}{ENTRY_SUFFIX}")
+        except BaseException:
+            if exists(tmp_path):
+                unlink(tmp_path)
+            raise
+
+    def discard(self, sha1: str):
+        path = f"{self._entry_base(sha1)}{ENTRY_SUFFIX}"
+        if exists(path):
+            unlink(path)
+
+    # Deletes the least recently used entries until the cache fits into
+    # max_bytes. Entries locked by another server are skipped, as is the
+    # whole eviction if another server is already evicting.
+    def evict(self) -> tuple[int, int]:
+        evict_fd = lock_path(join(self.cache_dir, EVICT_LOCK_NAME), blocking=False)
+        if evict_fd is None:
+            return 0, 0
+
+        try:
+            entries = []
+            total = 0
+            for subdir in scandir(self.cache_dir):
+                if not subdir.is_dir(follow_symlinks=False):
+                    continue
+                for dirent in scandir(subdir.path):
+                    if not dirent.name.endswith(ENTRY_SUFFIX):
+                        continue
+                    st = dirent.stat(follow_symlinks=False)
+                    entries.append((st.st_mtime_ns, st.st_size, dirent.path))
+                    total += st.st_size
+            entries.sort()
+
+            removed = 0
+            freed = 0
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                base = path[:-len(ENTRY_SUFFIX)]
+                fd = lock_path(f"{base}{LOCK_SUFFIX}", blocking=False)
+                if fd is None:
+                    continue
+                try:
+                    # Used since it was listed
+                    if stat(path).st_mtime_ns != mtime:
+                        continue
+                    unlink(path)
+                    unlink(f"{base}{LOCK_SUFFIX}")
+                except FileNotFoundError:
+                    continue
+                finally:
+                    close(fd)
+                total -= size
+                removed += 1
+                freed += size
+            return removed, freed
+        finally:
+            close(evict_fd)
@@ -0,0 +1,105 @@
+from collections import deque
+from os import getenv
+from threading import Thread, Condition
+from time import monotonic, sleep
+from traceback import print_exc
+from typing import Callable
+from handlers.chat_commands import TokenBucket
+from metrics import MetricsRegistry
+
+CONSOLE_MAX_LINE = int(getenv("CONSOLE_MAX_LINE", "1000"))
+CONSOLE_LINES_PER_SECOND = float(getenv("CONSOLE_LINES_PER_SECOND", "10"))
+CONSOLE_LINES_BURST = 20
+CONSOLE_MAX_QUEUED = 1000
+# Commands usually send several messages in a row, wait for all of them
+COALESCE_DELAY = 0.02
+# Console input is line based, so merged messages share a line
+MESSAGE_SEPARATOR = " | "
+
+
+def format_console_line(recipient: str | None, message: str) -> str:
+    if recipient is None:
+        return message
+    return f"/whisper {recipient} {message}"
+
+
+# Player replies, merged per recipient and written to the server console at a
+# limited rate from a thread of its own, so senders never block on the pipe
+class ConsoleOutbox(Thread):
+    _queue: deque[tuple[str | None, str]]
+
+    def __init__(self, write: Callable[[str], None], metrics: MetricsRegistry,
+                 max_line: int = CONSOLE_MAX_LINE, lines_per_second: float = CONSOLE_LINES_PER_SECOND):
+        super().__init__(name="Console outbox", daemon=True)
+        self._write = write
+        self.max_line = max_line
+        self._bucket = TokenBucket(monotonic(), CONSOLE_LINES_BURST, lines_per_second)
+        self._queue = deque()
+        self._cond = Condition()
+        self._busy = False
+
+        self._lines_total = metrics.counter(
+            "factorio_console_lines_total", "Lines written to the server console by the outbox")
+        self._messages_total = metrics.counter(
+            "factorio_console_messages_total", "Messages queued for the server console")
+        self._dropped_total = metrics.counter(
+            "factorio_console_messages_dropped_total", "Messages dropped because the outbox was full")
+        metrics.gauge("factorio_console_queue_depth", "Messages waiting in the outbox",
+                      callback=lambda: len(self._queue))
+
+    def send(self, message: str, recipient: str | None = None):
+        message = " ".join(message.split())
+        if not message:
+            return
+
+        with self._cond:
+            if len(self._queue) >= CONSOLE_MAX_QUEUED:
+                self._queue.popleft()
+                self._dropped_total.inc()
+            self._queue.append((recipient, message))
+            self._messages_total.inc()
+            self._cond.notify()
+
+    def _next_line(self) -> str:
+        recipient, message = self._queue.popleft()
+        parts = [message]
+        size = len(format_console_line(recipient, message))
+        while self._queue:
+            next_recipient, next_message = self._queue[0]
+            if next_recipient != recipient:
+                break
+            size += len(MESSAGE_SEPARATOR) + len(next_message)
+            if size > self.max_line:
+                break
+            self._queue.popleft()
+            parts.append(next_message)
+        return format_console_line(recipient, MESSAGE_SEPARATOR.join(parts))
+
+    # Waits until everything queued so far has been written
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                self._busy = True
+
+            sleep(COALESCE_DELAY)
+            while not self._bucket.take(monotonic()):
+                sleep((1 - self._bucket.tokens) / self._bucket.rate)
+
+            with self._cond:
+                line = self._next_line()
+
+            try:
+                self._write(line)
+                self._lines_total.inc()
+            except Exception:
+                print_exc()
+
+            with self._cond:
+                self._busy = bool(self._queue)
+                self._cond.notify_all()
@@ -0,0 +1,128 @@
+from collections import Counter
+from os import getenv
+from os.path import basename
+from sys import _current_frames
+from threading import Thread, Event, get_ident
+from time import monotonic, perf_counter
+
+PROFILING = getenv("PROFILING", "false") == "true"
+SAMPLE_INTERVAL = float(getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Innermost frames of threads that are just waiting for work
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+
+class CallStats:
+    __slots__ = ("calls", "total", "max", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def record(self, duration: float, error: bool):
+        self.calls += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        if error:
+            self.errors += 1
+
+
+def callable_name(callback) -> str:
+    return getattr(callback, "__qualname__", None) or type(callback).__qualname__
+
+
+# Call counts and timings of log handlers and chat commands. Call sites check
+# enabled once per dispatch, so nothing is timed unless it was turned on.
+# Like metrics, stats are updated without locks.
+class HandlerProfiler:
+    stats: dict[str, CallStats]
+
+    def __init__(self, enabled: bool = PROFILING):
+        self.enabled = enabled
+        self.stats = {}
+        self.sampler = None
+
+    def record(self, name: str, duration: float, error: bool = False):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats.setdefault(name, CallStats())
+        stats.record(duration, error)
+
+    def call(self, name: str, callback, *args):
+        start = perf_counter()
+        error = False
+        try:
+            return callback(*args)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, perf_counter() - start, error)
+
+    def reset(self):
+        self.stats = {}
+
+    def top(self, count: int) -> list[tuple[str, CallStats]]:
+        return sorted(self.stats.items(), key=lambda item: item[1].total, reverse=True)[:count]
+
+    def sample(self, duration: float, interval: float = SAMPLE_INTERVAL) -> "SamplingProfiler":
+        sampler = SamplingProfiler(interval)
+        self.sampler = sampler
+        sampler.start()
+        try:
+            sampler.join(duration)
+        finally:
+            sampler.stop()
+            sampler.join()
+            self.sampler = None
+        return sampler
+
+
+# Samples the stacks of all other threads until stopped
+class SamplingProfiler(Thread):
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="Sampling profiler", daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.idle_samples = 0
+        self.leaf = Counter()
+        self.inclusive = Counter()
+        self.duration = 0.0
+        self._stop_event = Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        me = get_ident()
+        start = monotonic()
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in _current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                leaf = (basename(code.co_filename), code.co_name)
+                self.samples += 1
+                if leaf in IDLE_FRAMES:
+                    self.idle_samples += 1
+                    continue
+
+                self.leaf[f"{leaf[0]}:{frame.f_lineno} {leaf[1]}"] += 1
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    if code not in seen:
+                        seen.add(code)
+                        self.inclusive[f"{basename(code.co_filename)} {code.co_qualname}"] += 1
+                    frame = frame.f_back
+        self.duration = monotonic() - start
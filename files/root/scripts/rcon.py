@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import Future
+from os import getenv
+from socket import create_connection, socket
+from socketserver import ThreadingTCPServer, BaseRequestHandler
+from struct import pack, unpack
+from sys import argv, stdout
+from threading import Thread, Lock
+from time import sleep
+from typing import Callable
+
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+AUTH_REQUEST_ID = 0
+CONNECT_ATTEMPTS = 3
+CONNECT_RETRY_DELAY = 0.5
+
+
+class RconError(Exception):
+    pass
+
+
+def encode_packet(request_id: int, packet_type: int, body: str) -> bytes:
+    data = body.encode("utf-8") + b"\x00\x00"
+    return pack("<iii", len(data) + 8, request_id, packet_type) + data
+
+
+def recv_exact(sock: socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise RconError("Connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def read_packet(sock: socket) -> tuple[int, int, str]:
+    size, = unpack("<i", recv_exact(sock, 4))
+    data = recv_exact(sock, size)
+    request_id, packet_type = unpack("<ii", data[:8])
+    return request_id, packet_type, data[8:-2].decode("utf-8", errors="replace")
+
+
+class RconClient:
+    _pending: dict[int, Future]
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._lock = Lock()
+        self._sock = None
+        self._pending = {}
+        self._next_id = AUTH_REQUEST_ID + 1
+
+    def _connect(self):
+        sock = create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            sock.sendall(encode_packet(
+                AUTH_REQUEST_ID, SERVERDATA_AUTH, self.password))
+            while True:
+                request_id, packet_type, _ = read_packet(sock)
+                if packet_type != SERVERDATA_AUTH_RESPONSE:
+                    continue
+                if request_id == -1:
+                    raise RconError("Authentication failed")
+                break
+            sock.settimeout(None)
+        except BaseException:
+            sock.close()
+            raise
+
+        self._sock = sock
+        Thread(name="RCON reader", target=self._read_loop,
+               args=(sock,), daemon=True).start()
+
+    def _disconnect(self, sock: socket, error: Exception):
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending = self._pending
+            self._pending = {}
+        sock.close()
+
+        for future in pending.values():
+            future.set_exception(error)
+
+    def _read_loop(self, sock: socket):
+        try:
+            while True:
+                request_id, _, body = read_packet(sock)
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result(body)
+        except (OSError, RconError) as e:
+            self._disconnect(sock, RconError(f"Connection lost: {e}"))
+
+    def _send(self, command: str) -> tuple[int, Future]:
+        future = Future()
+        for attempt in range(CONNECT_ATTEMPTS):
+            request_id = None
+            sock = None
+            try:
+                with self._lock:
+                    if self._sock is None:
+                        self._connect()
+                    sock = self._sock
+                    request_id = self._next_id
+                    self._next_id = (self._next_id % 0x7FFFFFFF) + 1
+                    self._pending[request_id] = future
+                    sock.sendall(encode_packet(
+                        request_id, SERVERDATA_EXECCOMMAND, command))
+                return request_id, future
+            except OSError as e:
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                if sock is not None:
+                    self._disconnect(sock, RconError(f"Send failed: {e}"))
+                if attempt + 1 >= CONNECT_ATTEMPTS:
+                    raise RconError(f"Could not send command: {e}") from e
+                sleep(CONNECT_RETRY_DELAY * (2 ** attempt))
+
+    def command_async(self, command: str) -> Future:
+        return self._send(command)[1]
+
+    def command(self, command: str, timeout: float | None = None) -> str:
+        if timeout is None:
+            timeout = self.timeout
+        request_id, future = self._send(command)
+        try:
+            return future.result(timeout)
+        except TimeoutError as e:
+            # A late reply finds nothing to resolve and is dropped
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise RconError(f"No reply to {command} within {timeout}s") from e
+
+    def close(self):
+        sock = self._sock
+        if sock is not None:
+            self._disconnect(sock, RconError("Connection closed"))
+
+
+def rcon_from_args(args: list[str], host: str = "127.0.0.1") -> RconClient | None:
+    port = None
+    password = None
+    for i, arg in enumerate(args[:-1]):
+        if arg == "--rcon-port":
+            port = int(args[i + 1])
+        elif arg == "--rcon-password":
+            password = args[i + 1]
+
+    if port is None or not password:
+        return None
+    return RconClient(host, port, password)
+
+
+# Speaks just enough RCON to test clients without a Factorio server
+class FakeRconServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password: str, handler: Callable[[str], str], port: int = 0):
+        class FakeRconRequestHandler(BaseRequestHandler):
+            def handle(self):
+                authenticated = False
+                try:
+                    while True:
+                        request_id, packet_type, body = read_packet(
+                            self.request)
+                        if packet_type == SERVERDATA_AUTH:
+                            authenticated = body == password
+                            self.request.sendall(encode_packet(
+                                request_id if authenticated else -1, SERVERDATA_AUTH_RESPONSE, ""))
+                        elif authenticated:
+                            self.request.sendall(encode_packet(
+                                request_id, SERVERDATA_RESPONSE_VALUE, handler(body)))
+                except (OSError, RconError):
+                    pass
+
+        super().__init__(("127.0.0.1", port), FakeRconRequestHandler)
+        self.port = self.server_address[1]
+
+    def start(self):
+        Thread(name="Fake RCON server", target=self.serve_forever,
+               daemon=True).start()
+
+
+def main():
+    config = getenv("CONFIG", "/factorio/config")
+    with open(f"{config}/rconpw") as f:
+        password = f.read().strip()
+
+    client = RconClient("127.0.0.1", int(getenv("RCON_PORT", "27015")), password)
+    stdout.write(client.command(" ".join(argv[1:])))
+    stdout.write("\n")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
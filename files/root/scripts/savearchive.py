@@ -0,0 +1,197 @@
+from base64 import b64decode, b64encode
+from hashlib import sha256
+from json import dump as json_dump, load as json_load
+from mmap import mmap, ACCESS_READ
+from os import getenv, makedirs, rename, scandir, unlink, utime
+from os.path import exists, join
+from struct import unpack_from
+from threading import Lock
+from zipfile import ZipFile, BadZipFile
+from savegames import SaveGameInfo
+
+ARCHIVE_DIR = getenv("SAVE_ARCHIVE")
+ARCHIVE_KEEP = int(getenv("SAVE_ARCHIVE_KEEP", "500"))
+
+# Chunks this small live in the manifest instead of their own object file
+INLINE_CHUNK_SIZE = 1024
+# Fallback for files that are not readable zips
+FIXED_CHUNK_SIZE = 4 * 1024 * 1024
+ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def zip_chunk_boundaries(path: str, size: int) -> list[int]:
+    # Split every member into its local header (timestamps differ between
+    # saves) and its data (often identical), plus the central directory
+    with ZipFile(path) as zf:
+        offsets = sorted(info.header_offset for info in zf.infolist())
+        start_dir = zf.start_dir
+
+    boundaries = {0, start_dir, size}
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            header = f.read(ZIP_LOCAL_HEADER_SIZE)
+            name_len, extra_len = unpack_from("<HH", header, 26)
+            boundaries.add(offset)
+            boundaries.add(offset + ZIP_LOCAL_HEADER_SIZE +
+                           name_len + extra_len)
+    return sorted(boundary for boundary in boundaries if 0 <= boundary <= size)
+
+
+# Savegames split into content-addressed chunks, so saves of the same map
+# share everything that did not change between them
+class SaveArchive:
+    def __init__(self, root: str = ARCHIVE_DIR, keep: int = ARCHIVE_KEEP):
+        self.root = root
+        self.keep = keep
+        self.objects_dir = join(root, "objects")
+        self.manifests_dir = join(root, "manifests")
+        self._lock = Lock()
+        makedirs(self.objects_dir, exist_ok=True)
+        makedirs(self.manifests_dir, exist_ok=True)
+
+    def _object_path(self, digest: str) -> str:
+        return join(self.objects_dir, digest[:2], digest)
+
+    def _manifest_path(self, archive_id: str) -> str:
+        return join(self.manifests_dir, f"{archive_id}.json")
+
+    def _write_object(self, digest: str, data: memoryview) -> bool:
+        path = self._object_path(digest)
+        if exists(path):
+            return False
+        makedirs(join(self.objects_dir, digest[:2]), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        rename(tmp_path, path)
+        return True
+
+    def store(self, savegame: SaveGameInfo) -> tuple[str, int, int]:
+        stem = savegame.name.removesuffix(".zip")
+        archive_id = f"{stem}@{savegame.mtime.strftime('%Y%m%d-%H%M%S')}"
+
+        try:
+            boundaries = zip_chunk_boundaries(savegame.path, savegame.size)
+        except (BadZipFile, OSError):
+            boundaries = list(range(0, savegame.size, FIXED_CHUNK_SIZE)) + [savegame.size]
+
+        chunks = []
+        new_bytes = 0
+        file_hash = sha256()
+        with self._lock, open(savegame.path, "rb") as f:
+            data = mmap(f.fileno(), 0, access=ACCESS_READ) if savegame.size > 0 else b""
+            try:
+                with memoryview(data) as view:
+                    for start, end in zip(boundaries, boundaries[1:]):
+                        with view[start:end] as chunk:
+                            file_hash.update(chunk)
+                            if len(chunk) <= INLINE_CHUNK_SIZE:
+                                chunks.append(
+                                    ["i", b64encode(chunk).decode("ascii")])
+                                continue
+                            digest = sha256(chunk).hexdigest()
+                            if self._write_object(digest, chunk):
+                                new_bytes += len(chunk)
+                            chunks.append(["o", digest, len(chunk)])
+            finally:
+                if savegame.size > 0:
+                    data.close()
+
+            manifest = {
+                "name": savegame.name,
+                "mtime": savegame.stat.st_mtime,
+                "size": savegame.size,
+                "sha256": file_hash.hexdigest(),
+                "chunks": chunks,
+            }
+            tmp_path = f"{self._manifest_path(archive_id)}.tmp"
+            with open(tmp_path, "w") as mf:
+                json_dump(manifest, mf, separators=(",", ":"))
+            rename(tmp_path, self._manifest_path(archive_id))
+
+        self.prune()
+        return archive_id, len(chunks), new_bytes
+
+    def load_manifest(self, archive_id: str) -> dict | None:
+        try:
+            with open(self._manifest_path(archive_id)) as f:
+                return json_load(f)
+        except FileNotFoundError:
+            return None
+
+    def has(self, archive_id: str) -> bool:
+        return "/" not in archive_id and exists(self._manifest_path(archive_id))
+
+    def list(self, name_filter: str | None = None) -> list[tuple[str, float, int]]:
+        res = []
+        with scandir(self.manifests_dir) as dirlist:
+            for dirent in dirlist:
+                if not dirent.name.endswith(".json"):
+                    continue
+                archive_id = dirent.name.removesuffix(".json")
+                if name_filter and name_filter.lower() not in archive_id.lower():
+                    continue
+                manifest = self.load_manifest(archive_id)
+                if manifest is not None:
+                    res.append((archive_id, manifest["mtime"], manifest["size"]))
+        res.sort(key=lambda entry: entry[1], reverse=True)
+        return res
+
+    def restore(self, archive_id: str, dst: str) -> int:
+        manifest = self.load_manifest(archive_id)
+        if manifest is None:
+            raise ValueError(f"Unknown archived save: {archive_id}")
+
+        file_hash = sha256()
+        with open(dst, "wb") as f:
+            for chunk in manifest["chunks"]:
+                if chunk[0] == "i":
+                    data = b64decode(chunk[1])
+                else:
+                    with open(self._object_path(chunk[1]), "rb") as of:
+                        data = of.read()
+                file_hash.update(data)
+                f.write(data)
+
+        if file_hash.hexdigest() != manifest["sha256"]:
+            unlink(dst)
+            raise ValueError(f"Archived save {archive_id} is damaged")
+
+        utime(dst, (manifest["mtime"], manifest["mtime"]))
+        return manifest["size"]
+
+    def prune(self):
+        with self._lock:
+            archives = self.list()
+            for archive_id, _, _ in archives[self.keep:]:
+                unlink(self._manifest_path(archive_id))
+            if len(archives) <= self.keep:
+                return
+
+            referenced = set()
+            for archive_id, _, _ in archives[:self.keep]:
+                manifest = self.load_manifest(archive_id)
+                for chunk in manifest["chunks"]:
+                    if chunk[0] == "o":
+                        referenced.add(chunk[1])
+
+            with scandir(self.objects_dir) as subdirs:
+                for subdir in subdirs:
+                    with scandir(subdir.path) as objects:
+                        for obj in objects:
+                            if obj.name not in referenced:
+                                unlink(obj.path)
+
+    def stats(self) -> tuple[int, int, int]:
+        logical = 0
+        physical = 0
+        archives = self.list()
+        for archive_id, _, size in archives:
+            logical += size
+        with scandir(self.objects_dir) as subdirs:
+            for subdir in subdirs:
+                with scandir(subdir.path) as objects:
+                    for obj in objects:
+                        physical += obj.stat().st_size
+        return len(archives), logical, physical
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ProcessPoolExecutor
+from io import RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END
+from json import load as json_load, dump as json_dump
+from mmap import mmap, ACCESS_READ
+from os import cpu_count, getenv, lstat, rename, replace, scandir, stat_result
+from os.path import join
+from sys import argv, stderr, stdout
+from threading import Lock
+from zipfile import ZipFile, BadZipFile
+from zlib import error as ZlibError
+
+SAVE_DIR = getenv("SAVES")
+VERIFY_CACHE_NAME = ".verify-cache.json"
+VERIFY_READ_SIZE = 1024 * 1024
+CORRUPT_SUFFIX = ".corrupt"
+
+
+# File object over a mapping, zipfile wants seekable() which mmap lacks
+class MappedFile(RawIOBase):
+    def __init__(self, data: mmap):
+        self._data = data
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._data) - self._pos)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._data[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        if whence == SEEK_CUR:
+            offset += self._pos
+        elif whence == SEEK_END:
+            offset += len(self._data)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def verify_save(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            # Reading every member to its end makes zipfile check its CRC
+            with ZipFile(MappedFile(data)) as zf:
+                for info in zf.infolist():
+                    with zf.open(info) as member:
+                        while member.read(VERIFY_READ_SIZE):
+                            pass
+    except (OSError, ValueError, EOFError, BadZipFile, ZlibError) as e:
+        return str(e) or type(e).__name__
+    return None
+
+
+def stat_key(stat: stat_result) -> list[int]:
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+# Verification results by savegame name, valid while the file's
+# (inode, size, mtime) is unchanged
+class SaveVerifier:
+    _cache: dict[str, list]
+
+    def __init__(self, save_dir: str = SAVE_DIR, workers: int | None = None):
+        self.save_dir = save_dir
+        self.cache_path = join(save_dir, VERIFY_CACHE_NAME)
+        self.workers = workers or cpu_count() or 1
+        self._lock = Lock()
+        self._cache = None
+
+    def _load_cache(self):
+        if self._cache is not None:
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                self._cache = json_load(f)
+        except (OSError, ValueError):
+            self._cache = {}
+
+    def _save_cache(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json_dump(self._cache, f)
+            replace(tmp_path, self.cache_path)
+        except OSError as e:
+            stderr.write(f"Could not write save verification cache: {e}\n")
+
+    def verify(self, names: list[str]) -> dict[str, str | None]:
+        results = {}
+        pending = {}
+        with self._lock:
+            self._load_cache()
+            for name in names:
+                try:
+                    key = stat_key(lstat(join(self.save_dir, name)))
+                except FileNotFoundError:
+                    continue
+                cached = self._cache.get(name)
+                if cached is not None and cached[:3] == key:
+                    results[name] = cached[3]
+                else:
+                    pending[name] = key
+
+        if not pending:
+            return results
+
+        paths = [join(self.save_dir, name) for name in pending]
+        if len(paths) == 1:
+            errors = [verify_save(paths[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(paths))) as executor:
+                errors = list(executor.map(verify_save, paths))
+
+        with self._lock:
+            for (name, key), error in zip(pending.items(), errors):
+                self._cache[name] = key + [error]
+                results[name] = error
+            # Forget savegames that no longer exist
+            self._cache = {name: entry for name, entry in self._cache.items()
+                           if name in results or _exists(self.save_dir, name)}
+            self._save_cache()
+
+        return results
+
+    def verify_one(self, name: str) -> str | None:
+        return self.verify([name]).get(name)
+
+
+def _exists(save_dir: str, name: str) -> bool:
+    try:
+        lstat(join(save_dir, name))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def list_savegames(save_dir: str) -> list[str]:
+    res = []
+    with scandir(save_dir) as dirlist:
+        for dirent in dirlist:
+            if dirent.name.endswith(".zip") and dirent.name[0] != "." and dirent.is_file():
+                res.append((dirent.stat().st_mtime, dirent.name))
+    res.sort(reverse=True)
+    return [name for _, name in res]
+
+
+def main():
+    quarantine = "--quarantine" in argv[1:]
+    args = [arg for arg in argv[1:] if arg != "--quarantine"]
+    save_dir = args[0] if args else SAVE_DIR
+
+    # Only the save that will be loaded matters at startup, older ones are
+    # checked on demand (or come from the cache)
+    verifier = SaveVerifier(save_dir)
+    names = list_savegames(save_dir)
+    newest_valid = None
+    corrupt = []
+    for name in names:
+        error = verifier.verify_one(name)
+        if error is None:
+            newest_valid = name
+            break
+        stdout.write(f"Corrupt savegame {name}: {error}\n")
+        corrupt.append(name)
+
+    # Only move corrupt saves that --start-server-load-latest would otherwise
+    # pick. If nothing is valid, leave everything for the user to inspect.
+    if quarantine and newest_valid is not None:
+        for name in corrupt:
+            stdout.write(f"Moving {name} to {name}{CORRUPT_SUFFIX}\n")
+            rename(join(save_dir, name), join(save_dir, f"{name}{CORRUPT_SUFFIX}"))
+
+    stdout.write(f"Verified {len(corrupt) + (newest_valid is not None)} of {len(names)} savegames, "
+                 f"newest valid: {newest_valid}\n")
+
+
+if __name__ == "__main__":
+    main()
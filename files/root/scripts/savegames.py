@@ -0,0 +1,179 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from os import getenv, lstat, scandir, stat_result
+from os.path import join
+from select import select
+from sys import stderr
+from threading import Thread, Lock
+from traceback import print_exc
+from inotify import (Inotify, IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_MOVED_FROM,
+                     IN_MOVED_TO, IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_ISDIR)
+
+SAVE_DIR = getenv("SAVES")
+RESCAN_INTERVAL = float(getenv("SAVE_INDEX_RESCAN_INTERVAL", "300"))
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_DELETE_SELF | IN_MOVE_SELF
+
+
+@dataclass
+class SaveGameInfo():
+    name: str
+    mtime: datetime
+    size: int
+    path: str
+    stat: stat_result = field(repr=False)
+
+    def sort_key(self) -> tuple[float, str]:
+        return (-self.stat.st_mtime, self.name)
+
+
+def savegame_info_from_stat(save_dir: str, name: str, stat: stat_result) -> SaveGameInfo:
+    return SaveGameInfo(
+        name=name,
+        mtime=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+        size=stat.st_size,
+        stat=stat,
+        path=join(save_dir, name),
+    )
+
+
+def savegame_info_from_file(name: str, save_dir: str = SAVE_DIR) -> SaveGameInfo:
+    return savegame_info_from_stat(save_dir, name, lstat(join(save_dir, name)))
+
+
+def is_savegame_name(name: str) -> bool:
+    return name != "" and name[0] != "." and "/" not in name
+
+
+# Savegames in a directory, newest first. Kept up to date by inotify, with
+# a periodic rescan for changes inotify can not see (e.g. network storage).
+class SaveGameIndex:
+    _by_name: dict[str, SaveGameInfo]
+    _sorted: list[SaveGameInfo]
+
+    def __init__(self, save_dir: str = SAVE_DIR, rescan_interval: float = RESCAN_INTERVAL):
+        self.save_dir = save_dir
+        self.rescan_interval = rescan_interval
+        self._lock = Lock()
+        self._by_name = {}
+        self._sorted = []
+        self._keys = []
+        self._inotify = None
+        self._thread = None
+
+    def start(self):
+        try:
+            self._inotify = Inotify()
+            self._inotify.add_watch(self.save_dir, WATCH_MASK)
+        except OSError as e:
+            stderr.write(
+                f"Savegame index: inotify unavailable ({e}), rescanning every {self.rescan_interval}s\n")
+            if self._inotify is not None:
+                self._inotify.close()
+            self._inotify = None
+
+        self.rescan()
+        self._thread = Thread(name="Savegame index", target=self._run, daemon=True)
+        self._thread.start()
+
+    def _remove(self, name: str):
+        old = self._by_name.pop(name, None)
+        if old is None:
+            return
+        i = bisect_left(self._keys, old.sort_key())
+        del self._keys[i]
+        del self._sorted[i]
+
+    def _insert(self, info: SaveGameInfo):
+        self._remove(info.name)
+        key = info.sort_key()
+        i = bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._sorted.insert(i, info)
+        self._by_name[info.name] = info
+
+    def rescan(self):
+        infos = []
+        with scandir(self.save_dir) as dirlist:
+            for dirent in dirlist:
+                if not is_savegame_name(dirent.name) or not dirent.is_file():
+                    continue
+                try:
+                    stat = dirent.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                infos.append(savegame_info_from_stat(
+                    self.save_dir, dirent.name, stat))
+
+        infos.sort(key=SaveGameInfo.sort_key)
+        with self._lock:
+            self._sorted = infos
+            self._keys = [info.sort_key() for info in infos]
+            self._by_name = {info.name: info for info in infos}
+
+    def refresh(self, name: str):
+        if not is_savegame_name(name):
+            return
+        try:
+            info = savegame_info_from_file(name, self.save_dir)
+        except FileNotFoundError:
+            info = None
+
+        with self._lock:
+            if info is None:
+                self._remove(name)
+            else:
+                self._insert(info)
+
+    def get(self, name: str) -> SaveGameInfo | None:
+        with self._lock:
+            info = self._by_name.get(name)
+            if info is None:
+                info = self._by_name.get(f"{name}.zip")
+            return info
+
+    def list(self, name_filter: str | None = None) -> list[SaveGameInfo]:
+        with self._lock:
+            infos = list(self._sorted)
+        if name_filter:
+            name_filter = name_filter.lower()
+            infos = [info for info in infos if name_filter in info.name.lower()]
+        return infos
+
+    def newest(self) -> SaveGameInfo | None:
+        with self._lock:
+            if not self._sorted:
+                return None
+            return self._sorted[0]
+
+    def _run(self):
+        while True:
+            try:
+                if self._inotify is None:
+                    select([], [], [], self.rescan_interval)
+                    self.rescan()
+                    continue
+
+                readable, _, _ = select([self._inotify], [], [], self.rescan_interval)
+                if not readable:
+                    self.rescan()
+                    continue
+
+                rescan = False
+                names = set()
+                for event in self._inotify.read_events():
+                    if event.mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                        rescan = True
+                    elif event.name and not event.mask & IN_ISDIR:
+                        names.add(event.name)
+
+                if rescan:
+                    self.rescan()
+                else:
+                    for name in names:
+                        self.refresh(name)
+            except Exception:
+                print_exc()
+                select([], [], [], self.rescan_interval)
@@ -0,0 +1,90 @@
+from errno import EBADF, EINVAL, ENOSYS, ENOTTY, EOPNOTSUPP, EPERM, EXDEV, EMLINK
+from fcntl import ioctl
+from os import copy_file_range, fstat, link, unlink
+from typing import Callable
+
+# Linux _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+# Errors that mean "this strategy does not work here", not "the copy failed"
+UNSUPPORTED_ERRNOS = (EBADF, EINVAL, ENOSYS, ENOTTY,
+                      EOPNOTSUPP, EPERM, EXDEV, EMLINK)
+
+ProgressCallback = Callable[[int, int], None] | None
+
+
+def reflink_file(src: str, dst: str, progress: ProgressCallback = None):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def copy_range_file(src: str, dst: str, progress: ProgressCallback = None):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        total = fstat(fsrc.fileno()).st_size
+        copied = 0
+        while True:
+            count = copy_file_range(
+                fsrc.fileno(), fdst.fileno(), COPY_CHUNK_SIZE)
+            if count == 0:
+                break
+            copied += count
+            if progress is not None:
+                progress(copied, total)
+
+        if copied < total:
+            raise OSError(EINVAL, "copy_file_range stopped early", src)
+
+
+# Factorio replaces saves by renaming a fresh file over them and never
+# writes an existing save in place, so sharing the inode is safe
+def hardlink_file(src: str, dst: str, progress: ProgressCallback = None):
+    link(src, dst)
+
+
+def plain_copy_file(src: str, dst: str, progress: ProgressCallback = None):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        total = fstat(fsrc.fileno()).st_size
+        copied = 0
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            count = fsrc.readinto(buffer)
+            if not count:
+                break
+            fdst.write(view[:count])
+            copied += count
+            if progress is not None:
+                progress(copied, total)
+
+
+STAGING_STRATEGIES = {
+    "reflink": reflink_file,
+    "copy_file_range": copy_range_file,
+    "hardlink": hardlink_file,
+    "copy": plain_copy_file,
+}
+
+
+def stage_file(src: str, dst: str, progress: ProgressCallback = None,
+               strategies: list[str] | None = None) -> str:
+    if strategies is None:
+        strategies = list(STAGING_STRATEGIES)
+
+    for name in strategies[:-1]:
+        try:
+            STAGING_STRATEGIES[name](src, dst, progress)
+            return name
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            try:
+                unlink(dst)
+            except FileNotFoundError:
+                pass
+
+    name = strategies[-1]
+    STAGING_STRATEGIES[name](src, dst, progress)
+    return name
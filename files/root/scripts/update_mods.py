@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from hashlib import sha1
-from os import rename, scandir, unlink
+from os import getenv, rename, scandir, unlink
 from os.path import exists
-from sys import argv, stderr
+from sys import argv, exit, stderr
+from time import sleep, time
 from urllib.parse import quote as url_quote, urlencode
-from requests import get
-from json import loads as json_loads
+from requests import Response, Session
+from requests.exceptions import ConnectionError as RequestsConnectionError, ChunkedEncodingError, Timeout
+from requests.adapters import HTTPAdapter
+from json import loads as json_loads, dumps as json_dumps
 from dateutil import parser as dateutil_parser
+from modcache import MOD_CACHE_DIR, ModCache
 
 
 def myprint(text):
@@ -17,6 +23,31 @@ def myprint(text):
     stderr.flush()
 
 
+def retry_after_seconds(res: Response, attempt: int) -> float:
+    retry_after = res.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+        try:
+            delay = (parsedate_to_datetime(retry_after) - datetime.now(tz=timezone.utc)).total_seconds()
+            return min(max(delay, 0), MAX_RETRY_DELAY)
+        except (TypeError, ValueError):
+            pass
+    return min(RETRY_DELAY * (2 ** attempt), MAX_RETRY_DELAY)
+
+
+def http_get(url: str, **kwargs) -> Response:
+    for attempt in range(MAX_RETRIES):
+        res = SESSION.get(url, timeout=HTTP_TIMEOUT, **kwargs)
+        if res.status_code not in RETRY_STATUS_CODES or attempt + 1 >= MAX_RETRIES:
+            return res
+        delay = retry_after_seconds(res, attempt)
+        res.close()
+        sleep(delay)
+
+
 class FactorioVersion():
     version: list[int]
     version_str: str
@@ -118,7 +149,8 @@ class FactorioModRelease():
         info_json = raw["info_json"]
 
         self.factorio_version_constraints = []
-        for dep in info_json["dependencies"]:
+        # Releases from the mod list endpoint come without dependencies
+        for dep in info_json.get("dependencies", []):
             dep_split = dep.split(" ")
             invert = False
             if dep_split[0] == "!":
@@ -149,6 +181,22 @@ class FactorioModRelease():
         if self.file_name != f"{mod_name}_{self.version}.zip":
             raise ValueError("Invalid mod naming pattern")
 
+    # Releases as stored in the mod info cache, with the dependencies already
+    # reduced to their constraints on base
+    @classmethod
+    def from_compact(cls, data: list):
+        release = cls.__new__(cls)
+        release.version, release.file_name, release.url, release.sha1, released_at, constraints = data
+        release.released_at = datetime.fromtimestamp(released_at, tz=timezone.utc)
+        release.factorio_version_constraints = [
+            FactorioVersionConstraint(constraint, FactorioVersion(version), False) for constraint, version in constraints]
+        return release
+
+    def to_compact(self) -> list:
+        return [self.version, self.file_name, self.url, self.sha1, self.released_at.timestamp(),
+                [(constraint.constraint, constraint.version.version_str)
+                 for constraint in self.factorio_version_constraints]]
+
     def is_compatible_with(self, factorio_version: FactorioVersion) -> bool:
         for constraint in self.factorio_version_constraints:
             if not constraint.matches(factorio_version):
@@ -173,18 +221,43 @@ class FactorioMod():
         self.name = name
         self.info = None
         self.releases = None
+        self.latest_release = None
 
     def fetch_info(self) -> None:
         url = f"{MOD_BASE_URL}/api/mods/{url_quote(self.name)}/full"
 
-        with get(url) as info_res:
+        entry = CACHE.entries.get(self.name)
+        headers = {}
+        if entry is not None and "releases" in entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        with http_get(url, headers=headers) as info_res:
+            if info_res.status_code == 304 and headers:
+                CACHE.update(self.name, checked_at=time())
+                self.load_cached(entry)
+                return
             info_res.raise_for_status()
             self.info = json_loads(info_res.text)
+            etag = info_res.headers.get("ETag")
+            last_modified = info_res.headers.get("Last-Modified")
 
         self.releases = [FactorioModRelease(self.name,
                                             release) for release in self.info["releases"]]
         self.releases.sort(reverse=True)
 
+        releases = [release.to_compact() for release in self.releases]
+        CACHE.update(self.name, checked_at=time(), etag=etag, last_modified=last_modified,
+                     releases=releases, latest=releases[0] if releases else None)
+
+    def load_cached(self, entry: dict) -> None:
+        if "releases" in entry:
+            self.releases = [FactorioModRelease.from_compact(release) for release in entry["releases"]]
+        if entry.get("latest"):
+            self.latest_release = FactorioModRelease.from_compact(entry["latest"])
+
     def get_latest_version_for(self, factorio_version: FactorioVersion) -> FactorioModRelease:
         for release in self.releases:
             if release.is_compatible_with(factorio_version):
@@ -194,6 +267,13 @@ class FactorioMod():
     def is_release_installed(self, release: FactorioModRelease) -> bool:
         return exists(f"{MOD_DIR}/{release.file_name}")
 
+    # Whether the newest release is installed and made for this Factorio
+    # version, in which case there is nothing newer to look for
+    def is_latest_installed(self, factorio_version: FactorioVersion) -> bool:
+        release = self.latest_release
+        return release is not None and self.is_release_installed(release) and \
+            release.is_compatible_with(factorio_version)
+
     def uninstall_all_except(self, release: FactorioModRelease) -> None:
         prefix = f"{self.name}_"
         prefix_len = len(prefix)
@@ -211,43 +291,188 @@ class FactorioMod():
             myprint(f"Uninstall mod release: {dirent.name}")
             unlink(dirent.path)
 
-    def install_release(self, release: FactorioModRelease) -> None:
+    def download_release(self, release: FactorioModRelease) -> None:
+        if MOD_CACHE is None:
+            self.fetch_release(release)
+            return
+
+        # Servers updating to the same release wait for each other here
+        with MOD_CACHE.locked(release.sha1):
+            if self.install_cached_release(release):
+                return
+            self.fetch_release(release)
+            try:
+                MOD_CACHE.add(release.sha1, f"{MOD_DIR}/{release.file_name}.tmp")
+            except OSError as e:
+                myprint(f"    Could not add {release.file_name} to the mod cache: {e}")
+
+    def install_cached_release(self, release: FactorioModRelease) -> bool:
+        local_filename_tmp = f"{MOD_DIR}/{release.file_name}.tmp"
+        strategy = MOD_CACHE.install(release.sha1, local_filename_tmp)
+        if strategy is None:
+            return False
+
+        current_hash = sha1()
+        hash_file(local_filename_tmp, current_hash)
+        if current_hash.hexdigest() != release.sha1:
+            myprint(f"    Cached {release.file_name} is corrupt, downloading it again")
+            unlink(local_filename_tmp)
+            MOD_CACHE.discard(release.sha1)
+            return False
+
+        myprint(f"    Using cached {release.file_name} ({strategy})")
+        return True
+
+    def fetch_release(self, release: FactorioModRelease) -> None:
         params = {
             "token": TOKEN,
             "username": USERNAME,
         }
         url = f"{MOD_BASE_URL}{release.url}?{urlencode(params)}"
-        local_filename_target = f"{MOD_DIR}/{release.file_name}"
-        local_filename_tmp = f"{local_filename_target}.tmp"
+        local_filename_tmp = f"{MOD_DIR}/{release.file_name}.tmp"
 
-        expected_hash = release.sha1
-        current_hash = sha1()
+        for attempt in range(MAX_RETRIES):
+            try:
+                download_file(url, local_filename_tmp, release.sha1)
+                return
+            except (RequestsConnectionError, ChunkedEncodingError, Timeout) as e:
+                if attempt + 1 >= MAX_RETRIES:
+                    raise
+                myprint(f"    Download of {release.file_name} interrupted, resuming: {e}")
+                sleep(min(RETRY_DELAY * (2 ** attempt), MAX_RETRY_DELAY))
 
-        with get(url, stream=True) as r:
+    def install_release(self, release: FactorioModRelease) -> None:
+        local_filename_target = f"{MOD_DIR}/{release.file_name}"
+        rename(f"{local_filename_target}.tmp", local_filename_target)
+
+
+def hash_file(path: str, current_hash) -> int:
+    size = 0
+    with open(path, "rb") as fh:
+        while chunk := fh.read(HASH_READ_SIZE):
+            current_hash.update(chunk)
+            size += len(chunk)
+    return size
+
+
+# Downloads url to path and checks its SHA-1 on the way. Bytes already in
+# path from an interrupted download are hashed and only the rest is fetched.
+def download_file(url: str, path: str, expected_hash: str) -> None:
+    current_hash = sha1()
+    offset = hash_file(path, current_hash) if exists(path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with http_get(url, stream=True, headers=headers) as r:
+        if offset and r.status_code == 206 and \
+                r.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            mode = "ab"
+        elif offset and r.status_code == 416:
+            # Nothing left to fetch, the file is complete
+            mode = None
+        elif r.status_code == 200:
+            mode = "wb"
+            current_hash = sha1()
+            offset = 0
+        else:
             r.raise_for_status()
-            with open(local_filename_tmp, "wb") as fh:
-                for chunk in r.iter_content(chunk_size=4096):
+            raise ValueError(f"Unexpected response {r.status_code} for {url}")
+
+        if mode is not None:
+            # Larger reads for larger files, fewer and bigger writes
+            length = int(r.headers.get("Content-Length") or 0)
+            chunk_size = min(max(length // 16, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+            with open(path, mode) as fh:
+                for chunk in r.iter_content(chunk_size=chunk_size):
                     fh.write(chunk)
                     current_hash.update(chunk)
 
-        actual_hash = current_hash.hexdigest()
-
-        if actual_hash != expected_hash:
-            try:
-                unlink(local_filename_tmp)
-            except:
-                pass
-            raise ValueError(f"Hash mismatch for {url} - expected {expected_hash}, got {actual_hash}")
+    actual_hash = current_hash.hexdigest()
 
-        rename(local_filename_tmp, local_filename_target)
+    if actual_hash != expected_hash:
+        unlink(path)
+        if offset:
+            # The partial file was not what it claimed to be, start over
+            download_file(url, path, expected_hash)
+            return
+        raise ValueError(f"Hash mismatch for {url} - expected {expected_hash}, got {actual_hash}")
 
 
 FACTORIO_VERSION = None
 MOD_DIR = None
 USERNAME = None
 TOKEN = None
-
-MOD_BASE_URL = "https://mods.factorio.com"
+CACHE = None
+MOD_CACHE = None
+
+MOD_BASE_URL = getenv("MOD_PORTAL_URL", "https://mods.factorio.com")
+
+FETCH_WORKERS = int(getenv("UPDATE_MODS_WORKERS", "8"))
+# Mod names per list query, keeps URLs well below common length limits
+BULK_CHUNK_SIZE = 100
+HTTP_TIMEOUT = 30
+MAX_RETRIES = 5
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+RETRY_STATUS_CODES = (429, 503)
+
+DOWNLOAD_WORKERS = int(getenv("UPDATE_MODS_DOWNLOAD_WORKERS", "4"))
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+HASH_READ_SIZE = 1024 * 1024
+
+CACHE_NAME = ".update-mods-cache.json"
+CACHE_VERSION = 1
+CACHE_TTL = float(getenv("UPDATE_MODS_CACHE_TTL", "900"))
+
+# Shared by all threads, so connections to the mod portal are kept alive.
+# Metadata fetches and downloads use the same pool, so it must fit the larger.
+SESSION = Session()
+POOL_SIZE = max(FETCH_WORKERS, DOWNLOAD_WORKERS)
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+SESSION.mount("http://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+
+
+# Mod portal metadata by mod name. Entries checked within the TTL are used as
+# they are, older ones are revalidated with conditional requests.
+class ModInfoCache():
+    entries: dict[str, dict]
+
+    def __init__(self, mod_dir: str, ttl: float = CACHE_TTL) -> None:
+        self.path = f"{mod_dir}/{CACHE_NAME}"
+        self.ttl = ttl
+        self.entries = {}
+        self.changed = False
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json_loads(f.read())
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION and data.get("portal") == MOD_BASE_URL:
+            self.entries = data["mods"]
+
+    def save(self, names: list[str]) -> None:
+        # Mods no longer in mod-list.json are dropped
+        entries = {name: self.entries[name] for name in names if name in self.entries}
+        if not self.changed and len(entries) == len(self.entries):
+            return
+        data = {"version": CACHE_VERSION, "portal": MOD_BASE_URL, "mods": entries}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json_dumps(data, separators=(",", ":")))
+        rename(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if exists(self.path):
+            unlink(self.path)
+
+    def is_fresh(self, entry: dict | None, now: float) -> bool:
+        return entry is not None and 0 <= now - entry["checked_at"] < self.ttl
+
+    def update(self, name: str, **fields) -> None:
+        self.entries.setdefault(name, {}).update(fields)
+        self.changed = True
 
 
 def cleanup():
@@ -261,27 +486,89 @@ def cleanup():
         unlink(dirent.path)
 
 
-def check_mod(mod: FactorioMod):
+# Mod list queries with a namelist return each mod's releases, queries
+# without one only the latest release
+def latest_release_of(mod_name: str, result) -> FactorioModRelease | None:
+    if result.get("latest_release"):
+        return FactorioModRelease(mod_name, result["latest_release"])
+    releases = [FactorioModRelease(mod_name, release) for release in result.get("releases") or []]
+    if not releases:
+        return None
+    return max(releases, key=lambda release: release.released_at)
+
+
+def fetch_latest_releases(mods: list[FactorioMod], executor: ThreadPoolExecutor) -> None:
+    def fetch_chunk(chunk: list[FactorioMod]):
+        by_name = {mod.name: mod for mod in chunk}
+        params = {
+            "namelist": ",".join(by_name),
+            "page_size": "max",
+        }
+        url = f"{MOD_BASE_URL}/api/mods?{urlencode(params)}"
+        while url:
+            with http_get(url) as list_res:
+                list_res.raise_for_status()
+                mod_list = json_loads(list_res.text)
+
+            now = time()
+            for result in mod_list["results"]:
+                mod = by_name.get(result["name"])
+                if mod is None:
+                    continue
+                mod.latest_release = latest_release_of(mod.name, result)
+                if mod.latest_release is None:
+                    continue
+
+                # Cached releases without the latest one are outdated
+                latest = mod.latest_release.to_compact()
+                releases = CACHE.entries.get(mod.name, {}).get("releases")
+                if releases is not None and (not releases or releases[0][0] != latest[0]):
+                    CACHE.entries[mod.name] = {}
+                CACHE.update(mod.name, checked_at=now, latest=latest)
+
+            url = ((mod_list.get("pagination") or {}).get("links") or {}).get("next")
+
+    chunks = [mods[i:i + BULK_CHUNK_SIZE] for i in range(0, len(mods), BULK_CHUNK_SIZE)]
+    for fetch in [executor.submit(fetch_chunk, chunk) for chunk in chunks]:
+        try:
+            fetch.result()
+        except Exception as e:
+            myprint(f"Bulk mod info query failed, checking mods one by one: {e}")
+
+
+# Returns the release to update the mod to, if any
+def check_mod(mod: FactorioMod, fetch: Future | None) -> FactorioModRelease | None:
     myprint("")
     myprint(f"Checking {mod.name}...")
 
-    mod.fetch_info()
+    if fetch is not None:
+        fetch.result()
+
+    if mod.releases is None:
+        myprint(f"    Mod {mod.name} up to date at {mod.latest_release.version}!")
+        return None
+
     release = mod.get_latest_version_for(FACTORIO_VERSION)
 
     if not release:
         myprint(f"    Ignoring {mod.name}, no usable release found")
-        return
+        return None
 
     if mod.is_release_installed(release):
         myprint(f"    Mod {mod.name} up to date at {release.version}!")
-    else:
-        myprint(f"    Updating mod {mod.name} to {release.version}")
-        mod.install_release(release)
-        mod.uninstall_all_except(release)
+        return None
+
+    myprint(f"    Updating mod {mod.name} to {release.version}")
+    return release
 
 
 def main():
-    global FACTORIO_VERSION, MOD_DIR, USERNAME, TOKEN
+    global FACTORIO_VERSION, MOD_DIR, USERNAME, TOKEN, CACHE, MOD_CACHE
+    if len(argv) == 3 and argv[1] == "--clear-cache":
+        ModInfoCache(argv[2]).clear()
+        myprint("Mod info cache cleared")
+        return
+
     FACTORIO_VERSION = FactorioVersion(argv[1])
     MOD_DIR = argv[2]
     USERNAME = argv[3]
@@ -297,14 +584,72 @@ def main():
                 continue
             all_mods.append(FactorioMod(name))
 
-    cleanup()
+    CACHE = ModInfoCache(MOD_DIR)
+    CACHE.load()
+    if MOD_CACHE_DIR:
+        MOD_CACHE = ModCache(MOD_CACHE_DIR)
+    now = time()
+    stale_mods = []
+    for mod in all_mods:
+        entry = CACHE.entries.get(mod.name)
+        if CACHE.is_fresh(entry, now):
+            mod.load_cached(entry)
+        else:
+            stale_mods.append(mod)
 
     myprint("Checking all mod updates...")
-    for mod in all_mods:
-        check_mod(mod)
+    # Metadata is fetched concurrently, mods are checked and logged in order.
+    # Downloads start as soon as a mod is known to need one.
+    updates = []
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as downloader:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            # Only mods that might have a newer release need their full info
+            fetch_latest_releases(stale_mods, executor)
+            fetches = [None if mod.releases is not None or mod.is_latest_installed(FACTORIO_VERSION)
+                       else executor.submit(mod.fetch_info) for mod in all_mods]
+            try:
+                for mod, fetch in zip(all_mods, fetches):
+                    release = check_mod(mod, fetch)
+                    if release is not None:
+                        updates.append((mod, release, downloader.submit(mod.download_release, release)))
+            except BaseException:
+                for _, _, download in updates:
+                    download.cancel()
+                raise
+            finally:
+                for fetch in fetches:
+                    if fetch is not None:
+                        fetch.cancel()
+                CACHE.save([mod.name for mod in all_mods])
+
+        failed = 0
+        for mod, release, download in updates:
+            try:
+                download.result()
+            except Exception as e:
+                myprint(f"Download of {release.file_name} failed: {e}")
+                failed += 1
+
     myprint("")
+    if failed > 0:
+        # Partial downloads are kept and resumed by the next run
+        myprint(f"{failed} of {len(updates)} downloads failed, no mods were updated")
+        exit(1)
+
+    # Only swap mods in once every download is complete, so the server never
+    # starts with a partial update
+    for mod, release, _ in updates:
+        myprint(f"Installing {release.file_name}")
+        mod.install_release(release)
+    for mod, release, _ in updates:
+        mod.uninstall_all_except(release)
     myprint("Update check complete")
 
+    if MOD_CACHE is not None:
+        removed, freed = MOD_CACHE.evict()
+        if removed > 0:
+            myprint(f"Evicted {removed} mods ({freed / 1024 / 1024:.1f} MiB) from the mod cache")
+
     cleanup()
 
 
@@ -5,6 +5,10 @@ echo ' 118.214 Info ServerMultiplayerManager.cpp:795: updateTick(176585302) chan
 sleep 1
 echo ' 118.214 Info ServerMultiplayerManager.cpp:944: updateTick(176585302) received stateChanged peerID(2) oldState(Ready) newState(ConnectedWaitingForMap)'
 sleep 1
+echo ' 118.215 Info AppManagerStates.cpp:1843: Saving to _autosave1 (non-blocking).'
+sleep 1
+echo ' 121.213 Info AppManagerStates.cpp:1864: Saving finished'
+sleep 1
 echo ' 121.214 Info ServerMultiplayerManager.cpp:1005: UpdateTick(176585302) Serving map(/factorio/temp/mp-save-1.zip) for peer(2) size(169444468) auxiliary(317) crc(3774189260)'
 sleep 1
 echo ' 121.214 Info ServerMultiplayerManager.cpp:795: updateTick(176585302) changing state from(InGameSavingMap) to(InGame)'
@@ -19,5 +23,11 @@ echo ' 142.476 Info ServerMultiplayerManager.cpp:944: updateTick(176585556) rece
 sleep 1
 echo ' 142.526 Info ServerMultiplayerManager.cpp:944: updateTick(176585556) received stateChanged peerID(2) oldState(WaitingForCommandToStartSendingTickClosures) newState(InGame)'
 sleep 1
+echo '2024-05-01 12:00:02 [JOIN] Player1 joined the game'
+sleep 1
+echo '2024-05-01 12:00:10 [CHAT] Player1: hello: world'
+sleep 1
+echo '2024-05-01 12:15:34 [LEAVE] Player1 left the game'
+sleep 1
 echo ' 1116.526 Info ServerSynchronizer.cpp:623: nextHeartbeatSequenceNumber(66276) removing peer(2).'
 sleep 1
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Archives a sequence of synthetic saves and reports the bytes stored, the
+# dedup ratio and the store and restore throughput. Each save rewrites a
+# share of the previous save's members, like autosaves of a running map.
+#
+#   tests/bench/bench_archive.py [members] [member size in KiB] [saves]
+
+from os import urandom, utime
+from os.path import abspath, dirname, join
+from random import Random
+from sys import argv, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+
+path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))), "files", "root", "scripts"))
+
+from savearchive import SaveArchive  # noqa: E402
+from savegames import savegame_info_from_file  # noqa: E402
+
+CHANGED_SHARES = (0.05, 0.25, 1.0)
+BASE_MTIME = 1_700_000_000
+
+
+# Member data is random, as level.dat members are already deflated
+def write_save(save_path: str, members: list[bytes], number: int):
+    with ZipFile(save_path, "w", ZIP_STORED) as zf:
+        zf.writestr(ZipInfo("save/control.lua", (2024, 5, 1, 12, number // 60 % 60, number % 60)),
+                    b"-- control\n" * 100)
+        for i, data in enumerate(members):
+            zf.writestr(ZipInfo(f"save/level.dat{i}", (2024, 5, 1, 12, number // 60 % 60, number % 60)), data)
+    mtime = BASE_MTIME + number * 300
+    utime(save_path, (mtime, mtime))
+
+
+def run(tmp: str, member_count: int, member_size: int, save_count: int, changed: float):
+    rng = Random(0)
+    archive = SaveArchive(join(tmp, "archive"), keep=save_count)
+    members = [urandom(member_size) for _ in range(member_count)]
+    save_path = join(tmp, "world.zip")
+
+    new_per_save = []
+    store_time = 0.0
+    logical = 0
+    ids = []
+    for number in range(save_count):
+        if number > 0:
+            for i in rng.sample(range(member_count), max(round(member_count * changed), 1)):
+                members[i] = urandom(member_size)
+        write_save(save_path, members, number)
+        savegame = savegame_info_from_file("world.zip", tmp)
+        start = perf_counter()
+        archive_id, _, new_bytes = archive.store(savegame)
+        store_time += perf_counter() - start
+        new_per_save.append(new_bytes)
+        logical += savegame.size
+        ids.append(archive_id)
+
+    restored = join(tmp, "restored.zip")
+    start = perf_counter()
+    for archive_id in ids:
+        archive.restore(archive_id, restored)
+    restore_time = perf_counter() - start
+
+    _, _, physical = archive.stats()
+    later = sum(new_per_save[1:]) / max(len(new_per_save) - 1, 1)
+    print(f"  {changed * 100:3.0f}% of members changed per save: {logical / 1e6:.0f} MB in {physical / 1e6:.0f} MB "
+          f"(dedup ratio {logical / physical:.1f}x, {later / 1e6:.1f} MB new per later save), "
+          f"store {logical / store_time / 1e6:.0f} MB/s, restore {logical / restore_time / 1e6:.0f} MB/s")
+
+
+def main():
+    member_count = int(argv[1]) if len(argv) > 1 else 40
+    member_size = int(argv[2]) * 1024 if len(argv) > 2 else 1024 * 1024
+    save_count = int(argv[3]) if len(argv) > 3 else 20
+    print(f"{save_count} saves of {member_count} members of {member_size // 1024} KiB:")
+    for changed in CHANGED_SHARES:
+        with TemporaryDirectory() as tmp:
+            run(tmp, member_count, member_size, save_count, changed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Times fix_ownership.py against chown -R on a synthetic tree of empty files,
+# both run as new processes with a warm page cache. Changing owners needs
+# root, without it only the runs with nothing to change are timed.
+#
+#   tests/bench/bench_ownership.py [directories] [files per directory]
+
+from os import getgid, getuid, lchown, makedirs, mknod
+from os.path import abspath, dirname, join
+from subprocess import run
+from sys import argv, executable
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+FIX_OWNERSHIP = join(dirname(dirname(dirname(abspath(__file__)))), "files", "root", "scripts", "fix_ownership.py")
+
+NOBODY = 65534
+
+
+def make_tree(root: str, dirs: int, files: int):
+    for i in range(dirs):
+        path = join(root, f"dir{i // 100}", f"dir{i}")
+        makedirs(path)
+        for j in range(files):
+            mknod(join(path, f"file{j}"))
+
+
+def timed(label: str, command: list[str]):
+    start = perf_counter()
+    proc = run(command, capture_output=True, text=True, check=True)
+    output = proc.stdout.strip()
+    print(f"  {label}: {perf_counter() - start:.2f}s" + (f" ({output})" if output else ""))
+
+
+def main():
+    dirs = int(argv[1]) if len(argv) > 1 else 1000
+    files = int(argv[2]) if len(argv) > 2 else 1000
+    uid, gid = getuid(), getgid()
+
+    with TemporaryDirectory(dir=".") as root:
+        make_tree(root, dirs, files)
+        print(f"{dirs * files} files in {dirs} directories:")
+
+        def fix(label: str, owner: tuple[int, int] = (uid, gid)):
+            timed(label, [executable, FIX_OWNERSHIP, str(owner[0]), str(owner[1]), root])
+
+        def chown(label: str, owner: tuple[int, int] = (uid, gid)):
+            timed(label, ["chown", "-R", "-h", f"{owner[0]}:{owner[1]}", root])
+
+        chown("chown -R, nothing to change")
+        fix("fix_ownership.py without state, nothing to change")
+        fix("fix_ownership.py with state")
+        if uid != 0:
+            return
+
+        path = join(root, "dir0", "dir0")
+        mknod(join(path, "new-file"))
+        makedirs(join(root, "dir0", "new-dir"))
+        for new in (join(path, "new-file"), join(root, "dir0", "new-dir")):
+            lchown(new, NOBODY, NOBODY)
+        fix("fix_ownership.py with state, 2 new entries owned by nobody")
+
+        chown("chown -R, uid change", (NOBODY, NOBODY))
+        chown("chown -R, back to the original owner", (uid, gid))
+        fix("fix_ownership.py, uid change", (NOBODY, NOBODY))
+
+
+if __name__ == "__main__":
+    main()
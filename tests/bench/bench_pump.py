@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Times how fast the supervisor passes a burst of server log lines through to
+# its own output, and how often it wakes up while the server is idle. Lines
+# are either plain, or three in four are events handlers act on.
+#
+#   tests/bench/bench_pump.py [scripts dir] [lines] [runs]
+#
+# To compare with an older tree:
+#   git archive <rev> files/root/scripts | tar -x -C /tmp/old
+#   tests/bench/bench_pump.py /tmp/old/files/root/scripts
+
+from glob import glob
+from os import chmod, environ, getuid, setresgid, setresuid, sysconf
+from os.path import abspath, dirname, join
+from shutil import copytree
+from statistics import median
+from subprocess import Popen, PIPE, DEVNULL
+from sys import argv
+from tempfile import TemporaryDirectory
+from threading import Timer
+from time import sleep, time
+
+SCRIPTS_DIR = join(dirname(dirname(dirname(abspath(__file__)))), "files", "root", "scripts")
+
+NOBODY = 65534
+IDLE_SECONDS = 2
+
+PLAIN_LINE = " 118.216 Verbose CommandLineMultiplayer.cpp:1210: Some other message that is not an event"
+EVENT_LINES = [
+    " 118.214 Info ServerMultiplayerManager.cpp:944: updateTick(176585302) received stateChanged "
+    "peerID(2) oldState(Ready) newState(ConnectedWaitingForMap)",
+    " 118.215 Info ServerSynchronizer.cpp:604: nextHeartbeatSequenceNumber(2117) adding peer(3)",
+    "2024-05-01 12:00:00 [CHAT] Player1: hello there",
+]
+MIXES = {
+    "plain": [PLAIN_LINE] * 4,
+    "events": EVENT_LINES + [PLAIN_LINE],
+}
+
+FAKE_SERVER = """
+import sys, time
+lines = int(sys.argv[1])
+block = "".join(f"{line}\\n" for line in sys.argv[2:]) * 256
+print(f"   0.000 Info start {time.time()!r}", flush=True)
+for _ in range(lines // 1024):
+    sys.stdout.write(block)
+print("   0.000 Info done", flush=True)
+time.sleep(30)
+"""
+
+
+# The supervisor only switches users when started as root, and there is no
+# factorio user outside of the image. Everything it runs is copied to tmp,
+# which nobody can read.
+def drop_root():
+    if getuid() == 0:
+        setresgid(NOBODY, NOBODY, NOBODY)
+        setresuid(NOBODY, NOBODY, NOBODY)
+
+
+# Voluntary context switches and CPU seconds of all threads of a process
+def activity(pid: int) -> tuple[int, float]:
+    switches = 0
+    for path in glob(f"/proc/{pid}/task/*/status"):
+        with open(path) as f:
+            for line in f:
+                if line.startswith("voluntary_ctxt_switches:"):
+                    switches += int(line.split()[1])
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return switches, (int(fields[11]) + int(fields[12])) / sysconf("SC_CLK_TCK")
+
+
+def measure(scripts_dir: str, tmp: str, lines: int, mix: list[str]) -> tuple[float, int, float, float]:
+    chmod(tmp, 0o777)
+    server = join(tmp, "server.py")
+    with open(server, "w") as f:
+        f.write(FAKE_SERVER)
+
+    scripts = copytree(scripts_dir, join(tmp, "scripts"))
+    env = dict(environ, SAVES=tmp)
+    proc = Popen([join(scripts, "cli_handler.py"), "python3", server, str(lines), *mix],
+                 stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL, env=env, cwd=tmp, preexec_fn=drop_root)
+    watchdog = Timer(120, proc.kill)
+    watchdog.start()
+    try:
+        received = 0
+        started = None
+        for line in proc.stdout:
+            if started is None and b"Info start " in line:
+                started = float(line.rsplit(b" ", 1)[1])
+                continue
+            if line == b"   0.000 Info done\n":
+                elapsed = time() - started
+                break
+            received += len(line)
+        else:
+            raise RuntimeError("The server output ended early")
+
+        switches, cpu = activity(proc.pid)
+        sleep(IDLE_SECONDS)
+        idle_switches, idle_cpu = activity(proc.pid)
+        return received / elapsed, lines / elapsed, (idle_switches - switches) / IDLE_SECONDS, \
+            (idle_cpu - cpu) / IDLE_SECONDS
+    finally:
+        watchdog.cancel()
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    scripts_dir = abspath(argv[1]) if len(argv) > 1 else SCRIPTS_DIR
+    lines = int(argv[2]) if len(argv) > 2 else 1024 * 1024
+    runs = int(argv[3]) if len(argv) > 3 else 3
+    print(f"{scripts_dir}, {lines} lines, median of {runs} runs:")
+    for name, mix in MIXES.items():
+        results = []
+        for _ in range(runs):
+            with TemporaryDirectory() as tmp:
+                results.append(measure(scripts_dir, tmp, lines, mix))
+        byte_rates, line_rates, wakeups, cpu = zip(*results)
+        print(f"  {name}: {median(byte_rates) / 1e6:.1f} MB/s, {median(line_rates) / 1000:.0f}k lines/s, "
+              f"idle {median(wakeups):.1f} wakeups/s and {median(cpu) * 100:.1f}% CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Times !restart from the old server receiving SIGINT to the first log line
+# of the new server reaching the supervisor's output, against a fake server.
+#
+#   tests/bench/bench_restart.py [scripts dir] [runs]
+#
+# To compare with an older tree:
+#   git archive <rev> files/root/scripts | tar -x -C /tmp/old
+#   tests/bench/bench_restart.py /tmp/old/files/root/scripts
+
+from os import chmod, environ, getuid, setresgid, setresuid
+from os.path import abspath, dirname, join
+from shutil import copytree
+from statistics import median
+from subprocess import Popen, PIPE, DEVNULL
+from sys import argv
+from tempfile import TemporaryDirectory
+from threading import Timer
+from time import time
+
+SCRIPTS_DIR = join(dirname(dirname(dirname(abspath(__file__)))), "files", "root", "scripts")
+
+NOBODY = 65534
+
+FAKE_SERVER = """
+import os, signal, sys, time
+state = sys.argv[1]
+
+def stop(*args):
+    with open(state + ".sigint", "w") as f:
+        f.write(repr(time.time()))
+    sys.exit(0)
+
+signal.signal(signal.SIGINT, stop)
+if os.path.exists(state + ".sigint"):
+    print("   0.000 Info restarted", flush=True)
+else:
+    print("2024-05-01 12:00:00 [CHAT] <server>: !restart", flush=True)
+time.sleep(30)
+"""
+
+
+# The supervisor only switches users when started as root, and there is no
+# factorio user outside of the image. Everything it runs is copied to tmp,
+# which nobody can read.
+def drop_root():
+    if getuid() == 0:
+        setresgid(NOBODY, NOBODY, NOBODY)
+        setresuid(NOBODY, NOBODY, NOBODY)
+
+
+def measure(scripts_dir: str, tmp: str) -> float:
+    chmod(tmp, 0o777)
+    state = join(tmp, "state")
+    server = join(tmp, "server.py")
+    with open(server, "w") as f:
+        f.write(FAKE_SERVER)
+
+    scripts = copytree(scripts_dir, join(tmp, "scripts"))
+    env = dict(environ, SAVES=tmp)
+    proc = Popen([join(scripts, "cli_handler.py"), "python3", server, state],
+                 stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL, env=env, cwd=tmp, preexec_fn=drop_root)
+    watchdog = Timer(30, proc.kill)
+    watchdog.start()
+    try:
+        for line in proc.stdout:
+            if b"Info restarted" in line:
+                arrived = time()
+                break
+        else:
+            raise RuntimeError("The server was not restarted")
+        with open(f"{state}.sigint") as f:
+            return arrived - float(f.read())
+    finally:
+        watchdog.cancel()
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    scripts_dir = abspath(argv[1]) if len(argv) > 1 else SCRIPTS_DIR
+    runs = int(argv[2]) if len(argv) > 2 else 10
+    latencies = []
+    for _ in range(runs):
+        with TemporaryDirectory() as tmp:
+            latencies.append(measure(scripts_dir, tmp))
+    print(f"{scripts_dir}: restart to first line, median {median(latencies) * 1000:.0f}ms, "
+          f"min {min(latencies) * 1000:.0f}ms, max {max(latencies) * 1000:.0f}ms over {runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Times each staging strategy copying one large file, and the fsync after it,
+# on the filesystem of the given directory. The source stays in the page
+# cache, as a save that was just written would.
+#
+#   tests/bench/bench_staging.py [directory] [size in MiB] [runs]
+
+from os import fsync, unlink, urandom
+from os.path import abspath, dirname, join
+from statistics import median
+from sys import argv, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))), "files", "root", "scripts"))
+
+from staging import STAGING_STRATEGIES, UNSUPPORTED_ERRNOS  # noqa: E402
+
+WRITE_SIZE = 16 * 1024 * 1024
+
+
+def make_file(path: str, size: int):
+    # Random data, so nothing along the way can compress it
+    data = urandom(WRITE_SIZE)
+    with open(path, "wb") as f:
+        for _ in range(size // WRITE_SIZE):
+            f.write(data)
+        fsync(f.fileno())
+
+
+def measure(strategy, src: str, dst: str) -> tuple[float, float]:
+    start = perf_counter()
+    strategy(src, dst)
+    copied = perf_counter()
+    with open(dst, "rb") as f:
+        fsync(f.fileno())
+    synced = perf_counter()
+    unlink(dst)
+    return copied - start, synced - copied
+
+
+def main():
+    directory = argv[1] if len(argv) > 1 else "."
+    size = int(argv[2]) * 1024 * 1024 if len(argv) > 2 else 1024 * 1024 * 1024
+    runs = int(argv[3]) if len(argv) > 3 else 3
+
+    with TemporaryDirectory(dir=directory) as tmp:
+        src = join(tmp, "save.zip")
+        dst = join(tmp, "staged.zip")
+        make_file(src, size)
+        print(f"{abspath(directory)}, {size // 1024 // 1024} MiB, median of {runs} runs:")
+        for name, strategy in STAGING_STRATEGIES.items():
+            try:
+                results = [measure(strategy, src, dst) for _ in range(runs)]
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                print(f"  {name}: unsupported ({e.strerror})")
+                continue
+            copy, sync = (median(values) for values in zip(*results))
+            # Hardlinks and reflinks copy no data
+            rate = f" ({size / (copy + sync) / 1e9:.2f} GB/s)" if copy + sync >= 0.01 else ""
+            print(f"  {name}: {copy:.3f}s, then {sync:.3f}s fsync{rate}")
+
+
+if __name__ == "__main__":
+    main()
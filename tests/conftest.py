@@ -0,0 +1,42 @@
+from os.path import abspath, dirname, join
+from re import findall, MULTILINE
+from sys import path
+
+import pytest
+
+SCRIPTS_DIR = join(dirname(dirname(abspath(__file__))), "files", "root", "scripts")
+TESTER_PATH = join(SCRIPTS_DIR, "..", "tester.sh")
+path.insert(0, SCRIPTS_DIR)
+
+from handlers.events import LogEventBus  # noqa: E402
+from metrics import MetricsRegistry  # noqa: E402
+
+
+# The log lines files/root/tester.sh prints
+def read_tester_lines() -> list[str]:
+    with open(TESTER_PATH) as f:
+        return findall(r"^echo '(.*)'$", f.read(), MULTILINE)
+
+
+# The parts of FactorioGame that log handlers use, without a server process
+class FakeGame:
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+        self.events = LogEventBus()
+        self.stderr = []
+
+    def write_stderr(self, text: str):
+        self.stderr.append(text)
+
+    def register_event_handler(self, handler):
+        for event_type, callback in handler.event_handlers().items():
+            self.events.subscribe(event_type, callback)
+
+    def feed(self, lines):
+        for line in lines:
+            self.events.handle_line(line)
+
+
+@pytest.fixture
+def game():
+    return FakeGame()
@@ -0,0 +1,96 @@
+from threading import Event
+
+import pytest
+
+from handlers.chat_commands import ChatCommandHandler, TokenBucket, RATE_LIMIT_BURST
+from handlers.commands.base import ChatCommand
+from profiling import HandlerProfiler
+
+
+class FakePlayer:
+    def __init__(self, name: str):
+        self.name = name
+        self.messages = []
+
+    def send_message(self, message: str, private: bool = False):
+        self.messages.append(message)
+
+
+class BlockingCommand(ChatCommand):
+    concurrency_group = "server"
+
+    def __init__(self):
+        self.started = Event()
+        self.release = Event()
+        self.runs = []
+
+    def run(self, player, args):
+        self.runs.append(args)
+        self.started.set()
+        self.release.wait(5)
+
+    def names(self) -> list[str]:
+        return ["block"]
+
+
+@pytest.fixture
+def handler(game):
+    game.profiler = HandlerProfiler(False)
+    handler = ChatCommandHandler(game, workers=1)
+    command = BlockingCommand()
+    handler.register_command(command)
+    yield handler, command
+    command.release.set()
+    handler.executor.shutdown(wait=True)
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(0.0, burst=2, rate=0.5)
+    assert bucket.take(0.0)
+    assert bucket.take(0.0)
+    assert not bucket.take(1.0)
+    assert bucket.take(2.0)
+    # Never holds more than the burst
+    bucket.refill(100.0)
+    assert bucket.tokens == 2
+
+
+def test_rate_limit_is_per_player(handler):
+    handler, command = handler
+    alice, bob = FakePlayer("alice"), FakePlayer("bob")
+    for _ in range(RATE_LIMIT_BURST + 1):
+        handler.handle_chat(alice, "!unknown")
+    handler.handle_chat(bob, "!unknown")
+
+    assert alice.messages[-1] == "Too many commands, alice. Slow down!"
+    assert alice.messages[:-1] == ["Unknown command: unknown"] * RATE_LIMIT_BURST
+    assert bob.messages == ["Unknown command: unknown"]
+
+
+def test_one_command_per_group_in_flight(handler):
+    handler, command = handler
+    alice, bob = FakePlayer("alice"), FakePlayer("bob")
+    handler.handle_chat(alice, "!block")
+    assert command.started.wait(5)
+    handler.handle_chat(bob, "!block other")
+
+    assert bob.messages == ["Command block can not run right now, another server command is in progress"]
+    command.release.set()
+    handler.executor.shutdown(wait=True)
+    assert command.runs == [[]]
+
+
+def test_duplicate_pending_commands_collapse(handler):
+    handler, command = handler
+    command.concurrency_group = None
+    alice, bob = FakePlayer("alice"), FakePlayer("bob")
+    handler.handle_chat(alice, "!block first")
+    assert command.started.wait(5)
+    # The only worker is busy, so these wait in the queue
+    handler.handle_chat(alice, "!block second")
+    handler.handle_chat(bob, "!block second")
+
+    assert bob.messages == ["Command block is already queued"]
+    command.release.set()
+    handler.executor.shutdown(wait=True)
+    assert command.runs == [["first"], ["second"]]
@@ -0,0 +1,128 @@
+from os import close, fdopen, pipe, write
+from statistics import median
+from sys import executable
+from threading import Event, Thread
+from time import perf_counter, sleep
+
+import cli_handler
+from cli_handler import FactorioGame
+from handlers.base import ConsoleLineHandler
+
+LINES = 100000
+ROUND_TRIPS = 5
+
+ECHO_SERVER = f"""
+import sys
+for _ in range({ROUND_TRIPS}):
+    print("echo " + sys.stdin.readline(), end="", flush=True)
+"""
+
+
+class LineRecorder(ConsoleLineHandler):
+    def __init__(self, game):
+        super().__init__(game)
+        self.lines = []
+        self.seen = Event()
+
+    def handle_line(self, line: str):
+        self.lines.append((perf_counter(), line))
+        self.seen.set()
+
+
+def test_pump_passes_every_line(tmp_path, monkeypatch):
+    out_path = tmp_path / "stdout.log"
+    script = f"import sys\nsys.stdout.writelines(f'{{i:8d}} Info line\\n' for i in range({LINES}))"
+    with open(out_path, "wb") as out:
+        monkeypatch.setattr(cli_handler, "stdout", out)
+        game = FactorioGame([executable, "-c", script])
+        recorder = LineRecorder(game)
+        game.console_line_handlers.append(recorder)
+        game.run()
+
+    assert [line for _, line in recorder.lines] == [f"{i:8d} Info line\n" for i in range(LINES)]
+    assert out_path.read_bytes().count(b"\n") == LINES
+
+
+def test_console_lines_are_dispatched_without_polling():
+    read_fd, write_fd = pipe()
+    cmdin = fdopen(read_fd, "rb")
+    game = FactorioGame([executable, "-c", ECHO_SERVER], cmdin=cmdin)
+    recorder = LineRecorder(game)
+    game.console_line_handlers.append(recorder)
+    runner = Thread(target=game.run)
+    runner.start()
+
+    latencies = []
+    try:
+        for i in range(ROUND_TRIPS):
+            recorder.seen.clear()
+            sent = perf_counter()
+            write(write_fd, f"line {i}\n".encode())
+            assert recorder.seen.wait(5)
+            latencies.append(recorder.lines[-1][0] - sent)
+    finally:
+        close(write_fd)
+        runner.join(10)
+        cmdin.close()
+
+    assert not runner.is_alive()
+    assert [line for _, line in recorder.lines] == [f"echo line {i}\n" for i in range(ROUND_TRIPS)]
+    # The old loop polled every 100ms, in both directions
+    assert median(latencies) < 0.05
+
+
+FAKE_SERVER = """
+import signal, sys, time
+
+def stop(*args):
+    # Like Factorio, log while shutting down and take a while to exit
+    print("   1.000 Info stopping", flush=True)
+    time.sleep(0.5)
+    sys.exit(0)
+
+signal.signal(signal.SIGINT, stop)
+print("   0.000 Info started", flush=True)
+time.sleep(30)
+"""
+STARTED = "   0.000 Info started\n"
+STOPPING = "   1.000 Info stopping\n"
+
+
+def wait_for_starts(recorder: LineRecorder, count: int) -> bool:
+    deadline = perf_counter() + 5
+    while perf_counter() < deadline:
+        if [line for _, line in recorder.lines].count(STARTED) >= count:
+            return True
+        sleep(0.01)
+    return False
+
+
+def test_restart_respawns_with_the_same_handlers(tmp_path, monkeypatch):
+    with open(tmp_path / "stdout.log", "wb") as out, open(tmp_path / "stderr.log", "wb") as err:
+        monkeypatch.setattr(cli_handler, "stdout", out)
+        monkeypatch.setattr(cli_handler, "stderr", err)
+        game = FactorioGame([executable, "-c", FAKE_SERVER])
+        recorder = LineRecorder(game)
+        game.console_line_handlers.append(recorder)
+        runner = Thread(target=game.run)
+        runner.start()
+
+        hook_calls = []
+        try:
+            assert wait_for_starts(recorder, 1)
+            first = game.process
+            game.restart(lambda: hook_calls.append(game.process))
+            assert wait_for_starts(recorder, 2)
+            second = game.process
+        finally:
+            game.shutdown()
+            runner.join(10)
+
+    assert not runner.is_alive()
+    assert second is not first
+    assert hook_calls == [None]
+    assert [line for _, line in recorder.lines] == [STARTED, STOPPING, STARTED, STOPPING]
+    # Timed from the new server, not from the old one logging its shutdown
+    assert b"Restarting server...\nServer restarted, first log line after " in \
+        (tmp_path / "stderr.log").read_bytes()
+    assert "factorio_server_restarts_total 1" in game.metrics.render()
@@ -0,0 +1,34 @@
+from conftest import read_tester_lines
+from handlers.events import (LogEventClassifier, ChatEvent, GameStateChangeEvent, MapServedEvent,
+                             PeerAddedEvent, PeerRemovedEvent, PeerStateChangeEvent, PlayerJoinEvent,
+                             PlayerLeaveEvent, SaveFinishedEvent, SaveStartedEvent)
+
+
+def test_classifies_tester_script():
+    events = [LogEventClassifier().classify(line) for line in read_tester_lines()]
+
+    assert [type(event) for event in events] == [
+        PeerAddedEvent, GameStateChangeEvent, PeerStateChangeEvent, SaveStartedEvent,
+        SaveFinishedEvent, MapServedEvent, GameStateChangeEvent, PeerStateChangeEvent,
+        PeerStateChangeEvent, PeerStateChangeEvent, PeerStateChangeEvent, PeerStateChangeEvent,
+        PlayerJoinEvent, ChatEvent, PlayerLeaveEvent, PeerRemovedEvent,
+    ]
+    assert events[3].name == "_autosave1"
+    assert (events[5].peer_id, events[5].size) == (2, 169444468)
+    assert (events[13].player, events[13].message) == ("Player1", "hello: world")
+
+
+def test_tester_uptimes_are_monotonic():
+    events = [LogEventClassifier().classify(line) for line in read_tester_lines()]
+    uptimes = [event.uptime for event in events if event.uptime is not None]
+    assert uptimes == sorted(uptimes)
+
+
+def test_ignores_unsubscribed_and_unknown_lines():
+    classifier = LogEventClassifier({SaveFinishedEvent})
+    assert classifier.markers == (b"AppManagerStates.cpp",)
+    assert classifier.classify(" 1.000 Info AppManagerStates.cpp:1843: Saving to x (blocking).") is None
+    assert classifier.classify(" 1.000 Info Other.cpp:1: Saving finished") is None
+    assert classifier.classify("garbage") is None
+    event = classifier.classify(" 1.500 Info AppManagerStates.cpp:1864: Saving finished")
+    assert isinstance(event, SaveFinishedEvent) and event.uptime == 1.5
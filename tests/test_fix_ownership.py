@@ -0,0 +1,84 @@
+from json import load as json_load, dump as json_dump
+from os import getgid, getuid, makedirs
+from os.path import join
+
+import fix_ownership
+from fix_ownership import OwnershipFixer, STATE_NAME
+
+
+def make_tree(root):
+    for d in range(3):
+        makedirs(join(root, f"dir{d}", "sub"))
+        for f in range(4):
+            with open(join(root, f"dir{d}", f"file{f}"), "w") as fh:
+                fh.write("x")
+
+
+def record_chown(monkeypatch) -> list:
+    calls = []
+    real_run = fix_ownership.run
+
+    def spy(args, *rest, **kwargs):
+        calls.append(args)
+        return real_run(args, *rest, **kwargs)
+    monkeypatch.setattr(fix_ownership, "run", spy)
+    return calls
+
+
+def test_cold_state_uses_chown_r(tmp_path, monkeypatch):
+    calls = record_chown(monkeypatch)
+    root = str(tmp_path)
+    make_tree(root)
+
+    fixer = OwnershipFixer(root, getuid(), getgid(), workers=2)
+    result = fixer.run()
+
+    assert fixer.full
+    assert calls == [["chown", "-R", "-h", f"{getuid()}:{getgid()}", root]]
+    assert result.errors == 0
+    assert result.dirs == 7
+    assert result.entries == 7 + 12
+    with open(join(root, STATE_NAME)) as f:
+        assert len(json_load(f)["dirs"]) == 7
+
+
+def test_matching_state_walks_incrementally(tmp_path, monkeypatch):
+    calls = record_chown(monkeypatch)
+    root = str(tmp_path)
+    make_tree(root)
+    OwnershipFixer(root, getuid(), getgid(), workers=2).run()
+    calls.clear()
+
+    with open(join(root, "dir1", "new"), "w") as fh:
+        fh.write("x")
+    fixer = OwnershipFixer(root, getuid(), getgid(), workers=2)
+    result = fixer.run()
+
+    assert not fixer.full
+    assert calls == []
+    assert result.dirs == 7
+    # dir1 gained an entry and the root gained the state file since it was
+    # recorded, every other directory was skipped
+    assert result.skipped_dirs == 5
+    assert result.changed == 0
+
+
+def test_changed_owner_discards_state(tmp_path, monkeypatch):
+    calls = record_chown(monkeypatch)
+    root = str(tmp_path)
+    make_tree(root)
+    OwnershipFixer(root, getuid(), getgid(), workers=2).run()
+
+    state_path = join(root, STATE_NAME)
+    with open(state_path) as f:
+        state = json_load(f)
+    state["uid"] += 1
+    with open(state_path, "w") as f:
+        json_dump(state, f)
+    calls.clear()
+
+    fixer = OwnershipFixer(root, getuid(), getgid(), workers=2)
+    fixer.run()
+
+    assert fixer.full
+    assert len(calls) == 1
@@ -0,0 +1,74 @@
+from io import StringIO
+from json import loads
+from os import listdir
+
+import pytest
+
+import logquery
+from logsink import LogSink, COMPRESSED_SUFFIX, SEGMENT_SUFFIX
+from metrics import MetricsRegistry
+from test_logsink import BASE_TIME, write_blocks  # noqa: F401
+
+
+def run_main(monkeypatch, *args) -> list[dict]:
+    out = StringIO()
+    monkeypatch.setattr(logquery, "stdout", out)
+    monkeypatch.setattr("sys.argv", ["logquery.py", "--json", *args])
+    logquery.main()
+    return [loads(line) for line in out.getvalue().splitlines()]
+
+
+def chat_messages(records: list[dict]) -> list[int]:
+    return [int(record["line"].split("message ")[1].split()[0])
+            for record in records if "[CHAT]" in record["line"]]
+
+
+# Compressed segments followed by the live one the sink is still writing
+@pytest.fixture
+def log_dir(tmp_path, write_blocks):  # noqa: F811
+    sink = LogSink(str(tmp_path), MetricsRegistry(), segment_bytes=8192, keep=0)
+    sink.start()
+    write_blocks(sink, range(20))
+    # Wait for the rotated segments to be compressed
+    sink._compressor.submit(lambda: None).result()
+
+    names = listdir(tmp_path)
+    assert [name for name in names if name.endswith(COMPRESSED_SUFFIX)]
+    assert [name for name in names if name.endswith(SEGMENT_SUFFIX)]
+    yield str(tmp_path)
+    sink.close()
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_event_type_spans_all_segments(log_dir, monkeypatch, jobs):
+    records = run_main(monkeypatch, "--dir", log_dir, "--event", "chat", "--jobs", jobs)
+    assert chat_messages(records) == list(range(20))
+    assert len(records) == 20
+
+    records = run_main(monkeypatch, "--dir", log_dir, "--event", "PeerStateChange", "--jobs", jobs)
+    assert len(records) == 200
+
+
+def test_time_range(log_dir, monkeypatch):
+    records = run_main(monkeypatch, "--dir", log_dir,
+                       "--since", str(BASE_TIME + 5 * 60), "--until", str(BASE_TIME + 17 * 60))
+    assert chat_messages(records) == list(range(5, 18))
+    assert len(records) == 13 * 11
+    assert records[0]["time"] == BASE_TIME + 5 * 60
+
+    # ISO dates are UTC unless given
+    records = run_main(monkeypatch, "--dir", log_dir, "--event", "chat",
+                       "--since", "2023-11-14T22:14:20", "--until", "2023-11-14T22:15:20")
+    assert chat_messages(records) == [1, 2]
+
+
+def test_tick_range(log_dir, monkeypatch):
+    records = run_main(monkeypatch, "--dir", log_dir, "--tick-from", "1055", "--tick-to", "1172")
+    ticks = [int(record["line"].split("updateTick(")[1].split(")")[0])
+             for record in records if "updateTick" in record["line"]]
+    assert ticks == list(range(1055, 1173))
+    # Chat lines are placed at the last tick logged before them
+    assert chat_messages(records) == list(range(5, 17))
+
+    records = run_main(monkeypatch, "--dir", log_dir, "--event", "chat", "--tick-from", "1190")
+    assert chat_messages(records) == [19]
@@ -0,0 +1,83 @@
+from argparse import Namespace
+from json import loads
+from mmap import mmap, ACCESS_READ
+from os import listdir
+from os.path import join
+from zlib import decompressobj, MAX_WBITS
+
+import pytest
+
+import logsink
+from logquery import query_segment, select_segments
+from logsink import LogSink, COMPRESSED_SUFFIX, INDEX_SUFFIX, SEGMENT_SUFFIX, read_index
+from metrics import MetricsRegistry
+
+BASE_TIME = 1_700_000_000.0
+
+
+def make_block(i: int) -> list[str]:
+    lines = [f"{i:8.3f} Info ServerMultiplayerManager.cpp:944: updateTick({1000 + i * 10 + j}) "
+             f"received stateChanged peerID(2) oldState(Ready) newState(InGame)" for j in range(10)]
+    lines.append(f"2024-05-01 12:00:00 [CHAT] Player1: message {i} \"quoted\" é")
+    return lines
+
+
+def make_query(**kwargs) -> Namespace:
+    query = Namespace(since=None, until=None, tick_from=None, tick_to=None, event=None,
+                      player=None, source=None, grep=None, json=True)
+    for name, value in kwargs.items():
+        setattr(query, name, value)
+    return query
+
+
+def drain(sink: LogSink):
+    with sink._cond:
+        assert sink._cond.wait_for(lambda: not sink._queue and not sink._writing, 5)
+
+
+# Writes the blocks one batch at a time, one minute apart
+@pytest.fixture
+def write_blocks(monkeypatch):
+    clock = [BASE_TIME]
+    monkeypatch.setattr(logsink, "time", lambda: clock[0])
+    monkeypatch.setattr(logsink, "INDEX_INTERVAL", 1024)
+
+    def write_blocks(sink: LogSink, blocks: range):
+        for i in blocks:
+            clock[0] = BASE_TIME + i * 60
+            sink.write(memoryview("\n".join(make_block(i)).encode("utf-8") + b"\n"), "stdout")
+            drain(sink)
+    return write_blocks
+
+
+def test_round_trip_through_compressed_segments(tmp_path, write_blocks):
+    sink = LogSink(str(tmp_path), MetricsRegistry(), segment_bytes=8192, keep=0)
+    sink.start()
+    write_blocks(sink, range(20))
+    sink.write(memoryview(b"stderr line\n"), "stderr")
+    sink.close()
+
+    names = sorted(listdir(tmp_path))
+    assert not [name for name in names if name.endswith(SEGMENT_SUFFIX)]
+    segments = select_segments(str(tmp_path), make_query())
+    assert len(segments) > 2
+    assert names == sorted(f"{segment}{suffix}" for segment in segments
+                           for suffix in (COMPRESSED_SUFFIX, f"{COMPRESSED_SUFFIX}{INDEX_SUFFIX}"))
+
+    for segment in segments:
+        path = join(tmp_path, f"{segment}{COMPRESSED_SUFFIX}")
+        index = read_index(f"{path}{INDEX_SUFFIX}")
+        # The last segment only holds the stderr line
+        assert len(index) > 1 or segment == segments[-1]
+        with open(path, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            # Every index entry starts a gzip member with a whole record
+            for when, tick, offset in index:
+                record = decompressobj(MAX_WBITS | 16).decompress(data[offset:offset + 4096])
+                assert loads(record[:record.index(b"\n")])["time"] >= when
+
+    records = [loads(raw) for segment in segments
+               for raw in query_segment(str(tmp_path), segment, make_query())]
+    expected = [(BASE_TIME + i * 60, line) for i in range(20) for line in make_block(i)]
+    assert [(record["time"], record["line"]) for record in records[:-1]] == expected
+    assert records[-1]["line"] == "stderr line"
+    assert records[-1]["stream"] == "stderr"
@@ -0,0 +1,71 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from metrics import MetricsRegistry, MetricsServer
+
+
+def test_render():
+    registry = MetricsRegistry()
+    registry.counter("lines_total", "Lines read", ("stream",)).labels("stdout").inc(3)
+    registry.gauge("players", "Players online").set(2)
+    histogram = registry.histogram("save_seconds", "Save duration", (1, 5))
+    histogram.observe(0.5)
+    histogram.observe(3)
+    histogram.observe(10)
+
+    assert registry.render() == "\n".join([
+        "# HELP lines_total Lines read",
+        "# TYPE lines_total counter",
+        'lines_total{stream="stdout"} 3',
+        "# HELP players Players online",
+        "# TYPE players gauge",
+        "players 2",
+        "# HELP save_seconds Save duration",
+        "# TYPE save_seconds histogram",
+        'save_seconds_bucket{le="1"} 1',
+        'save_seconds_bucket{le="5"} 2',
+        'save_seconds_bucket{le="+Inf"} 3',
+        "save_seconds_sum 13.5",
+        "save_seconds_count 3",
+        "",
+    ])
+
+
+def test_labelled_gauges_read_their_own_callback():
+    registry = MetricsRegistry()
+    sizes = {"stdout": 0, "stderr": 12345}
+    for stream in sizes:
+        registry.gauge("buffer_bytes", "Bytes waiting", ("stream",)).labels(
+            stream, callback=lambda stream=stream: sizes[stream])
+
+    assert 'buffer_bytes{stream="stdout"} 0' in registry.render()
+    assert 'buffer_bytes{stream="stderr"} 12345' in registry.render()
+    with pytest.raises(ValueError):
+        registry.gauge("other_bytes", "Bytes", ("stream",), lambda: 0)
+
+
+def test_registering_again_returns_the_same_family():
+    registry = MetricsRegistry()
+    registry.counter("restarts_total", "Restarts").inc()
+    registry.counter("restarts_total", "Restarts").inc()
+    assert "restarts_total 2" in registry.render()
+
+
+def test_server_serves_metrics_on_localhost():
+    registry = MetricsRegistry()
+    registry.gauge("players", "Players online").set(4)
+    server = MetricsServer(registry, 0)
+    server.start()
+    try:
+        port = server.server.server_address[1]
+        assert server.server.server_address[0] == "127.0.0.1"
+        with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as res:
+            assert res.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert res.read().decode() == registry.render()
+        with pytest.raises(HTTPError) as e:
+            urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+        assert e.value.code == 404
+    finally:
+        server.stop()
@@ -0,0 +1,68 @@
+from os import getgid, getuid, stat, umask
+from os.path import join
+
+import pytest
+
+import staging
+from modcache import ModCache, ENTRY_SUFFIX, LOCK_SUFFIX
+
+SHA1 = "0123456789abcdef0123456789abcdef01234567"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Only hardlink or copy, as on filesystems without reflinks
+    def unsupported(src, dst, progress=None):
+        raise OSError(staging.UNSUPPORTED_ERRNOS[0], "unsupported")
+    monkeypatch.setitem(staging.STAGING_STRATEGIES, "reflink", unsupported)
+    monkeypatch.setitem(staging.STAGING_STRATEGIES, "copy_file_range", unsupported)
+
+    old_umask = umask(0o022)
+    try:
+        yield str(tmp_path / "cache"), tmp_path
+    finally:
+        umask(old_umask)
+
+
+def add_entry(cache: ModCache, tmp_path):
+    src = tmp_path / "mod.zip"
+    src.write_bytes(b"mod contents")
+    with cache.locked(SHA1):
+        cache.add(SHA1, str(src))
+
+
+def test_shared_modes_ignore_umask(cache):
+    cache_dir, tmp_path = cache
+    mod_cache = ModCache(cache_dir)
+    add_entry(mod_cache, tmp_path)
+
+    base = join(cache_dir, SHA1[:2], SHA1)
+    assert stat(cache_dir).st_mode & 0o777 == 0o777
+    assert stat(join(cache_dir, SHA1[:2])).st_mode & 0o777 == 0o777
+    assert stat(f"{base}{LOCK_SUFFIX}").st_mode & 0o777 == 0o666
+
+
+def test_same_owner_hardlinks(cache):
+    cache_dir, tmp_path = cache
+    mod_cache = ModCache(cache_dir, owner=(getuid(), getgid()))
+    add_entry(mod_cache, tmp_path)
+
+    dst = str(tmp_path / "installed.zip")
+    with mod_cache.locked(SHA1):
+        assert mod_cache.install(SHA1, dst) == "hardlink"
+    entry = join(cache_dir, SHA1[:2], f"{SHA1}{ENTRY_SUFFIX}")
+    assert stat(dst).st_ino == stat(entry).st_ino
+
+
+def test_other_owner_copies(cache):
+    cache_dir, tmp_path = cache
+    mod_cache = ModCache(cache_dir, owner=(getuid() + 1, getgid()))
+    add_entry(mod_cache, tmp_path)
+
+    dst = str(tmp_path / "installed.zip")
+    with mod_cache.locked(SHA1):
+        assert mod_cache.install(SHA1, dst) == "copy"
+    entry = join(cache_dir, SHA1[:2], f"{SHA1}{ENTRY_SUFFIX}")
+    assert stat(dst).st_ino != stat(entry).st_ino
+    with open(dst, "rb") as f:
+        assert f.read() == b"mod contents"
@@ -0,0 +1,99 @@
+from time import monotonic
+
+import pytest
+
+import outbox
+from conftest import read_tester_lines
+from handlers.base import ChatPlayer
+from handlers.players import PlayerRegistry
+from outbox import ConsoleOutbox, CONSOLE_LINES_BURST
+
+
+class RecordingConsole:
+    def __init__(self):
+        self.lines = []
+        self.times = []
+
+    def __call__(self, line: str):
+        self.lines.append(line)
+        self.times.append(monotonic())
+
+
+@pytest.fixture
+def console():
+    return RecordingConsole()
+
+
+def test_merges_per_recipient_up_to_the_line_limit(game, console):
+    box = ConsoleOutbox(console, game.metrics, max_line=44)
+    # Queued before the thread starts, so everything is merged at once
+    for message in ["one", "two", "three"]:
+        box.send(message, "alice")
+    box.send("hello  \n everyone")
+    box.send("four", "alice")
+    box.send("a much longer message", "alice")
+    box.send("and another long message", "alice")
+    box.send("   ")
+    box.start()
+
+    assert box.flush(5)
+    assert console.lines == [
+        "/whisper alice one | two | three",
+        "hello everyone",
+        "/whisper alice four | a much longer message",
+        "/whisper alice and another long message",
+    ]
+    assert all(len(line) <= 44 for line in console.lines)
+    assert "factorio_console_messages_total 7" in game.metrics.render()
+
+
+def test_lines_are_rate_limited(game, console, monkeypatch):
+    monkeypatch.setattr(outbox, "COALESCE_DELAY", 0)
+    box = ConsoleOutbox(console, game.metrics, lines_per_second=20)
+    extra = 6
+    # Alternating recipients are never merged
+    for i in range(CONSOLE_LINES_BURST + extra):
+        box.send(f"message {i}", "alice" if i % 2 else None)
+    box.start()
+
+    assert box.flush(5)
+    assert len(console.lines) == CONSOLE_LINES_BURST + extra
+    burst = console.times[CONSOLE_LINES_BURST - 1] - console.times[0]
+    limited = console.times[-1] - console.times[CONSOLE_LINES_BURST - 1]
+    assert burst < 0.1
+    assert limited >= (extra - 1) / 20
+
+
+def test_flush_waits_for_the_queue(game, console):
+    box = ConsoleOutbox(console, game.metrics)
+    box.send("queued")
+    assert not box.flush(0.05)
+
+    box.start()
+    assert box.flush(5)
+    assert console.lines == ["queued"]
+    # Nothing queued returns right away
+    assert box.flush(0)
+
+
+def test_private_messages_fall_back_to_broadcast(game, console):
+    game.players = PlayerRegistry(game)
+    game.register_event_handler(game.players)
+    game.outbox = ConsoleOutbox(console, game.metrics)
+    game.outbox.start()
+    player = ChatPlayer(game, "Player1")
+
+    lines = read_tester_lines()
+    join = next(i for i, line in enumerate(lines) if "[JOIN]" in line) + 1
+    leave = next(i for i, line in enumerate(lines) if "[LEAVE]" in line) + 1
+
+    game.feed(lines[:join])
+    player.send_message("whispered", private=True)
+    player.send_message("for everyone")
+    assert game.outbox.flush(5)
+
+    game.feed(lines[join:leave])
+    player.send_message("gone", private=True)
+    assert game.outbox.flush(5)
+
+    assert console.lines == ["/whisper Player1 whispered", "for everyone", "gone"]
@@ -0,0 +1,146 @@
+from os import close, pipe, read, sysconf
+from threading import Event, Thread
+from time import sleep
+
+import pytest
+
+from cli_handler import OutputBuffer, FLUSH_SIZE, LOG_QUEUE_POLICIES
+from metrics import MetricsRegistry
+
+
+# Holds the writer thread in the flush it does before every batch
+class GatedStream:
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self.entered = Event()
+        self.gate = Event()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def flush(self):
+        self.entered.set()
+        self.gate.wait(5)
+
+
+@pytest.fixture
+def stream(tmp_path):
+    stream = GatedStream(tmp_path / "out.log")
+    yield stream
+    stream.gate.set()
+
+
+def make_buffer(stream, policy, max_lines):
+    return OutputBuffer(stream, "stdout", MetricsRegistry(), max_bytes=0, max_lines=max_lines, policy=policy)
+
+
+def write(buffer, data: bytes):
+    buffer.write(memoryview(data))
+    buffer.flush()
+
+
+def hold_writer(buffer, stream):
+    write(buffer, b"first\n")
+    assert stream.entered.wait(5)
+
+
+def output(stream, buffer) -> bytes:
+    stream.gate.set()
+    buffer.drain()
+    with open(stream._file.name, "rb") as f:
+        return f.read()
+
+
+def test_drop_oldest(stream):
+    buffer = make_buffer(stream, "drop-oldest", 2)
+    hold_writer(buffer, stream)
+    for line in (b"a\n", b"b\n", b"c\n"):
+        write(buffer, line)
+
+    assert output(stream, buffer) == \
+        b"first\n[cli_handler] Output queue full, dropped 1 log lines\nb\nc\n"
+
+
+def test_drop_debug_keeps_other_lines(stream):
+    buffer = make_buffer(stream, "drop-debug", 2)
+    hold_writer(buffer, stream)
+    write(buffer, b"   1.000 Info a\n   1.100 Debug b\n")
+    write(buffer, b"   1.200 Info c\n")
+
+    assert output(stream, buffer) == (
+        b"first\n[cli_handler] Output queue full, dropped 1 log lines\n"
+        b"   1.000 Info a\n   1.200 Info c\n")
+
+
+def test_block_waits_for_room(stream):
+    buffer = make_buffer(stream, "block", 1)
+    hold_writer(buffer, stream)
+    write(buffer, b"a\n")
+    writer = Thread(target=write, args=(buffer, b"b\n"))
+    writer.start()
+    writer.join(0.1)
+    assert writer.is_alive()
+
+    assert output(stream, buffer) == b"first\na\nb\n"
+    writer.join(5)
+    assert not writer.is_alive()
+
+
+def test_messages_follow_lines_read_so_far(stream):
+    buffer = make_buffer(stream, "block", 0)
+    stream.gate.set()
+    buffer.write(memoryview(b"   1.000 Info line\n"))
+    message = Thread(target=buffer.write_message, args=("[cli_handler] message\n",))
+    message.start()
+    message.join(5)
+
+    assert output(stream, buffer) == b"   1.000 Info line\n[cli_handler] message\n"
+
+
+def test_block_lets_an_oversized_batch_through_an_idle_writer(stream):
+    buffer = make_buffer(stream, "block", 5)
+    stream.gate.set()
+    data = b"".join(f"line {i}\n".encode() for i in range(10))
+    flusher = Thread(target=write, args=(buffer, data), daemon=True)
+    flusher.start()
+    flusher.join(5)
+    assert not flusher.is_alive()
+
+    assert output(stream, buffer) == data
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+
+
+FLOOD_BYTES = 64 * 1024 * 1024
+FLOOD_LINE = b"   1.000 Info flood.cpp:1: " + b"x" * 36 + b"\n"
+
+
+# A terminal or log driver that reads slower than the server writes
+def drain_slowly(fd: int):
+    while read(fd, 65536):
+        sleep(0.0005)
+
+
+@pytest.mark.parametrize("policy", LOG_QUEUE_POLICIES)
+def test_flood_keeps_memory_flat(policy):
+    read_fd, write_fd = pipe()
+    reader = Thread(target=drain_slowly, args=(read_fd,))
+    reader.start()
+    with open(write_fd, "wb") as out:
+        buffer = OutputBuffer(out, "stdout", MetricsRegistry(),
+                              max_bytes=1024 * 1024, max_lines=0, policy=policy)
+        before = rss_bytes()
+        peak = before
+        for i in range(FLOOD_BYTES // FLUSH_SIZE):
+            # A new block every time, as the pump reads them
+            buffer.write(memoryview(FLOOD_LINE * (FLUSH_SIZE // len(FLOOD_LINE))))
+            if i % 16 == 0:
+                peak = max(peak, rss_bytes())
+        buffer.drain()
+    reader.join(10)
+    close(read_fd)
+
+    assert peak - before < 16 * 1024 * 1024
@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import read_tester_lines
+from handlers import players
+from handlers.events import PeerAddedEvent, PeerRemovedEvent
+from handlers.players import PlayerRegistry
+
+
+@pytest.fixture
+def registry(game):
+    registry = PlayerRegistry(game)
+    game.register_event_handler(registry)
+    return registry
+
+
+def lines_until(marker: str) -> tuple[list[str], list[str]]:
+    lines = read_tester_lines()
+    end = next(i for i, line in enumerate(lines) if marker in line) + 1
+    return lines[:end], lines[end:]
+
+
+def test_join_phases_from_tester(game, registry):
+    joined, rest = lines_until("[JOIN]")
+    game.feed(joined)
+
+    assert list(registry.online) == ["Player1"]
+    session = registry.online["Player1"]
+    assert session.peer_id == 2
+    assert session.map_size == 169444468
+    assert session.map_wait == pytest.approx(121.284 - 118.214)
+    assert session.map_download == pytest.approx(133.509 - 121.284)
+    assert session.map_loading == pytest.approx(140.643 - 133.509)
+    assert session.catch_up == pytest.approx(142.526 - 140.643)
+    assert session.join_time() == pytest.approx(142.526 - 118.214)
+    assert 'factorio_join_phase_seconds_count{phase="map_download"} 1' in game.metrics.render()
+
+    left, removed = lines_until("[LEAVE]")
+    game.feed(left[len(joined):])
+    # The session waits for its peer to be removed, which carries the uptime
+    assert registry.online == {}
+    assert registry.peers[2] is session
+    assert not registry.history
+
+    game.feed(removed)
+    assert registry.peers == {}
+    assert list(registry.history) == [session]
+    assert session.left_at == 1116.526
+
+
+def test_peers_and_history_are_bounded(game, monkeypatch):
+    monkeypatch.setattr(players, "MAX_PEERS", 8)
+    registry = PlayerRegistry(game, history_size=3)
+    game.register_event_handler(registry)
+
+    for peer_id in range(20):
+        registry.handle_peer_added(PeerAddedEvent(float(peer_id), str(peer_id)))
+    assert list(registry.peers) == list(range(12, 20))
+
+    for peer_id in range(12, 17):
+        registry.handle_peer_removed(PeerRemovedEvent(30.0, str(peer_id)))
+    assert [session.peer_id for session in registry.history] == [14, 15, 16]
+    assert list(registry.peers) == [17, 18, 19]
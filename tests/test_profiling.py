@@ -0,0 +1,68 @@
+from re import fullmatch
+from time import sleep
+
+from handlers.commands.stats import StatsCommand
+from handlers.events import ChatEvent, PlayerJoinEvent
+from profiling import HandlerProfiler
+
+
+class FakePlayer:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message: str, private: bool = False):
+        self.messages.append(message)
+
+
+def slow_chat(event: ChatEvent):
+    sleep(0.002)
+    if event.message == "boom":
+        raise ValueError(event.message)
+
+
+def fast_join(event: PlayerJoinEvent):
+    pass
+
+
+def run_stats(command: StatsCommand, *args: str) -> list[str]:
+    player = FakePlayer()
+    command.run(player, list(args))
+    return player.messages
+
+
+def test_stats_of_profiled_handlers(game):
+    profiler = HandlerProfiler(False)
+    game.events.profiler = profiler
+    game.events.subscribe(ChatEvent, slow_chat)
+    game.events.subscribe(PlayerJoinEvent, fast_join)
+    command = StatsCommand(profiler)
+    lines = [
+        "2024-05-01 12:00:00 [CHAT] Player1: hello",
+        "2024-05-01 12:00:01 [JOIN] Player2 joined the game",
+        "2024-05-01 12:00:02 [CHAT] Player2: boom",
+        "2024-05-01 12:00:03 [CHAT] Player2: bye",
+    ]
+
+    game.feed(lines)
+    assert run_stats(command) == ["No handler stats recorded (profiling is off, enable with !stats on)"]
+
+    assert run_stats(command, "on") == ["Handler profiling enabled"]
+    game.feed(lines)
+    messages = run_stats(command)
+    assert messages[0] == "Slowest handlers by total time:"
+    # Slowest first
+    assert [message.split(":")[0] for message in messages[1:]] == ["slow_chat", "fast_join"]
+    m = fullmatch(r"slow_chat: 3 calls, ([\d.]+)ms total, (\d+)us avg, ([\d.]+)ms max, 1 errors", messages[1])
+    assert m is not None
+    assert float(m.group(1)) >= 6 and int(m.group(2)) >= 2000 and float(m.group(3)) >= 2
+    assert fullmatch(r"fast_join: 1 calls, [\d.]+ms total, \d+us avg, [\d.]+ms max, 0 errors", messages[2])
+
+    assert run_stats(command, "off") == ["Handler profiling disabled"]
+    game.feed(lines)
+    assert run_stats(command)[1].startswith("slow_chat: 3 calls, ")
+
+    assert run_stats(command, "reset") == ["Handler stats reset"]
+    assert profiler.stats == {}
+    assert run_stats(command, "ON") == ["Handler profiling enabled"]
+    assert run_stats(command) == ["No handler stats recorded (profiling is on)"]
+    assert run_stats(command, "bogus") == ["Usage: !stats [on|off|reset|profile <seconds>]"]
@@ -0,0 +1,130 @@
+from socket import SHUT_RDWR
+from threading import Event
+
+import pytest
+
+from handlers.commands.players import PlayersCommand
+from handlers.players import PeerSession
+from rcon import FakeRconServer, RconClient, RconError
+
+PASSWORD = "secret"
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def make(handler):
+        server = FakeRconServer(PASSWORD, handler)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_pipelined_commands_are_matched_by_id(server_factory):
+    all_sent = Event()
+
+    def handler(body):
+        # Nothing is answered before every command was sent
+        all_sent.wait(5)
+        return f"reply to {body}"
+
+    server = server_factory(handler)
+    client = RconClient("127.0.0.1", server.port, PASSWORD, timeout=5)
+    futures = [(i, client.command_async(f"/cmd {i}")) for i in range(100)]
+    all_sent.set()
+
+    for i, future in futures:
+        assert future.result(5) == f"reply to /cmd {i}"
+    client.close()
+
+
+def test_reconnects_after_connection_loss(server_factory):
+    server = server_factory(lambda body: body.upper())
+    client = RconClient("127.0.0.1", server.port, PASSWORD, timeout=5)
+    assert client.command("/a") == "/A"
+
+    client._sock.shutdown(SHUT_RDWR)
+    # The reader notices the closed connection and fails nothing pending
+    for _ in range(50):
+        if client._sock is None:
+            break
+        Event().wait(0.01)
+    assert client.command("/b") == "/B"
+    client.close()
+
+
+def test_wrong_password_fails(server_factory):
+    server = server_factory(lambda body: body)
+    client = RconClient("127.0.0.1", server.port, "wrong", timeout=5)
+    with pytest.raises(RconError):
+        client.command("/a")
+
+
+class FakePlayer:
+    def __init__(self, rcon):
+        self.messages = []
+        self.game = self
+        self.rcon = rcon
+        self.players = self
+        self.online = {}
+
+    def send_message(self, message: str, private: bool = False):
+        self.messages.append(message)
+
+
+def test_players_asks_the_server(server_factory):
+    def handler(body):
+        assert body == "/players online"
+        return "Online players (2):\n  Alice (online)\n  Bob (online)\n"
+
+    server = server_factory(handler)
+    player = FakePlayer(RconClient("127.0.0.1", server.port, PASSWORD, timeout=5))
+    session = PeerSession(2, 1.0)
+    session.name = "Alice"
+    session.map_download = 2.5
+    player.online["Alice"] = session
+
+    PlayersCommand().run(player, [])
+
+    assert player.messages[0] == "2 player(s) online:"
+    assert player.messages[1].startswith("Alice joined in 2.5s")
+    assert player.messages[2] == "Bob (join not seen)"
+    player.rcon.close()
+
+
+def test_players_without_rcon_uses_the_log():
+    player = FakePlayer(None)
+    session = PeerSession(2, 1.0)
+    session.name = "Alice"
+    player.online["Alice"] = session
+
+    PlayersCommand().run(player, [])
+
+    assert player.messages[0] == "1 player(s) online:"
+    assert player.messages[1].startswith("Alice joined in 0.0s")
+
+
+def test_timed_out_command_is_forgotten(server_factory):
+    release = Event()
+
+    def handler(body):
+        if body == "/slow":
+            release.wait(5)
+        return body
+
+    server = server_factory(handler)
+    client = RconClient("127.0.0.1", server.port, PASSWORD, timeout=5)
+    with pytest.raises(RconError):
+        client.command("/slow", timeout=0.1)
+    assert client._pending == {}
+
+    # The late reply is dropped, the next command gets its own
+    release.set()
+    assert client.command("/fast") == "/fast"
+    client.close()
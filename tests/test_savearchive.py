@@ -0,0 +1,95 @@
+from os import utime
+from threading import Event
+from zipfile import ZipFile
+
+from handlers.backup import SaveBackupHandler
+from savearchive import SaveArchive
+from savegames import SaveGameIndex, savegame_info_from_file
+
+
+def make_save(path, seed: int, mtime: float):
+    with ZipFile(path, "w") as zf:
+        zf.writestr("save/level.dat0", bytes(range(256)) * 4096)
+        zf.writestr("save/level-init.dat", b"init " * 1000)
+        zf.writestr("save/script.dat", f"tick {seed}".encode() * 2000)
+    utime(path, (mtime, mtime))
+
+
+def test_round_trip_and_dedup(tmp_path):
+    saves = tmp_path / "saves"
+    saves.mkdir()
+    archive = SaveArchive(str(tmp_path / "archive"))
+
+    make_save(saves / "world.zip", 1, 1000)
+    first_id, _, first_new = archive.store(savegame_info_from_file("world.zip", str(saves)))
+    original = (saves / "world.zip").read_bytes()
+
+    make_save(saves / "world.zip", 2, 2000)
+    second_id, _, second_new = archive.store(savegame_info_from_file("world.zip", str(saves)))
+
+    assert first_id != second_id
+    # Only the changed member is stored again
+    assert second_new < first_new / 10
+
+    archive.restore(first_id, str(tmp_path / "restored.zip"))
+    assert (tmp_path / "restored.zip").read_bytes() == original
+    assert [entry[0] for entry in archive.list("world")] == [second_id, first_id]
+
+
+def test_finished_saves_are_archived(tmp_path, game):
+    saves = tmp_path / "saves"
+    saves.mkdir()
+    archive = SaveArchive(str(tmp_path / "archive"))
+    handler = SaveBackupHandler(game, SaveGameIndex(str(saves)), None, archive)
+    game.register_event_handler(handler)
+
+    for seed in range(3):
+        make_save(saves / "_autosave1.zip", seed, 1000 + seed * 600)
+        game.feed([
+            f" {100 + seed}.000 Info AppManagerStates.cpp:1843: Saving to _autosave1 (non-blocking).",
+            f" {101 + seed}.000 Info AppManagerStates.cpp:1864: Saving finished",
+        ])
+        handler._snapshots.submit(lambda: None).result()
+
+    handler._snapshots.shutdown(wait=True)
+    assert len(archive.list("_autosave1")) == 3
+    assert not (saves / ".backup-_autosave1.zip").exists()
+
+
+def test_save_finished_during_backup_is_backed_up_again(tmp_path, game):
+    saves = tmp_path / "saves"
+    saves.mkdir()
+    archive = SaveArchive(str(tmp_path / "archive"))
+    handler = SaveBackupHandler(game, SaveGameIndex(str(saves)), None, archive)
+    game.register_event_handler(handler)
+
+    started = Event()
+    release = Event()
+    store = archive.store
+
+    def slow_store(savegame):
+        started.set()
+        release.wait(5)
+        return store(savegame)
+    archive.store = slow_store
+
+    def save(seed: int):
+        make_save(saves / "world.zip", seed, 1000 + seed * 600)
+        game.feed([
+            " 100.000 Info AppManagerStates.cpp:1843: Saving to world (non-blocking).",
+            " 101.000 Info AppManagerStates.cpp:1864: Saving finished",
+        ])
+
+    save(0)
+    assert started.wait(5)
+    # Both finish while the first backup is still running, one more backup covers them
+    save(1)
+    save(2)
+    release.set()
+
+    handler._snapshots.submit(lambda: None).result()
+    handler._snapshots.submit(lambda: None).result()
+    handler._snapshots.shutdown(wait=True)
+    archived = archive.list("world")
+    assert len(archived) == 2
+    assert archived[0][1] == 1000 + 2 * 600
@@ -0,0 +1,60 @@
+from io import StringIO
+from json import load
+from os import utime
+from zipfile import ZipFile
+
+import savecheck
+from savecheck import SaveVerifier, VERIFY_CACHE_NAME, CORRUPT_SUFFIX
+
+
+def run_main(monkeypatch, *args) -> str:
+    out = StringIO()
+    monkeypatch.setattr(savecheck, "stdout", out)
+    monkeypatch.setattr(savecheck, "argv", ["savecheck.py", *args])
+    savecheck.main()
+    return out.getvalue()
+
+
+def make_save(path, mtime: float, corrupt: bool = False):
+    with ZipFile(path, "w") as zf:
+        zf.writestr("save/level.dat0", b"level data " * 10000)
+        zf.writestr("save/control.lua", b"-- control")
+    if corrupt:
+        data = path.read_bytes()
+        path.write_bytes(data[:len(data) // 2])
+    utime(path, (mtime, mtime))
+
+
+def test_startup_stops_at_newest_valid(tmp_path, monkeypatch):
+    make_save(tmp_path / "old.zip", 1000)
+    make_save(tmp_path / "older.zip", 900, corrupt=True)
+    make_save(tmp_path / "good.zip", 2000)
+    make_save(tmp_path / "crashed.zip", 3000, corrupt=True)
+
+    out = run_main(monkeypatch, "--quarantine", str(tmp_path))
+    assert "Corrupt savegame crashed.zip" in out
+    assert "newest valid: good.zip" in out
+    assert (tmp_path / f"crashed.zip{CORRUPT_SUFFIX}").exists()
+    # Older saves are not read at startup
+    assert (tmp_path / "older.zip").exists()
+    with open(tmp_path / VERIFY_CACHE_NAME) as f:
+        assert set(load(f)) == {"good.zip", "crashed.zip"}
+
+
+def test_nothing_valid_keeps_everything(tmp_path, monkeypatch):
+    make_save(tmp_path / "a.zip", 1000, corrupt=True)
+    make_save(tmp_path / "b.zip", 2000, corrupt=True)
+
+    out = run_main(monkeypatch, "--quarantine", str(tmp_path))
+    assert "newest valid: None" in out
+    assert (tmp_path / "a.zip").exists() and (tmp_path / "b.zip").exists()
+
+
+def test_verifier_cache_is_reused(tmp_path, monkeypatch):
+    make_save(tmp_path / "good.zip", 2000)
+    assert SaveVerifier(str(tmp_path)).verify_one("good.zip") is None
+
+    def fail(path):
+        raise AssertionError("verified again")
+    monkeypatch.setattr(savecheck, "verify_save", fail)
+    assert SaveVerifier(str(tmp_path)).verify_one("good.zip") is None
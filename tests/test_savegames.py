@@ -0,0 +1,123 @@
+from io import StringIO
+from os import rename, unlink, utime
+from time import monotonic, sleep
+
+import pytest
+
+import savegames
+from handlers.commands.saves import ListSavesCommand, SAVES_PER_PAGE
+from savegames import SaveGameIndex
+
+
+class FakePlayer:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message: str, private: bool = False):
+        self.messages.append(message)
+
+
+def make_save(path, mtime: float):
+    path.write_bytes(b"save")
+    utime(path, (mtime, mtime))
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            pytest.fail("Timed out waiting for the index")
+        sleep(0.01)
+
+
+def names(index: SaveGameIndex) -> list[str]:
+    return [info.name for info in index.list()]
+
+
+def test_refresh_keeps_newest_first(tmp_path):
+    for i, name in enumerate(["b.zip", "a.zip", "c.zip"]):
+        make_save(tmp_path / name, 1000 + i)
+    make_save(tmp_path / ".hidden.zip", 5000)
+    index = SaveGameIndex(str(tmp_path))
+    index.rescan()
+    assert names(index) == ["c.zip", "a.zip", "b.zip"]
+
+    # Saves with the same mtime are ordered by name
+    make_save(tmp_path / "aa.zip", 1001)
+    index.refresh("aa.zip")
+    assert names(index) == ["c.zip", "a.zip", "aa.zip", "b.zip"]
+
+    make_save(tmp_path / "b.zip", 2000)
+    index.refresh("b.zip")
+    assert names(index) == ["b.zip", "c.zip", "a.zip", "aa.zip"]
+    assert index.newest().name == "b.zip"
+
+    unlink(tmp_path / "c.zip")
+    index.refresh("c.zip")
+    index.refresh(".hidden.zip")
+    assert names(index) == ["b.zip", "a.zip", "aa.zip"]
+    assert index.get("a").name == "a.zip"
+    assert index.get("c") is None
+
+
+def test_inotify_events_update_the_index(tmp_path):
+    make_save(tmp_path / "old.zip", 1000)
+    index = SaveGameIndex(str(tmp_path), rescan_interval=3600)
+    index.start()
+    assert names(index) == ["old.zip"]
+
+    make_save(tmp_path / "new.zip", 2000)
+    wait_until(lambda: names(index) == ["new.zip", "old.zip"])
+
+    rename(tmp_path / "old.zip", tmp_path / "renamed.zip")
+    wait_until(lambda: names(index) == ["new.zip", "renamed.zip"])
+
+    unlink(tmp_path / "new.zip")
+    wait_until(lambda: names(index) == ["renamed.zip"])
+
+
+def test_rescans_without_inotify(tmp_path, monkeypatch):
+    def no_inotify():
+        raise OSError(38, "Function not implemented")
+    err = StringIO()
+    monkeypatch.setattr(savegames, "Inotify", no_inotify)
+    monkeypatch.setattr(savegames, "stderr", err)
+
+    make_save(tmp_path / "old.zip", 1000)
+    index = SaveGameIndex(str(tmp_path), rescan_interval=0.05)
+    index.start()
+    assert "inotify unavailable" in err.getvalue()
+    assert names(index) == ["old.zip"]
+
+    make_save(tmp_path / "new.zip", 2000)
+    wait_until(lambda: names(index) == ["new.zip", "old.zip"])
+
+
+def test_savelist_pages_and_filters(tmp_path):
+    for i in range(25):
+        make_save(tmp_path / f"_autosave{i}.zip", 1000 + i)
+    make_save(tmp_path / "rocket.zip", 500)
+    index = SaveGameIndex(str(tmp_path))
+    index.rescan()
+    command = ListSavesCommand(index)
+
+    player = FakePlayer()
+    command.run(player, [])
+    assert player.messages[0] == f"Savegames 1-{SAVES_PER_PAGE} of 26 (page 1/3)"
+    assert player.messages[1].startswith("_autosave24.zip @ ")
+    assert len(player.messages) == SAVES_PER_PAGE + 1
+
+    # Pages past the end show the last one
+    player = FakePlayer()
+    command.run(player, ["99"])
+    assert player.messages[0] == "Savegames 21-26 of 26 (page 3/3)"
+    assert player.messages[-1].startswith("rocket.zip @ ")
+
+    player = FakePlayer()
+    command.run(player, ["AUTOSAVE1", "2"])
+    assert player.messages[0] == "Savegames 11-11 of 11 (page 2/2)"
+    assert player.messages[1].startswith("_autosave1.zip @ ")
+
+    player = FakePlayer()
+    command.run(player, ["missing"])
+    assert player.messages == ["No savegames found"]
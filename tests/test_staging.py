@@ -0,0 +1,77 @@
+from errno import EOPNOTSUPP, EIO
+from os import stat, utime
+
+import pytest
+
+import staging
+from staging import stage_file
+from handlers.commands.saves import LoadSaveCommand
+from savegames import SaveGameIndex
+
+
+def unsupported(src, dst, progress=None):
+    open(dst, "wb").close()
+    raise OSError(EOPNOTSUPP, "not here")
+
+
+def test_falls_back_and_cleans_up(tmp_path, monkeypatch):
+    src = tmp_path / "src.zip"
+    src.write_bytes(b"save data" * 100000)
+    monkeypatch.setitem(staging.STAGING_STRATEGIES, "reflink", unsupported)
+
+    assert stage_file(str(src), str(tmp_path / "dst.zip"), strategies=["reflink", "copy"]) == "copy"
+    assert (tmp_path / "dst.zip").read_bytes() == src.read_bytes()
+
+
+def test_real_errors_are_raised(tmp_path, monkeypatch):
+    def broken(src, dst, progress=None):
+        raise OSError(EIO, "disk on fire")
+    monkeypatch.setitem(staging.STAGING_STRATEGIES, "reflink", broken)
+    (tmp_path / "src.zip").write_bytes(b"x")
+
+    with pytest.raises(OSError):
+        stage_file(str(tmp_path / "src.zip"), str(tmp_path / "dst.zip"), strategies=["reflink", "copy"])
+
+
+def test_copy_reports_progress(tmp_path):
+    src = tmp_path / "src.zip"
+    src.write_bytes(b"x" * (3 * staging.BUFFER_SIZE + 5))
+    progress = []
+    stage_file(str(src), str(tmp_path / "dst.zip"), lambda copied, total: progress.append((copied, total)),
+               ["copy"])
+    assert progress[-1] == (src.stat().st_size, src.stat().st_size)
+    assert len(progress) == 4
+
+
+class FakePlayer:
+    def __init__(self):
+        self.messages = []
+        self.game = self
+
+    def send_message(self, message: str, private: bool = False):
+        self.messages.append(message)
+
+    def restart(self, before_start):
+        before_start()
+
+
+def test_saveload_leaves_original_mtime_alone(tmp_path, monkeypatch):
+    # Where neither is available, the save must still not be hardlinked
+    monkeypatch.setitem(staging.STAGING_STRATEGIES, "reflink", unsupported)
+    monkeypatch.setitem(staging.STAGING_STRATEGIES, "copy_file_range", unsupported)
+    (tmp_path / "old.zip").write_bytes(b"old save")
+    (tmp_path / "newer.zip").write_bytes(b"newer save")
+    utime(tmp_path / "old.zip", (1000, 1000))
+    utime(tmp_path / "newer.zip", (2000, 2000))
+    index = SaveGameIndex(str(tmp_path))
+    index.rescan()
+
+    player = FakePlayer()
+    LoadSaveCommand(index).run(player, ["old.zip"])
+
+    assert stat(tmp_path / "old.zip").st_mtime == 1000
+    staged = [path for path in tmp_path.iterdir() if path.name.startswith("saveload_")]
+    assert len(staged) == 1
+    assert staged[0].read_bytes() == b"old save"
+    assert stat(staged[0]).st_ino != stat(tmp_path / "old.zip").st_ino
+    assert stat(staged[0]).st_mtime > 2000
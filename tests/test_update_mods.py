@@ -0,0 +1,354 @@
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps as json_dumps
+from os.path import dirname, join
+from threading import Lock, Thread
+from time import time
+from urllib.parse import urlsplit
+
+import pytest
+
+import update_mods
+from update_mods import FactorioMod, ModInfoCache, fetch_latest_releases
+
+DATA_DIR = join(dirname(__file__), "data")
+
+
+class FakeResponse:
+    def __init__(self, text: str, status_code: int = 200, headers: dict | None = None):
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakePortalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def send_body(self, status: int, body: bytes, headers: dict | None = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        portal = self.server
+        path = urlsplit(self.path).path
+        with portal.lock:
+            portal.requests.append((path, self.headers.get("Range")))
+            throttled = portal.throttle.get(path, 0)
+            if throttled:
+                portal.throttle[path] = throttled - 1
+            cut = portal.cut.pop(path, None)
+
+        if throttled:
+            self.send_body(429, b"", {"Retry-After": "0"})
+        elif path.startswith("/api/mods/") and path.endswith("/full"):
+            mod = portal.mods.get(path[len("/api/mods/"):-len("/full")])
+            if mod is None:
+                self.send_body(404, b"")
+                return
+            body = json_dumps(mod).encode()
+            etag = f'"{sha1(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                with portal.lock:
+                    portal.not_modified += 1
+                self.send_body(304, b"", {"ETag": etag})
+            else:
+                self.send_body(200, body, {"ETag": etag})
+        elif path in portal.files:
+            self.send_file(portal.files[path], cut)
+        else:
+            self.send_body(404, b"")
+
+    def send_file(self, data: bytes, cut: int | None):
+        start = 0
+        status = 200
+        headers = {}
+        requested = self.headers.get("Range")
+        if requested is not None and self.server.ranges:
+            start = int(requested[len("bytes="):].split("-")[0])
+            if start >= len(data):
+                self.send_body(416, b"", {"Content-Range": f"bytes */{len(data)}"})
+                return
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+
+        if cut is None:
+            self.send_body(status, data[start:], headers)
+            return
+
+        # Promise the whole file, then drop the connection part way
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:start + cut])
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves mod info and downloads, and fails the way the mod portal can
+class FakePortal(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakePortalHandler)
+        self.lock = Lock()
+        self.mods = {}
+        self.files = {}
+        self.requests = []
+        self.connections = 0
+        # Mod info requests answered with 304 Not Modified
+        self.not_modified = 0
+        # Path => number of 429 responses before it is served
+        self.throttle = {}
+        # Path => bytes sent before the connection is dropped, once
+        self.cut = {}
+        self.ranges = True
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_mod(self, name: str, version: str, data: bytes):
+        download_url = f"/download/{name}/{version}"
+        self.files[download_url] = data
+        self.mods[name] = {"name": name, "releases": [{
+            "download_url": download_url,
+            "file_name": f"{name}_{version}.zip",
+            "info_json": {"factorio_version": "2.0"},
+            "released_at": "2024-10-30T12:41:02.113000Z",
+            "sha1": sha1(data).hexdigest(),
+            "version": version,
+        }]}
+
+
+@pytest.fixture
+def portal(monkeypatch):
+    portal = FakePortal()
+    Thread(target=portal.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    monkeypatch.setattr(update_mods, "MOD_BASE_URL", portal.url)
+    monkeypatch.setattr(update_mods, "RETRY_DELAY", 0)
+    monkeypatch.setattr(update_mods, "USERNAME", "user")
+    monkeypatch.setattr(update_mods, "TOKEN", "token")
+    yield portal
+    portal.shutdown()
+    portal.server_close()
+
+
+@pytest.fixture
+def mod_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(update_mods, "MOD_DIR", str(tmp_path))
+    monkeypatch.setattr(update_mods, "CACHE", ModInfoCache(str(tmp_path)))
+    return tmp_path
+
+
+# One installed mod, which the fake portal has no newer release of
+@pytest.fixture
+def installed_mod(mod_dir, portal, monkeypatch):
+    data = b"installed mod"
+    portal.add_mod("some-mod", "1.0.0", data)
+    (mod_dir / "some-mod_1.0.0.zip").write_bytes(data)
+    (mod_dir / "mod-list.json").write_text(json_dumps({"mods": [
+        {"name": "base", "enabled": True},
+        {"name": "some-mod", "enabled": True},
+    ]}))
+    # Restored after the test, main() sets them
+    monkeypatch.setattr(update_mods, "FACTORIO_VERSION", None)
+    monkeypatch.setattr(update_mods, "MOD_CACHE", None)
+    monkeypatch.setattr(update_mods, "MOD_CACHE_DIR", None)
+    return mod_dir
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(update_mods, "argv", ["update_mods.py", *args])
+    update_mods.main()
+
+
+def run_update(monkeypatch, mod_dir, now: float | None = None):
+    if now is not None:
+        monkeypatch.setattr(update_mods, "time", lambda: now)
+    run_main(monkeypatch, "2.0.10", str(mod_dir), "user", "token")
+
+
+def request_paths(portal) -> list[str]:
+    return [path for path, _ in portal.requests]
+
+
+def test_bulk_query_with_releases(mod_dir, monkeypatch):
+    with open(join(DATA_DIR, "mod_list_namelist.json")) as f:
+        recorded = f.read()
+    urls = []
+
+    def http_get(url, **kwargs):
+        urls.append(url)
+        return FakeResponse(recorded)
+
+    monkeypatch.setattr(update_mods, "http_get", http_get)
+    mods = [FactorioMod(name) for name in ("even-distribution", "flib", "abandoned-mod")]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fetch_latest_releases(mods, executor)
+
+    assert len(urls) == 1
+    assert "namelist=even-distribution%2Cflib%2Cabandoned-mod" in urls[0]
+    assert mods[0].latest_release.version == "2.0.2"
+    assert mods[1].latest_release.version == "0.15.0"
+    assert mods[2].latest_release is None
+
+    (mod_dir / "even-distribution_2.0.2.zip").touch()
+    assert mods[0].is_latest_installed(update_mods.FactorioVersion("2.0.10"))
+    assert not mods[1].is_latest_installed(update_mods.FactorioVersion("2.0.10"))
+
+
+def test_fetches_share_pooled_connections(mod_dir, portal):
+    mods = [FactorioMod(f"mod-{i}") for i in range(40)]
+    for mod in mods:
+        portal.add_mod(mod.name, "1.0.0", mod.name.encode())
+    portal.throttle["/api/mods/mod-7/full"] = 2
+
+    with ThreadPoolExecutor(max_workers=update_mods.FETCH_WORKERS) as executor:
+        for future in [executor.submit(mod.fetch_info) for mod in mods]:
+            future.result()
+
+    assert [mod.releases[0].version for mod in mods] == ["1.0.0"] * len(mods)
+    # Throttled twice with Retry-After, then served
+    assert [path for path, _ in portal.requests].count("/api/mods/mod-7/full") == 3
+    assert len(portal.requests) == len(mods) + 2
+    assert portal.connections <= update_mods.POOL_SIZE
+
+
+def download_setup(mod_dir, portal, size: int = 300 * 1024):
+    data = bytes(i % 251 for i in range(size))
+    portal.add_mod("big-mod", "1.0.0", data)
+    mod = FactorioMod("big-mod")
+    mod.fetch_info()
+    portal.requests.clear()
+    release = mod.releases[0]
+    return mod, release, data, mod_dir / f"{release.file_name}.tmp"
+
+
+def test_interrupted_download_resumes(mod_dir, portal):
+    mod, release, data, tmp = download_setup(mod_dir, portal)
+    portal.cut[release.url] = 100 * 1024
+
+    mod.download_release(release)
+
+    assert tmp.read_bytes() == data
+    assert portal.requests[0] == (release.url, None)
+    assert portal.requests[1][1].startswith("bytes=") and portal.requests[1][1] != "bytes=0-"
+    mod.install_release(release)
+    assert (mod_dir / release.file_name).read_bytes() == data
+
+
+def test_complete_tmp_is_not_fetched_again(mod_dir, portal):
+    mod, release, data, tmp = download_setup(mod_dir, portal)
+    tmp.write_bytes(data)
+
+    mod.download_release(release)
+
+    assert tmp.read_bytes() == data
+    assert portal.requests == [(release.url, f"bytes={len(data)}-")]
+
+
+def test_corrupt_partial_download_starts_over(mod_dir, portal):
+    mod, release, data, tmp = download_setup(mod_dir, portal)
+    tmp.write_bytes(b"not the start of the mod")
+
+    mod.download_release(release)
+
+    assert tmp.read_bytes() == data
+    assert portal.requests == [(release.url, "bytes=24-"), (release.url, None)]
+
+
+def test_server_without_ranges_sends_everything(mod_dir, portal):
+    mod, release, data, tmp = download_setup(mod_dir, portal)
+    portal.ranges = False
+    tmp.write_bytes(data[:1000])
+
+    mod.download_release(release)
+
+    assert tmp.read_bytes() == data
+    assert len(portal.requests) == 1
+
+
+def test_wrong_download_is_not_kept(mod_dir, portal):
+    mod, release, data, tmp = download_setup(mod_dir, portal)
+    portal.files[release.url] = b"something else"
+
+    with pytest.raises(ValueError):
+        mod.download_release(release)
+    assert not tmp.exists()
+
+
+# The fake portal has no bulk query, so stale mods are fetched one by one
+def test_fresh_cache_entries_make_no_requests(installed_mod, portal, monkeypatch):
+    run_update(monkeypatch, installed_mod)
+    assert request_paths(portal) == ["/api/mods", "/api/mods/some-mod/full"]
+    assert (installed_mod / update_mods.CACHE_NAME).exists()
+
+    portal.requests.clear()
+    run_update(monkeypatch, installed_mod)
+    assert portal.requests == []
+
+
+def test_stale_cache_entries_are_revalidated(installed_mod, portal, monkeypatch):
+    start = time()
+    run_update(monkeypatch, installed_mod, start)
+
+    portal.requests.clear()
+    later = start + update_mods.CACHE_TTL + 1
+    run_update(monkeypatch, installed_mod, later)
+    assert request_paths(portal) == ["/api/mods", "/api/mods/some-mod/full"]
+    assert portal.not_modified == 1
+    cache = ModInfoCache(str(installed_mod))
+    cache.load()
+    assert cache.entries["some-mod"]["checked_at"] == later
+
+    # A changed ETag brings in the new release
+    data = b"updated mod"
+    portal.add_mod("some-mod", "1.1.0", data)
+    run_update(monkeypatch, installed_mod, later + update_mods.CACHE_TTL + 1)
+    assert portal.not_modified == 1
+    assert (installed_mod / "some-mod_1.1.0.zip").read_bytes() == data
+    assert not (installed_mod / "some-mod_1.0.0.zip").exists()
+
+
+def test_clear_cache(installed_mod, portal, monkeypatch):
+    run_update(monkeypatch, installed_mod)
+    run_main(monkeypatch, "--clear-cache", str(installed_mod))
+    assert not (installed_mod / update_mods.CACHE_NAME).exists()
+
+    portal.requests.clear()
+    run_update(monkeypatch, installed_mod)
+    assert request_paths(portal) == ["/api/mods", "/api/mods/some-mod/full"]
+    assert portal.not_modified == 0
+
+
+def test_failed_download_exits_without_installing(installed_mod, portal, monkeypatch):
+    portal.add_mod("some-mod", "1.1.0", b"updated mod")
+    portal.files["/download/some-mod/1.1.0"] = b"something else"
+
+    with pytest.raises(SystemExit) as exc_info:
+        run_update(monkeypatch, installed_mod)
+    assert exc_info.value.code == 1
+    assert (installed_mod / "some-mod_1.0.0.zip").exists()
+    assert not (installed_mod / "some-mod_1.1.0.zip").exists()
@@ -0,0 +1,58 @@
+from handlers.ups import UPSMonitor
+
+
+def state_line(uptime: float, tick: int, old: str, new: str) -> str:
+    return (f" {uptime:.3f} Info ServerMultiplayerManager.cpp:795: "
+            f"updateTick({tick}) changing state from({old}) to({new})")
+
+
+def peer_line(uptime: float, tick: int, old: str, new: str) -> str:
+    return (f" {uptime:.3f} Info ServerMultiplayerManager.cpp:944: "
+            f"updateTick({tick}) received stateChanged peerID(2) oldState({old}) newState({new})")
+
+
+def map_served_line(uptime: float, tick: int) -> str:
+    return (f" {uptime:.3f} Info ServerMultiplayerManager.cpp:1005: UpdateTick({tick}) "
+            f"Serving map(/factorio/temp/mp-save-1.zip) for peer(2) size(169444468) auxiliary(317) crc(3774189260)")
+
+
+def test_steady_ups(game):
+    monitor = UPSMonitor(game)
+    game.register_event_handler(monitor)
+    game.feed([
+        peer_line(100.0, 6000, "Ready", "ConnectedWaitingForMap"),
+        peer_line(102.0, 6120, "ConnectedWaitingForMap", "ConnectedDownloadingMap"),
+        peer_line(104.0, 6210, "ConnectedDownloadingMap", "ConnectedLoadingMap"),
+    ])
+    assert monitor.readings.values() == [60.0, 45.0]
+    assert monitor.is_low
+    assert game.stderr == ["UPS dropped to 45.0 (below 59)\n"]
+
+
+def test_join_during_save(game):
+    monitor = UPSMonitor(game)
+    game.register_event_handler(monitor)
+    game.feed([
+        peer_line(100.0, 6000, "Ready", "ConnectedWaitingForMap"),
+        state_line(110.0, 6600, "InGame", "InGameSavingMap"),
+        # A player joining is what triggers the save, its lines arrive mid-save
+        peer_line(110.1, 6600, "Ready", "ConnectedWaitingForMap"),
+        map_served_line(113.0, 6600),
+        state_line(113.0, 6600, "InGameSavingMap", "InGame"),
+        peer_line(113.1, 6606, "ConnectedWaitingForMap", "ConnectedDownloadingMap"),
+        peer_line(115.0, 6720, "ConnectedDownloadingMap", "ConnectedLoadingMap"),
+    ])
+    assert monitor.readings.values() == [60.0, 60.0]
+    assert not monitor.is_low
+    assert game.stderr == []
+
+
+def test_long_save_counts_as_stall(game):
+    monitor = UPSMonitor(game)
+    game.register_event_handler(monitor)
+    game.feed([
+        state_line(110.0, 6600, "InGame", "InGameSavingMap"),
+        state_line(117.5, 6600, "InGameSavingMap", "InGame"),
+    ])
+    assert game.stderr == ["Server stalled for 7.5s while saving the map\n"]
+    assert monitor.readings.values() == []